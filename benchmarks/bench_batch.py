@@ -0,0 +1,47 @@
+"""
+    Compare aggregate throughput (instances * instructions / s) of the
+    NumPy lockstep engine against scalar CPUs running the same program.
+    Usage: python benchmarks/bench_batch.py [n_instances]
+"""
+import sys
+sys.path.append(".")
+import time
+import logging
+from pyRISCV import CPU
+from pyRISCV.batch import BatchCPU
+
+logging.disable(logging.CRITICAL)
+
+PROGRAM = b"".join(word.to_bytes(4, byteorder='little') for word in [
+    0x00000593,  # li a1, 0
+    0x3e800293,  # li t0, 1000
+    0x00a585b3,  # loop: add a1, a1, a0
+    0x00a5c633,  # xor a2, a1, a0
+    0x00350513,  # addi a0, a0, 3
+    0xfff28293,  # addi t0, t0, -1
+    0xfe0298e3,  # bnez t0, loop
+    0x00000000,  # end of program
+])
+
+def bench_scalar(n):
+    start = time.time()
+    instructions = 0
+    for i in range(n):
+        cpu = CPU(PROGRAM)
+        cpu.regs[10] = i
+        instructions += cpu.run()
+    return instructions / (time.time() - start)
+
+def bench_batch(n):
+    start = time.time()
+    batch = BatchCPU(PROGRAM, n, mem_size=0x1000)
+    batch.regs[:, 10] = range(n)
+    batch.run()
+    return batch.instructions / (time.time() - start)
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    scalar = bench_scalar(4)
+    batch = bench_batch(n)
+    print(f"scalar CPU:            {scalar:12.0f} instructions/s")
+    print(f"batch ({n} instances): {batch:12.0f} instance-instructions/s ({batch / scalar:.1f}x)")
@@ -0,0 +1,42 @@
+"""
+    Trap-storm benchmark: every loop iteration traps into a machine-mode
+    handler that skips the trapping instruction and returns with mret.
+    Reports traps per second for ecalls and for load access faults.
+    Usage: python benchmarks/bench_traps.py
+"""
+import sys
+sys.path.append(".")
+import time
+import logging
+from pyRISCV import CPU
+
+logging.disable(logging.CRITICAL)
+
+N_TRAPS = 5 << 12  # lui t1, 5
+
+def program(trapping_inst):
+    return b"".join(word.to_bytes(4, byteorder='little') for word in [
+        0x00000297,  # auipc t0, 0
+        0x02028293,  # addi t0, t0, 32
+        0x30529073,  # csrw mtvec, t0
+        0x00005337,  # lui t1, 5
+        trapping_inst,  # loop: trapping instruction
+        0xfff30313,  # addi t1, t1, -1
+        0xfe031ce3,  # bnez t1, loop
+        0x00000000,  # end of program
+        0x341023f3,  # handler: csrr t2, mepc
+        0x00438393,  # addi t2, t2, 4
+        0x34139073,  # csrw mepc, t2
+        0x30200073,  # mret
+    ])
+
+def bench(name, trapping_inst):
+    cpu = CPU(program(trapping_inst))
+    start = time.time()
+    instructions = cpu.run()
+    elapsed = time.time() - start
+    print(f"{name}: {N_TRAPS / elapsed:.0f} traps/s, {instructions / elapsed:.0f} instructions/s")
+
+if __name__ == '__main__':
+    bench("ecall", 0x00000073)  # ecall
+    bench("load fault", 0x00002e03)  # lw t3, 0(zero)
@@ -1,6 +1,20 @@
+import os
+import sys
+import subprocess
 import argparse
 import logging
-from pyRISCV import SDB
+from pyRISCV import CPU, SDB, SMP, MachineConfig
+from pyRISCV.config import ENGINES
+from pyRISCV.syscall import SyscallProxy
+from pyRISCV.elf import ELF, is_elf
+from pyRISCV.libc import intercept_libc
+from pyRISCV.cache import Cache, CacheHierarchy
+from pyRISCV.branch import BranchProfiler
+from pyRISCV.timing import TimingModel
+from pyRISCV.replay import Recorder, Replayer
+from pyRISCV.cosim import CoSimulator, Divergence, open_log
+from pyRISCV.coverage import Coverage
+from pyRISCV.params import DRAM_SIZE, L2_SIZE, L2_ASSOC, CHECKPOINT_INTERVAL, CHECKPOINT_BUDGET
 
 argparser = argparse.ArgumentParser(description='RISC-V Simulator')
 argparser.add_argument('program', type=str, help='Path to the program to be executed')
@@ -8,11 +22,104 @@ argparser.add_argument('-v', '--verbose', action='store_true', help='Enable verb
 argparser.add_argument('-d', '--debug', action='store_true', help='Enable debug output')
 argparser.add_argument('--log', type=str, help="Path to the log file")
 argparser.add_argument("--gdb", type=str, help="Path to the GDB server")
+argparser.add_argument("--harts", type=int, default=1, help="Number of harts, more than one runs the program in SMP mode")
+argparser.add_argument("--memory", type=int, default=DRAM_SIZE >> 20, help="Megabytes of DRAM (headless only)")
+argparser.add_argument("--isa", type=str, default="IMAC", help="ISA extensions to decode, e.g. IM (headless only)")
+argparser.add_argument("--engine", type=str, default="fast", choices=ENGINES, help="fast fuses instruction pairs and runs copy loops in bulk, plain steps one instruction at a time (headless only)")
+argparser.add_argument("--headless", action='store_true', help="Run without the debugger, handling ecalls as host syscalls, and exit with the program's status")
+argparser.add_argument("--intercept-libc", action='store_true', help="Run memcpy, memset, strlen and friends natively on the host (headless ELF programs only)")
+argparser.add_argument("--caches", action='store_true', help="Simulate L1I/L1D/L2 caches and print their statistics (headless only)")
+argparser.add_argument("--branches", action='store_true', help="Score branch predictors on the program and print per-branch accuracy (headless only)")
+argparser.add_argument("--timing", action='store_true', help="Estimate cycles and CPI per function on an in-order pipeline (headless only)")
+argparser.add_argument("--record", type=str, help="Log UART input and syscall results to this file for --replay (headless only)")
+argparser.add_argument("--replay", type=str, help="Feed the inputs logged by --record back instead of using the host (headless only)")
+argparser.add_argument("--cosim", type=str, help="Compare every instruction with a Spike --log-commits log, plain or compressed, and stop at the first divergence (headless only)")
+argparser.add_argument("--disk", type=str, help="Back the block device with this host file (headless only)")
+argparser.add_argument("--disk-writable", action='store_true', help="Let the program write to the --disk file")
+argparser.add_argument("--frames", type=str, help="Export a framebuffer frame on every vsync to this path pattern, e.g. frames/{:05d}.png (headless only)")
+argparser.add_argument("--frame-interval", type=int, help="Also export a frame every this many instructions (with --frames)")
+argparser.add_argument("--display", action='store_true', help="Show the framebuffer in a viewer window (headless only)")
+argparser.add_argument("--coverage", type=str, help="Add the executed pcs to this coverage file, created if missing, and print coverage per function for ELF programs (headless only)")
+argparser.add_argument("--coverage-export", type=str, help="Write every pc in the coverage as a hex address per line, e.g. for addr2line (with --coverage)")
+argparser.add_argument("--checkpoint-interval", type=int, default=CHECKPOINT_INTERVAL, help="Instructions between the debugger's checkpoints for rsi and rc")
+argparser.add_argument("--checkpoint-budget", type=int, default=CHECKPOINT_BUDGET >> 20, help="Megabytes of memory pages the debugger's checkpoints may hold")
 
 args = argparser.parse_args()
 
 def main(args):
-    sdb = SDB(args.program)
+    if args.harts > 1:
+        program = open(args.program, 'rb').read()
+        with SMP(program, args.harts) as smp:
+            for state in smp.run():
+                print(f"hart {state['hartid']}: pc = {state['pc']:#010x}, instructions = {state['instructions']}")
+        return
+    if args.headless:
+        program = open(args.program, 'rb').read()
+        config = MachineConfig(dram_size=args.memory << 20, extensions=args.isa, engine=args.engine)
+        functions = None
+        sizes = None
+        if is_elf(program):
+            elf = ELF(program)
+            cpu = CPU(b"", config=config)
+            elf.load(cpu)
+            functions = elf.functions
+            sizes = elf.sizes
+            if args.intercept_libc:
+                intercept_libc(cpu, elf.symbols)
+        else:
+            cpu = CPU(program, config=config)
+        cpu.syscalls = SyscallProxy(cpu)
+        if args.disk:
+            cpu.bus.block.attach(args.disk, args.disk_writable)
+        framebuffer = cpu.bus.framebuffer
+        if args.frames:
+            framebuffer.output = args.frames
+            if args.frame_interval:
+                framebuffer.export_every(args.frame_interval)
+        viewer = None
+        if args.display:
+            viewer = subprocess.Popen([sys.executable, "-m", "pyRISCV.framebuffer", framebuffer.share()])
+        recorder = Recorder(cpu, open(args.record, 'wb')) if args.record else None
+        if args.replay:
+            Replayer(cpu, open(args.replay, 'rb'))
+        if args.caches:
+            cpu.attach_caches(CacheHierarchy(l2=Cache("L2", L2_SIZE, L2_ASSOC)))
+        if args.branches:
+            cpu.attach_branch_profiler(BranchProfiler())
+        if args.timing:
+            cpu.attach_timing(TimingModel(cpu, functions))
+        if args.coverage:
+            cpu.attach_coverage(Coverage(config.dram_base, config.dram_size))
+        if args.cosim:
+            try:
+                CoSimulator(cpu, open_log(args.cosim)).run()
+            except Divergence as divergence:
+                print("\n".join(divergence.report()), file=sys.stderr)
+                return 1
+        else:
+            cpu.run()
+        if recorder is not None:
+            recorder.close()
+        if viewer is not None:
+            viewer.wait()  # until the window is closed
+            framebuffer.close()
+        if args.caches:
+            print("\n".join(cpu.caches.report()), file=sys.stderr)
+        if args.branches:
+            print("\n".join(cpu.branch_profiler.report()), file=sys.stderr)
+        if args.timing:
+            print("\n".join(cpu.timing.report()), file=sys.stderr)
+        if args.coverage:
+            coverage = cpu.coverage
+            if os.path.exists(args.coverage):
+                coverage.merge(Coverage.load(args.coverage))  # accumulate over runs
+            coverage.save(args.coverage)
+            if args.coverage_export:
+                coverage.export(args.coverage_export)
+            if functions is not None:
+                print("\n".join(coverage.report(functions, sizes)), file=sys.stderr)
+        return cpu.exit_code or 0
+    sdb = SDB(args.program, args.checkpoint_interval, args.checkpoint_budget << 20)
     sdb.cmdloop()
 
 if __name__ == '__main__':
@@ -25,4 +132,4 @@ if __name__ == '__main__':
         logging.basicConfig(level=logging.DEBUG, format=logging_fmt)
     if args.log:
         logging.basicConfig(filename=args.log, level=logging.DEBUG, format=logging_fmt)
-    main(args)
\ No newline at end of file
+    sys.exit(main(args))
\ No newline at end of file
@@ -1,3 +1,5 @@
 from .cpu import CPU
+from .config import MachineConfig
 from .params import *
-from .sdb import SDB
\ No newline at end of file
+from .sdb import SDB
+from .smp import SMP
@@ -0,0 +1,73 @@
+import contextlib
+from .params import *
+
+NO_RESERVATION = 0xFFFFFFFF  # LR/SC reservations are word aligned, so this never matches
+
+class Reservations:
+    """
+        LR/SC reservation table with one slot per hart.
+        ``buffer`` and ``lock`` are shared between processes in SMP mode; a
+        private table with a no-op lock is used for a single hart. The lock
+        must be reentrant, as the store of an SC or AMO made with it held
+        goes through written().
+    """
+
+    def __init__(self, buffer=None, lock=None):
+        if buffer is None:
+            buffer = bytearray(4 * MAX_HARTS)
+            self.table = memoryview(buffer).cast('I')
+            self.clear()
+        else:
+            self.table = memoryview(buffer)[:4 * MAX_HARTS].cast('I')
+        self.lock = contextlib.nullcontext() if lock is None else lock
+
+    def clear(self):
+        for i in range(MAX_HARTS):
+            self.table[i] = NO_RESERVATION
+
+    def reserve(self, hartid, address):
+        self.table[hartid] = address
+
+    def take(self, hartid, address):
+        """
+            Consume the reservation of ``hartid`` and report whether it still
+            covered ``address``. Must be called with ``lock`` held."""
+        valid = self.table[hartid] == address
+        self.table[hartid] = NO_RESERVATION
+        return valid
+
+    def invalidate(self, hartid, address):
+        """
+            Break every other hart's reservation on ``address`` after a
+            successful SC or AMO. Must be called with ``lock`` held."""
+        table = self.table
+        for i in range(len(table)):
+            if i != hartid and table[i] == address:
+                table[i] = NO_RESERVATION
+
+    def held(self, hartid, address, length):
+        """
+            True if a hart other than ``hartid`` holds a reservation on one
+            of the words from ``address`` to ``address + length``."""
+        first, last = address & ~0x3, (address + length - 1) & ~0x3
+        return any(first <= reserved <= last for i, reserved in enumerate(self.table) if i != hartid)
+
+    def written(self, hartid, address, length):
+        """
+            Break every other hart's reservation on the words a plain store
+            by ``hartid`` to ``address + length`` touches. Almost every store
+            misses, so the table is read without the lock first."""
+        first, last = address & ~0x3, (address + length - 1) & ~0x3
+        table = self.table
+        for reserved in table:
+            if first <= reserved <= last:
+                break
+        else:
+            return
+        with self.lock:
+            for i in range(len(table)):
+                if i != hartid and first <= table[i] <= last:
+                    table[i] = NO_RESERVATION
+
+    def release(self):
+        self.table.release()
@@ -0,0 +1,297 @@
+import numpy as np
+from .params import *
+from .instruction_executor import uppack_inst, to_signed, get_imm
+
+RUNNING = 0  # instance is still executing
+HALTED = 1  # instance fetched a zero instruction (end of program)
+FAULTED = 2  # instance hit an access fault or an unsupported instruction
+
+MASK32 = 0xFFFFFFFF
+
+class BatchCPU:
+    """
+        Lockstep engine running N independent instances of one program.
+        Register files are kept in an (N, 32) uint32 array and DRAM in an
+        (N, mem_size) uint8 array. Instances sharing a PC form a group whose
+        current instruction is executed as one vectorized operation; groups
+        split when a branch diverges and merge again when their PCs meet.
+
+        The program image is treated as code shared by all instances, so
+        instances only differ in their registers and data. There is no
+        trap handling: an access fault or an instruction the engine does
+        not support (CSR, system, atomics) stops the faulting instances.
+    """
+
+    def __init__(self, program, n, mem_size=DRAM_SIZE):
+        self.n = n
+        self.mem_size = mem_size
+        self.regs = np.zeros((n, 32), dtype=np.uint32)
+        self.regs[:, 2] = DRAM_BASE + mem_size - 1  # set stack pointer to end of DRAM
+        self.mem = np.zeros((n, mem_size), dtype=np.uint8)
+        self.mem[:, :len(program)] = np.frombuffer(bytes(program), dtype=np.uint8)
+        self.pc = np.full(n, DRAM_BASE, dtype=np.uint32)
+        self.status = np.full(n, RUNNING, dtype=np.uint8)
+        self.instructions = 0  # aggregate instances * instructions executed
+        self.decode_cache = {}
+        self.groups = {DRAM_BASE: np.arange(n)}
+        self.stopped = False  # set when the current group lost instances
+
+    def run(self, max_instructions=None):
+        """
+            Run until every instance stops or each has executed
+            max_instructions. Returns the number of lockstep rounds.
+        """
+        rounds = 0
+        groups = self.groups
+        while groups and (max_instructions is None or rounds < max_instructions):
+            next_groups = {}
+            for pc, idx in groups.items():
+                handler, fields = self.decode(pc)
+                self.instructions += len(idx)
+                new_pc = handler(idx, pc, *fields)
+                if self.stopped:
+                    self.stopped = False
+                    running = self.status[idx] == RUNNING
+                    idx = idx[running]
+                    if isinstance(new_pc, np.ndarray):
+                        new_pc = new_pc[running]
+                    if len(idx) == 0:
+                        continue
+                if isinstance(new_pc, np.ndarray):
+                    targets, inverse = np.unique(new_pc, return_inverse=True)
+                    for i, target in enumerate(targets):
+                        self.add_group(next_groups, int(target), idx[inverse == i])
+                else:
+                    self.add_group(next_groups, new_pc, idx)
+            groups = {pc: idx if type(idx) is not list else np.concatenate(idx)
+                      for pc, idx in next_groups.items()}
+            rounds += 1
+        self.groups = groups
+        for pc, idx in groups.items():
+            self.pc[idx] = pc
+        return rounds
+
+    def add_group(self, groups, pc, idx):
+        group = groups.get(pc)
+        if group is None:
+            groups[pc] = idx
+        elif type(group) is list:
+            group.append(idx)
+        else:
+            groups[pc] = [group, idx]
+
+    def fault(self, idx, pc):
+        self.status[idx] = FAULTED
+        self.pc[idx] = pc
+        self.stopped = True
+
+    def decode(self, pc):
+        entry = self.decode_cache.get(pc)
+        if entry is not None:
+            return entry
+        index = pc - DRAM_BASE
+        if index < 0 or index + 4 > self.mem_size:
+            entry = (self.execute_fault, ())
+        else:
+            inst = int.from_bytes(self.mem[0, index:index + 4].tobytes(), byteorder='little')
+            entry = self.decode_inst(inst)
+        self.decode_cache[pc] = entry
+        return entry
+
+    def decode_inst(self, inst):
+        op = inst & 0x7F
+        funct3 = (inst >> 12) & 0x7
+        funct7 = (inst >> 25) & 0x7F
+        rd, rs1, rs2 = uppack_inst(inst)
+        if inst == 0:
+            return self.execute_halt, ()
+        if op == 0x37:
+            return self.execute_lui, (rd, inst & 0xFFFFF000)
+        if op == 0x17:
+            return self.execute_auipc, (rd, inst & 0xFFFFF000)
+        if op == 0x6F:
+            imm = (0xFFF00000 if inst >> 31 == 1 else 0) | (inst & 0x000FF000) | \
+                ((inst >> 9) & 0x00000800) | ((inst >> 20) & 0x7FE)
+            return self.execute_jal, (rd, imm)
+        if op == 0x67:
+            return self.execute_jalr, (rd, rs1, np.uint32(get_imm(inst) & MASK32))
+        if op == 0x63 and funct3 in self.BRANCHES:
+            sign = (inst >> 31) & 0x1
+            imm = to_signed(sign << 12 | ((inst >> 7) & 0x1E) | ((inst >> 20) & 0x7e0) | ((inst << 4) & 0x800), 13)
+            return self.execute_branch, (rs1, rs2, self.BRANCHES[funct3], imm)
+        if op == 0x03 and funct3 in self.LOADS:
+            size, signed = self.LOADS[funct3]
+            return self.execute_load, (rd, rs1, np.uint32(get_imm(inst) & MASK32), size, signed)
+        if op == 0x23 and funct3 in (0x0, 0x1, 0x2):
+            imm = to_signed(((inst >> 7) & 0x1F) | ((inst >> 20) & 0xfe0), 12)
+            return self.execute_store, (rs1, rs2, np.uint32(imm & MASK32), 1 << funct3)
+        if op == 0x13:
+            if funct3 == 0x1 and funct7 == 0x00 or funct3 == 0x5 and funct7 in (0x00, 0x20):
+                name = {0x1: "sll", 0x5: "srl" if funct7 == 0 else "sra"}[funct3]
+                return self.execute_op_imm, (rd, rs1, np.uint32(rs2), name)
+            name = self.OP_IMM.get(funct3)
+            if name is not None:
+                return self.execute_op_imm, (rd, rs1, np.uint32(get_imm(inst) & MASK32), name)
+        if op == 0x33:
+            name = self.OP.get((funct3, funct7))
+            if name is not None:
+                return self.execute_op, (rd, rs1, rs2, name)
+        if op == 0x0F:
+            return self.execute_nop, ()
+        return self.execute_fault, ()
+
+    BRANCHES = {0x0: "eq", 0x1: "ne", 0x4: "lt", 0x5: "ge", 0x6: "ltu", 0x7: "geu"}
+    LOADS = {0x0: (1, True), 0x1: (2, True), 0x2: (4, False), 0x4: (1, False), 0x5: (2, False)}
+    OP_IMM = {0x0: "add", 0x2: "slt", 0x3: "sltu", 0x4: "xor", 0x6: "or", 0x7: "and"}
+    OP = {
+        (0x0, 0x00): "add", (0x0, 0x20): "sub", (0x1, 0x00): "sll", (0x2, 0x00): "slt",
+        (0x3, 0x00): "sltu", (0x4, 0x00): "xor", (0x5, 0x00): "srl", (0x5, 0x20): "sra",
+        (0x6, 0x00): "or", (0x7, 0x00): "and",
+        (0x0, 0x01): "mul", (0x1, 0x01): "mulh", (0x2, 0x01): "mulhsu", (0x3, 0x01): "mulhu",
+        (0x4, 0x01): "div", (0x5, 0x01): "divu", (0x6, 0x01): "rem", (0x7, 0x01): "remu",
+    }
+
+    def write(self, idx, rd, value):
+        if rd != 0:
+            self.regs[idx, rd] = value
+
+    def execute_halt(self, idx, pc):
+        self.status[idx] = HALTED
+        self.pc[idx] = pc
+        self.stopped = True
+        return pc
+
+    def execute_fault(self, idx, pc):
+        self.fault(idx, pc)
+        return pc
+
+    def execute_nop(self, idx, pc):
+        return pc + 4
+
+    def execute_lui(self, idx, pc, rd, imm):
+        self.write(idx, rd, imm)
+        return pc + 4
+
+    def execute_auipc(self, idx, pc, rd, imm):
+        self.write(idx, rd, (pc + imm) & MASK32)
+        return pc + 4
+
+    def execute_jal(self, idx, pc, rd, imm):
+        self.write(idx, rd, pc + 4)
+        return (pc + imm) & MASK32
+
+    def execute_jalr(self, idx, pc, rd, rs1, imm):
+        target = (self.regs[idx, rs1] + imm) & np.uint32(0xFFFFFFFE)
+        self.write(idx, rd, pc + 4)
+        return target
+
+    def execute_branch(self, idx, pc, rs1, rs2, cond, imm):
+        a = self.regs[idx, rs1]
+        b = self.regs[idx, rs2]
+        if cond == "eq":
+            taken = a == b
+        elif cond == "ne":
+            taken = a != b
+        elif cond == "lt":
+            taken = a.view(np.int32) < b.view(np.int32)
+        elif cond == "ge":
+            taken = a.view(np.int32) >= b.view(np.int32)
+        elif cond == "ltu":
+            taken = a < b
+        else:
+            taken = a >= b
+        if taken.all():
+            return (pc + imm) & MASK32
+        if not taken.any():
+            return pc + 4
+        return np.where(taken, np.uint32((pc + imm) & MASK32), np.uint32(pc + 4))
+
+    def offsets(self, idx, pc, address, nbytes):
+        """
+            Convert addresses to DRAM offsets, stopping instances whose access
+            falls outside DRAM. Returns the surviving instances and offsets.
+        """
+        offset = address.astype(np.int64) - DRAM_BASE
+        bad = (offset < 0) | (offset > self.mem_size - nbytes)
+        if bad.any():
+            self.fault(idx[bad], pc)
+            return idx[~bad], offset[~bad]
+        return idx, offset
+
+    def execute_load(self, idx, pc, rd, rs1, imm, size, signed):
+        idx, offset = self.offsets(idx, pc, self.regs[idx, rs1] + imm, size)
+        mem = self.mem
+        value = mem[idx, offset].astype(np.uint32)
+        for i in range(1, size):
+            value |= mem[idx, offset + i].astype(np.uint32) << np.uint32(8 * i)
+        if signed:
+            bits = 8 * size
+            value = (value ^ np.uint32(1 << (bits - 1))) - np.uint32(1 << (bits - 1))
+        self.write(idx, rd, value)
+        return pc + 4
+
+    def execute_store(self, idx, pc, rs1, rs2, imm, size):
+        value = self.regs[idx, rs2]
+        idx, offset = self.offsets(idx, pc, self.regs[idx, rs1] + imm, size)
+        if len(idx) != len(value):
+            value = self.regs[idx, rs2]
+        mem = self.mem
+        for i in range(size):
+            mem[idx, offset + i] = (value >> np.uint32(8 * i)) & np.uint32(0xFF)
+        return pc + 4
+
+    def execute_op_imm(self, idx, pc, rd, rs1, imm, name):
+        a = self.regs[idx, rs1]
+        self.write(idx, rd, self.alu(name, a, imm))
+        return pc + 4
+
+    def execute_op(self, idx, pc, rd, rs1, rs2, name):
+        a = self.regs[idx, rs1]
+        b = self.regs[idx, rs2]
+        self.write(idx, rd, self.alu(name, a, b))
+        return pc + 4
+
+    def alu(self, name, a, b):
+        if name == "add":
+            return a + b
+        if name == "sub":
+            return a - b
+        if name == "xor":
+            return a ^ b
+        if name == "or":
+            return a | b
+        if name == "and":
+            return a & b
+        if name == "sll":
+            return a << (b & np.uint32(31))
+        if name == "srl":
+            return a >> (b & np.uint32(31))
+        if name == "sra":
+            return (a.view(np.int32) >> (b & np.uint32(31)).astype(np.int32)).astype(np.uint32)
+        if name == "slt":
+            return (a.view(np.int32) < np.asarray(b, dtype=np.uint32).view(np.int32)).astype(np.uint32)
+        if name == "sltu":
+            return (a < b).astype(np.uint32)
+        if name == "mul":
+            return a * b
+        a_s = a.view(np.int32).astype(np.int64)
+        b_s = np.asarray(b, dtype=np.uint32).view(np.int32).astype(np.int64)
+        a_u = a.astype(np.uint64)
+        b_u = np.asarray(b, dtype=np.uint64)
+        if name == "mulh":
+            return ((a_s * b_s) >> 32).astype(np.uint32)
+        if name == "mulhsu":
+            return ((a_s * b_u.astype(np.int64)) >> 32).astype(np.uint32)
+        if name == "mulhu":
+            return ((a_u * b_u) >> np.uint64(32)).astype(np.uint32)
+        zero = b_s == 0
+        if name in ("div", "rem"):
+            divisor = np.where(zero, 1, b_s)
+            quotient = np.abs(a_s) // np.abs(divisor) * np.sign(a_s) * np.sign(divisor)
+            if name == "div":
+                return np.where(zero, -1, quotient).astype(np.uint32)
+            return np.where(zero, a_s, a_s - divisor * quotient).astype(np.uint32)
+        divisor = np.where(zero, 1, b_u)
+        if name == "divu":
+            return np.where(zero, MASK32, a_u // divisor).astype(np.uint32)
+        return np.where(zero, a_u, a_u % divisor).astype(np.uint32)
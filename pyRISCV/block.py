@@ -0,0 +1,94 @@
+import mmap
+from .params import *
+from .rv_exception import RVException
+
+# A minimal block device. The guest writes the first sector, a DRAM buffer
+# address and a sector count, then BLOCK_READ or BLOCK_WRITE to the command
+# register; the whole request is done by that store, as one slice copy
+# between the mmap of the backing file and DRAM, and BLOCK_STATUS tells how
+# it went. Only the pages a request touches are read from the host file, so
+# the backing store may be far larger than guest memory.
+
+class Block:
+    def __init__(self, path=None, writable=False):
+        self.regs = bytearray(BLOCK_REGISTERS)
+        self.dram = None  # DRAM requests copy to and from, set by the bus
+        self.file = None
+        self.map = None
+        self.view = None  # memoryview of map, sliced without copying
+        self.writable = False
+        if path is not None:
+            self.attach(path, writable)
+
+    def attach(self, path, writable=False):
+        """
+            Back the device with the host file at path, read-only unless
+            writable. A trailing partial sector is not visible."""
+        self.close()
+        self.file = open(path, "r+b" if writable else "rb")
+        self.writable = writable
+        self.file.seek(0, 2)
+        if self.file.tell():
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def capacity(self):
+        return len(self.map) // SECTOR_SIZE if self.map is not None else 0
+
+    def reg(self, offset):
+        return int.from_bytes(self.regs[offset:offset + 4], byteorder='little')
+
+    def load(self, addr, size):
+        index = addr - BLOCK_BASE
+        if BLOCK_CAPACITY <= index < BLOCK_CAPACITY + 8:
+            return (self.capacity() >> 8 * (index - BLOCK_CAPACITY)) & ((1 << size) - 1)
+        return int.from_bytes(self.regs[index:index + size // 8], byteorder='little')
+
+    def store(self, addr, value, size):
+        index = addr - BLOCK_BASE
+        nbytes = size // 8
+        if index + nbytes > BLOCK_CAPACITY:
+            return  # read-only or unused
+        self.regs[index:index + nbytes] = int.to_bytes(value & ((1 << size) - 1), nbytes, byteorder='little')
+        if index == BLOCK_COMMAND:
+            self.regs[BLOCK_STATUS:BLOCK_STATUS + 4] = int.to_bytes(self.request(value), 4, byteorder='little')
+
+    def capture(self):
+        return bytes(self.regs)
+
+    def restore(self, state):
+        """
+            Put back the registers from capture(). The backing file keeps
+            what was written to it."""
+        self.regs[:] = state
+
+    def request(self, command):
+        """
+            Perform command on the registered sectors and buffer, returning
+            the status"""
+        sector, count = self.reg(BLOCK_SECTOR), self.reg(BLOCK_COUNT)
+        buffer = self.reg(BLOCK_BUFFER)
+        if command not in (BLOCK_READ, BLOCK_WRITE) or sector + count > self.capacity():
+            return BLOCK_ERROR
+        if command == BLOCK_WRITE and not self.writable:
+            return BLOCK_ERROR
+        start, length = sector * SECTOR_SIZE, count * SECTOR_SIZE
+        try:
+            if command == BLOCK_READ:
+                self.dram.writable_bytes(buffer, length)[:] = self.view[start:start + length]
+            else:
+                self.view[start:start + length] = self.dram.load_bytes(buffer, length)
+        except RVException:
+            return BLOCK_ERROR  # buffer outside DRAM
+        return BLOCK_OK
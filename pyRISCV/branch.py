@@ -0,0 +1,215 @@
+from array import array
+from .instruction_executor import sign_extend
+
+# Branch prediction models. A BranchProfiler attached with
+# ``cpu.attach_branch_profiler()`` wraps the decoded branch, jal and jalr
+# handlers so that each execution appends (pc, next pc) to a list; the
+# predictors are trained on the list in batches, between run() chunks,
+# keeping the per-branch cost of collection to one append.
+
+BRANCH = 0  # conditional branch
+JUMP = 1  # jal/jalr that neither calls nor returns
+CALL = 2  # jal/jalr linking to ra or t0
+RETURN = 3  # jalr through ra or t0 that does not link
+
+LINK_REGISTERS = (1, 5)
+
+def classify(inst):
+    """
+        (kind, static target or None) of a control-transfer instruction, or
+        None for anything else"""
+    op = inst & 0x7F
+    rd, rs1 = (inst >> 7) & 0x1F, (inst >> 15) & 0x1F
+    if op == 0x63:
+        return BRANCH, sign_extend(((inst >> 19) & 0x1000) | ((inst >> 20) & 0x7E0) |
+                                   ((inst >> 7) & 0x1E) | ((inst << 4) & 0x800), 13)
+    if op == 0x6F:
+        offset = sign_extend(((inst >> 11) & 0x100000) | (inst & 0xFF000) |
+                             ((inst >> 9) & 0x800) | ((inst >> 20) & 0x7FE), 21)
+        return (CALL if rd in LINK_REGISTERS else JUMP), offset
+    if op == 0x67:
+        if rd in LINK_REGISTERS:
+            return CALL, None
+        if rs1 in LINK_REGISTERS:
+            return RETURN, None
+        return JUMP, None
+    return None
+
+class StaticBTFN:
+    """
+        Backward taken, forward not taken."""
+    name = "btfn"
+
+    def train(self, outcomes, wrong):
+        """
+            Predict each (pc, target, taken) in order, counting
+            mispredictions per pc in wrong, and learn from the outcome."""
+        for pc, target, taken in outcomes:
+            if (target < pc) != taken:
+                wrong[pc] = wrong.get(pc, 0) + 1
+
+class Bimodal:
+    """
+        A table of 2-bit saturating counters indexed by pc."""
+    name = "bimodal"
+
+    def __init__(self, index_bits=12):
+        self.mask = (1 << index_bits) - 1
+        self.counters = bytearray([1]) * (1 << index_bits)  # weakly not taken
+
+    def train(self, outcomes, wrong):
+        counters, mask = self.counters, self.mask
+        for pc, _, taken in outcomes:
+            index = (pc >> 1) & mask
+            counter = counters[index]
+            if (counter >= 2) != taken:
+                wrong[pc] = wrong.get(pc, 0) + 1
+            if taken:
+                if counter < 3:
+                    counters[index] = counter + 1
+            elif counter > 0:
+                counters[index] = counter - 1
+
+class GShare(Bimodal):
+    """
+        2-bit counters indexed by pc xor the global history of outcomes."""
+    name = "gshare"
+
+    def __init__(self, index_bits=12, history_bits=10):
+        super().__init__(index_bits)
+        self.history_mask = (1 << history_bits) - 1
+        self.history = 0
+
+    def train(self, outcomes, wrong):
+        counters, mask, history_mask = self.counters, self.mask, self.history_mask
+        history = self.history
+        for pc, _, taken in outcomes:
+            index = ((pc >> 1) ^ history) & mask
+            counter = counters[index]
+            if (counter >= 2) != taken:
+                wrong[pc] = wrong.get(pc, 0) + 1
+            if taken:
+                if counter < 3:
+                    counters[index] = counter + 1
+            elif counter > 0:
+                counters[index] = counter - 1
+            history = ((history << 1) | taken) & history_mask
+        self.history = history
+
+class BTB:
+    """
+        Direct-mapped branch target buffer for jumps, with a return address
+        stack for returns."""
+    name = "btb/ras"
+
+    def __init__(self, entries=512, ras_depth=16):
+        self.mask = entries - 1
+        self.tags = array('q', [-1]) * entries
+        self.targets = array('L', [0]) * entries
+        self.ras = []
+        self.ras_depth = ras_depth
+
+    def predict(self, pc, kind):
+        if kind == RETURN:
+            return self.ras[-1] if self.ras else None
+        index = (pc >> 1) & self.mask
+        return self.targets[index] if self.tags[index] == pc else None
+
+    def update(self, pc, kind, target, fall_through):
+        if kind == RETURN:
+            if self.ras:
+                self.ras.pop()
+            return
+        if kind == CALL:
+            self.ras.append(fall_through)
+            if len(self.ras) > self.ras_depth:
+                del self.ras[0]
+        index = (pc >> 1) & self.mask
+        self.tags[index] = pc
+        self.targets[index] = target
+
+    def train(self, outcomes, wrong):
+        """
+            outcomes holds (pc, kind, target, fall-through pc) of jumps"""
+        for pc, kind, target, fall_through in outcomes:
+            if self.predict(pc, kind) != target:
+                wrong[pc] = wrong.get(pc, 0) + 1
+            self.update(pc, kind, target, fall_through)
+
+class BranchProfiler:
+    """
+        Collects branch outcomes and scores direction predictors on the
+        conditional branches and the BTB/RAS on jal/jalr. executed maps each
+        pc to its executions, mispredicted each model name to {pc: count}.
+    """
+
+    def __init__(self, predictors=None, btb=None):
+        self.predictors = predictors if predictors is not None else [StaticBTFN(), Bimodal(), GShare()]
+        self.btb = btb if btb is not None else BTB()
+        self.records = []  # (pc, next pc) not yet seen by the predictors
+        self.sites = {}  # pc -> (kind, static target, fall-through pc)
+        self.executed = {}
+        self.mispredicted = {model.name: {} for model in self.predictors + [self.btb]}
+
+    def wrap(self, handler, pc, inst, length):
+        """
+            Handler recording each execution of the control transfer at pc,
+            or handler itself for other instructions."""
+        kind = classify(inst)
+        if kind is None:
+            return handler
+        if pc in self.sites:
+            self.flush()  # re-decoded, possibly as a different instruction
+        target = None if kind[1] is None else (pc + kind[1]) & 0xFFFFFFFF
+        self.sites[pc] = (kind[0], target, pc + length)
+        append = self.records.append
+
+        def recorded(cpu, inst):
+            next_pc = handler(cpu, inst)
+            append((pc, next_pc))
+            return next_pc
+        return recorded
+
+    def flush(self):
+        """
+            Train the models on the collected records. cpu.run() calls this
+            between chunks, so at most INTERRUPT_POLL_INTERVAL records wait."""
+        sites, executed = self.sites, self.executed
+        branches, jumps = [], []
+        for pc, next_pc in self.records:
+            kind, target, fall_through = sites[pc]
+            executed[pc] = executed.get(pc, 0) + 1
+            if kind == BRANCH:
+                branches.append((pc, target, next_pc != fall_through))
+            else:
+                jumps.append((pc, kind, next_pc, fall_through))
+        self.records.clear()
+        for predictor in self.predictors:
+            predictor.train(branches, self.mispredicted[predictor.name])
+        self.btb.train(jumps, self.mispredicted[self.btb.name])
+
+    def totals(self, name):
+        """
+            (predictions, mispredictions) of one model"""
+        self.flush()
+        jumps = name == self.btb.name
+        predictions = sum(count for pc, count in self.executed.items()
+                          if (self.sites[pc][0] != BRANCH) == jumps)
+        return predictions, sum(self.mispredicted[name].values())
+
+    def accuracy(self, name):
+        predictions, wrong = self.totals(name)
+        return 1.0 - wrong / predictions if predictions else 1.0
+
+    def report(self, top=10):
+        """
+            Accuracy of each model, with the branches it mispredicts most"""
+        lines = []
+        for name, wrong in self.mispredicted.items():
+            predictions, _ = self.totals(name)
+            lines.append(f"{name}: {predictions} predictions, {self.accuracy(name):.2%} correct")
+            for pc in sorted(wrong, key=wrong.get, reverse=True)[:top]:
+                count = self.executed[pc]
+                lines.append(f"  pc {pc:#010x}: {count} executed, {wrong[pc]} mispredicted "
+                             f"({1.0 - wrong[pc] / count:.2%} correct)")
+        return lines
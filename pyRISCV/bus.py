@@ -1,30 +1,100 @@
 from .params import *
 from .dram import DRAM
 from .serial import Serial
+from .block import Block
+from .dma import DMA
+from .events import EventQueue
+from .framebuffer import Framebuffer
+from .config import DEFAULT_CONFIG
+from .clint import Clint
+from .atomic import Reservations
 from .rv_exception import RVException, ExceptionType
 import logging
-# from cache import Cache
 
 class BUS:
-    def __init__(self, program):
-        self.dram = DRAM(program)
+    def __init__(self, program, dram=None, clint=None, reservations=None, config=DEFAULT_CONFIG):
+        self.config = config
+        self.dram = DRAM(program, base=config.dram_base, size=config.dram_size) if dram is None else dram
+        self.dram_base = self.dram.base
+        self.dram_end = self.dram.end
         self.serial = Serial()
+        self.events = EventQueue()  # device events, timed by the CPU
+        self.block = self.dma = self.framebuffer = None  # optional devices, per config.devices
+        if "block" in config.devices:
+            self.block = Block()
+            self.block.dram = self.dram
+        if "dma" in config.devices:
+            self.dma = DMA(self.dram, self.events)
+        self.pixels_base = self.pixels_end = 1 << 32  # range of the framebuffer's pixels, if any
+        if "framebuffer" in config.devices:
+            self.framebuffer = Framebuffer()
+            self.framebuffer.events = self.events
+            self.pixels_base, self.pixels_end = FB_BASE, FB_BASE + FB_SIZE
+        self.clint = Clint() if clint is None else clint
+        self.reservations = Reservations() if reservations is None else reservations
+        self.caches = None  # CacheHierarchy observing data accesses, if any
+        self.devices = [(SERIAL_BASE, SERIAL_END, self.serial)]  # (base, end, device) besides DRAM and pixels
+        if self.block is not None:
+            self.devices.append((BLOCK_BASE, BLOCK_END, self.block))
+        if self.dma is not None:
+            self.devices.append((DMA_BASE, DMA_END, self.dma))
+        if self.framebuffer is not None:
+            self.devices.append((FB_CONTROL_BASE, FB_CONTROL_END, self.framebuffer))
+        self.devices.append((CLINT_BASE, CLINT_END, self.clint))
 
     def load(self, address, size):
-        if address >= DRAM_BASE and address <= DRAM_END:
+        if address >= self.dram_base and address <= self.dram_end:
             return self.dram.load(address, size)
-        elif address >= SERIAL_BASE and address <= SERIAL_END:
-            return self.serial.load(address, size)
-        else:
+        elif address >= self.pixels_base and address + (size >> 3) <= self.pixels_end:
+            index = address - FB_BASE  # pixels are plain memory, no device call
+            return int.from_bytes(self.framebuffer.pixels[index:index + (size >> 3)], byteorder='little')
+        for base, end, device in self.devices:
+            if address >= base and address <= end:
+                return device.load(address, size)
+        if logging.root.isEnabledFor(logging.WARNING):
             logging.warning("LoadAccessFault at address 0x{:08x}".format(address))
-            raise RVException(ExceptionType.LOAD_ACCESS_FAULT, address)
-        
+        raise RVException(ExceptionType.LOAD_ACCESS_FAULT, address)
+
     def store(self, address, value, size):
-        if address >= DRAM_BASE and address <= DRAM_END:
+        if address >= self.dram_base and address <= self.dram_end:
             self.dram.store(address, value, size)
-        elif address >= SERIAL_BASE and address <= SERIAL_END:
-            self.serial.store(address, value, size)
+        elif address >= self.pixels_base and address + (size >> 3) <= self.pixels_end:
+            index = address - FB_BASE
+            self.framebuffer.pixels[index:index + (size >> 3)] = int.to_bytes(value, size >> 3, byteorder='little')
+            self.framebuffer.dirty = True
         else:
-            logging.warning("StoreAccessFault at address 0x{:08x}".format(address))
+            for base, end, device in self.devices:
+                if address >= base and address <= end:
+                    device.store(address, value, size)
+                    return
+            if logging.root.isEnabledFor(logging.WARNING):
+                logging.warning("StoreAccessFault at address 0x{:08x}".format(address))
             raise RVException(ExceptionType.STORE_AMO_ACCESS_FAULT, address)
 
+    def external_interrupt(self):
+        """
+            Level of the external interrupt line devices raise"""
+        return self.dma is not None and self.dma.interrupting()
+
+    fetch = load  # instruction fetches bypass the data-side hooks below
+
+    def attach_caches(self, caches):
+        """
+            Route loads and stores through the data caches by shadowing load
+            and store on this instance, so BUS.load and BUS.store themselves
+            never check for a cache."""
+        self.caches = caches
+        if caches is None:
+            self.__dict__.pop("load", None)
+            self.__dict__.pop("store", None)
+        else:
+            self.load = self.load_cached
+            self.store = self.store_cached
+
+    def load_cached(self, address, size):
+        self.caches.data(address, False)
+        return BUS.load(self, address, size)
+
+    def store_cached(self, address, value, size):
+        self.caches.data(address, True)
+        BUS.store(self, address, value, size)
@@ -0,0 +1,161 @@
+import random
+from array import array
+from .params import *
+
+# Cache model: set-associative, write-back, write-allocate caches that track
+# tags only (data always comes from DRAM), for hit/miss/writeback statistics.
+# Attach with ``cpu.attach_caches(CacheHierarchy(...))``; while detached the
+# bus and decode cache run exactly as without it.
+
+POLICIES = ("lru", "fifo", "random")
+
+class Cache:
+    """
+        One cache level. Tags, dirty bits and replacement stamps live in flat
+        arrays indexed by set * assoc + way; a tag of -1 marks an empty way.
+        Misses fill from next_level and dirty victims are written back to it.
+    """
+
+    def __init__(self, name, size, assoc, line_size=CACHE_LINE_SIZE, policy="lru", next_level=None, seed=0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown replacement policy {policy}, expected one of {POLICIES}")
+        if line_size & (line_size - 1) or size % (line_size * assoc):
+            raise ValueError(f"{name}: size must be a multiple of assoc * line_size, a power of two")
+        self.name = name
+        self.size = size
+        self.assoc = assoc
+        self.line_size = line_size
+        self.policy = policy
+        self.next_level = next_level
+        self.sets = size // (line_size * assoc)
+        self.line_shift = line_size.bit_length() - 1
+        self.tags = array('q', [-1]) * (self.sets * assoc)
+        self.dirty = bytearray(self.sets * assoc)
+        self.stamps = array('Q', [0]) * (self.sets * assoc)  # last use (lru) or fill (fifo)
+        self.clock = 0
+        self.random = random.Random(seed)
+        self.regions = []  # (name, start, end) address ranges to keep statistics for
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.writebacks = 0
+        self.by_region = {}  # region name -> [hits, misses, writebacks]
+        self.by_pc = {}  # pc of the accessing instruction -> [hits, misses, writebacks]
+
+    def region(self, address):
+        for name, start, end in self.regions:
+            if start <= address <= end:
+                return name
+        return "other"
+
+    def record(self, address, pc, index):
+        for key, table in ((self.region(address), self.by_region), (pc, self.by_pc)):
+            stats = table.get(key, None)
+            if stats is None:
+                stats = table[key] = [0, 0, 0]
+            stats[index] += 1
+
+    def access(self, address, write, pc):
+        """
+            Look up the line holding address, filling it on a miss, and mark
+            it dirty on a write. Returns True on a hit."""
+        line = address >> self.line_shift
+        set_index = line % self.sets
+        base = set_index * self.assoc
+        ways = self.tags[base:base + self.assoc]
+        self.clock += 1
+        if line in ways:
+            slot = base + ways.index(line)
+            self.hits += 1
+            self.record(address, pc, 0)
+            if self.policy == "lru":
+                self.stamps[slot] = self.clock
+            if write:
+                self.dirty[slot] = 1
+            return True
+        self.misses += 1
+        self.record(address, pc, 1)
+        if -1 in ways:
+            slot = base + ways.index(-1)
+        elif self.policy == "random":
+            slot = base + self.random.randrange(self.assoc)
+        else:
+            stamps = self.stamps[base:base + self.assoc]
+            slot = base + stamps.index(min(stamps))
+        if self.dirty[slot]:
+            victim = self.tags[slot] << self.line_shift
+            self.writebacks += 1
+            self.record(victim, pc, 2)
+            if self.next_level is not None:
+                self.next_level.access(victim, True, pc)
+        if self.next_level is not None:
+            self.next_level.access(address, False, pc)
+        self.tags[slot] = line
+        self.dirty[slot] = write
+        self.stamps[slot] = self.clock
+        return False
+
+    def flush(self):
+        """
+            Write back every dirty line and empty the cache."""
+        for slot in range(len(self.tags)):
+            if self.dirty[slot]:
+                self.writebacks += 1
+                if self.next_level is not None:
+                    self.next_level.access(self.tags[slot] << self.line_shift, True, None)
+        self.tags = array('q', [-1]) * len(self.tags)
+        self.dirty = bytearray(len(self.dirty))
+
+    def report(self):
+        """
+            Summary lines: totals, then per region, then the ten PCs with the
+            most misses."""
+        accesses = self.hits + self.misses
+        rate = self.hits / accesses if accesses else 0.0
+        lines = [f"{self.name}: {accesses} accesses, {self.hits} hits ({rate:.2%}), "
+                 f"{self.misses} misses, {self.writebacks} writebacks"]
+        for name, (hits, misses, writebacks) in sorted(self.by_region.items()):
+            lines.append(f"  {name}: {hits} hits, {misses} misses, {writebacks} writebacks")
+        worst = sorted(((stats[1], pc) for pc, stats in self.by_pc.items() if pc is not None), reverse=True)
+        for misses, pc in worst[:10]:
+            if misses:
+                lines.append(f"  pc {pc:#010x}: {self.by_pc[pc][0]} hits, {misses} misses")
+        return lines
+
+class CacheHierarchy:
+    """
+        Split L1 instruction and data caches, optionally backed by a unified
+        L2. Defaults to the geometry in params.
+    """
+
+    def __init__(self, l1i=None, l1d=None, l2=None, regions=None):
+        self.l2 = l2
+        self.l1i = l1i if l1i is not None else Cache("L1I", L1_SIZE, L1_ASSOC)
+        self.l1d = l1d if l1d is not None else Cache("L1D", L1_SIZE, L1_ASSOC)
+        self.l1i.next_level = self.l1d.next_level = l2
+        self.regions = regions  # None for one "dram" region covering the attached DRAM
+        self.cpu = None  # set by cpu.attach_caches, supplies the pc of data accesses
+        self.use_dram(DRAM_BASE, DRAM_END)
+
+    def use_dram(self, base, end):
+        """
+            Cache accesses from base to end, the CPU's DRAM once attached,
+            which is also the default region statistics are kept for"""
+        self.dram_base, self.dram_end = base, end
+        for cache in self.levels():
+            cache.regions = list(self.regions or [("dram", base, end)])
+
+    def levels(self):
+        return [cache for cache in (self.l1i, self.l1d, self.l2) if cache is not None]
+
+    def fetch(self, pc):
+        self.l1i.access(pc, False, pc)
+
+    def data(self, address, write):
+        if self.dram_base <= address <= self.dram_end:  # devices are uncached
+            self.l1d.access(address, write, self.cpu.pc)
+
+    def report(self):
+        return [line for cache in self.levels() for line in cache.report()]
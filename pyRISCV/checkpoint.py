@@ -0,0 +1,188 @@
+from collections import deque
+from .params import *
+
+# In-memory checkpoints for reverse execution. A checkpoint holds the hart's
+# architectural state at some instruction count and, copy-on-write, the
+# pages the program dirties until the next checkpoint: taking one flags
+# every DRAM page PAGE_SAVE, and the first store to a flagged page saves it
+# before it changes. Going back to checkpoint i puts back the pages saved by
+# every checkpoint from the newest down to i, so each page ends up as it
+# was at i. Any instruction count in between is reached by running forward
+# again from the nearest checkpoint before it. Re-execution is deterministic
+# as mtime follows the instruction count and UART input is part of the
+# state; host syscalls are issued again and the cache, branch and timing
+# models count re-executed instructions twice. Device registers are copied
+# into the state, and the framebuffer's pixels whenever the guest wrote to
+# them since the last capture; a block device's backing file is not
+# restored. CPU.begin() uses the same copy-on-write
+# pages for a single checkpoint it can roll back to.
+
+PAGE_SIZE = 1 << PAGE_SHIFT
+
+def capture_state(cpu):
+    """
+        Everything besides DRAM that running forward from here depends on"""
+    bus = cpu.bus
+    msip = CLINT_MSIP + 4 * cpu.hartid
+    mtimecmp = CLINT_MTIMECMP + 8 * cpu.hartid
+    state = {
+        "regs": list(cpu.regs),
+        "pc": cpu.pc,
+        "next_pc": cpu.next_pc,
+        "privilege": cpu.privilegeLevel,
+        "reserved_value": cpu.reserved_value,
+        "halted": cpu.halted,
+        "exit_code": cpu.exit_code,
+        "csrs": list(cpu.csr.csrs),
+        "retired": (cpu.instret, cpu.fused, cpu.bulk),
+        "counters": (list(cpu.counters.offsets), list(cpu.counters.selectors), list(cpu.counters.events)),
+        "msip": bytes(bus.clint.data[msip:msip + 4]),
+        "mtimecmp": bytes(bus.clint.data[mtimecmp:mtimecmp + 8]),
+        "reservation": bus.reservations.table[cpu.hartid],
+        "rx": bytes(bus.serial.rx),
+        "dma": bus.dma.capture() if bus.dma is not None else None,
+        "framebuffer": bus.framebuffer.capture() if bus.framebuffer is not None else None,
+        "block": bus.block.capture() if bus.block is not None else None,
+    }
+    if cpu.syscalls is not None:
+        state["brk"] = cpu.syscalls.brk
+        state["fds"] = dict(cpu.syscalls.fds)
+    return state
+
+def restore_state(cpu, state):
+    bus = cpu.bus
+    msip = CLINT_MSIP + 4 * cpu.hartid
+    mtimecmp = CLINT_MTIMECMP + 8 * cpu.hartid
+    cpu.regs[:] = state["regs"]
+    cpu.pc = state["pc"]
+    cpu.next_pc = state["next_pc"]
+    cpu.privilegeLevel = state["privilege"]
+    cpu.reserved_value = state["reserved_value"]
+    cpu.halted = state["halted"]
+    cpu.exit_code = state["exit_code"]
+    cpu.csr.csrs[:] = state["csrs"]
+    cpu.instret, cpu.fused, cpu.bulk = state["retired"]
+    offsets, selectors, events = state["counters"]
+    counters = cpu.counters
+    counters.offsets[:] = offsets
+    counters.events[:] = events
+    if counters.selectors != selectors:
+        counters.selectors[:] = selectors
+        cpu.update_event_hooks()
+    bus.clint.data[msip:msip + 4] = state["msip"]
+    bus.clint.data[mtimecmp:mtimecmp + 8] = state["mtimecmp"]
+    bus.reservations.table[cpu.hartid] = state["reservation"]
+    bus.serial.rx = deque(state["rx"])
+    bus.events.clear()
+    if bus.dma is not None:
+        bus.dma.restore(state["dma"])
+    if bus.framebuffer is not None:
+        bus.framebuffer.restore(state["framebuffer"])
+    if bus.block is not None:
+        bus.block.restore(state["block"])
+    if cpu.syscalls is not None and "brk" in state:
+        cpu.syscalls.brk = state["brk"]
+        cpu.syscalls.fds = dict(state["fds"])
+
+class Checkpoint:
+    def __init__(self, retired, state):
+        self.retired = retired  # instructions retired when it was taken
+        self.state = state
+        self.pages = {}  # page -> contents when taken, for pages written since
+
+class Checkpoints:
+    """
+        Checkpoints of cpu every interval instructions, holding at most
+        budget bytes of saved pages. Fused pairs and bulk loops are turned
+        off so that any instruction count can be reached exactly. Call
+        tick() after running, or run through advance().
+    """
+
+    def __init__(self, cpu, interval=CHECKPOINT_INTERVAL, budget=CHECKPOINT_BUDGET):
+        self.cpu = cpu
+        self.interval = interval
+        self.budget = budget
+        self.saved = []  # Checkpoint, oldest first; the newest collects dirtied pages
+        self.used = 0  # bytes of saved pages
+        if cpu.bus.dram.page_saver is not None:
+            raise RuntimeError("DRAM is already journaled by a transaction or checkpoints")
+        cpu.fuse_pairs = False
+        cpu.recognize_idioms = False
+        cpu.flush_decode_cache()
+        cpu.bus.dram.page_saver = self.save_page
+        self.take()
+
+    def take(self):
+        cpu = self.cpu
+        self.saved.append(Checkpoint(cpu.retired(), capture_state(cpu)))
+        cpu.bus.dram.save_all()
+        self.trim()
+
+    def due(self):
+        """
+            Instruction count at which the next checkpoint is taken"""
+        return self.saved[-1].retired + self.interval
+
+    def tick(self):
+        if self.cpu.retired() >= self.due():
+            self.take()
+
+    def save_page(self, page):
+        self.saved[-1].pages[page] = self.cpu.bus.dram.page(page)
+        self.used += PAGE_SIZE
+        self.trim()
+
+    def trim(self):
+        """
+            Drop the oldest checkpoints while over budget, keeping the newest"""
+        while self.used > self.budget and len(self.saved) > 1:
+            self.used -= PAGE_SIZE * len(self.saved.pop(0).pages)
+
+    def oldest(self):
+        return self.saved[0].retired
+
+    def restore(self, index):
+        """
+            Return the machine to checkpoint index, dropping the later ones"""
+        cpu = self.cpu
+        dram = cpu.bus.dram
+        for checkpoint in reversed(self.saved[index:]):
+            for page, contents in checkpoint.pages.items():
+                dram.restore_page(page, contents)
+            self.used -= PAGE_SIZE * len(checkpoint.pages)
+            checkpoint.pages = {}
+        del self.saved[index + 1:]
+        restore_state(cpu, self.saved[index].state)
+        dram.save_all()
+
+    def advance(self, n=None):
+        """
+            Run up to n instructions (until the program ends with None),
+            taking checkpoints along the way. Returns the number executed."""
+        cpu = self.cpu
+        executed = 0
+        while not cpu.halted and (n is None or executed < n):
+            chunk = self.due() - cpu.retired()
+            if n is not None:
+                chunk = min(chunk, n - executed)
+            executed += cpu.run(chunk)
+            self.tick()
+        return executed
+
+    def seek(self, target):
+        """
+            Restore the latest checkpoint at or before instruction target and
+            run forward to it, without repeating the UART output. Returns the
+            instruction count reached, which is the oldest checkpoint's when
+            target lies before it."""
+        index = 0
+        while index + 1 < len(self.saved) and self.saved[index + 1].retired <= target:
+            index += 1
+        self.restore(index)
+        serial = self.cpu.bus.serial
+        serial.muted = True
+        try:
+            self.advance(max(0, target - self.cpu.retired()))
+        finally:
+            serial.muted = False
+        return self.cpu.retired()
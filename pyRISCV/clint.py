@@ -0,0 +1,31 @@
+from .params import *
+
+class Clint:
+    """
+        Core-local interruptor holding msip, mtimecmp and mtime.
+        The registers live in ``buffer`` so that harts in other processes
+        see each other's msip writes (inter-processor interrupts).
+    """
+
+    def __init__(self, buffer=None):
+        if buffer is None:
+            self.data = bytearray(CLINT_SIZE)
+        else:
+            self.data = memoryview(buffer)[:CLINT_SIZE]
+        self.time_source = None  # callable deriving mtime, set by the CPU
+
+    def load(self, addr, size):
+        index = addr - CLINT_BASE
+        if CLINT_MTIME <= index < CLINT_MTIME + 8 and self.time_source is not None:
+            return (self.time_source() >> 8 * (index - CLINT_MTIME)) & ((1 << size) - 1)
+        return int.from_bytes(self.data[index:index + size // 8], byteorder='little')
+
+    def store(self, addr, value, size):
+        index = addr - CLINT_BASE
+        nbytes = size // 8
+        if CLINT_MSIP <= index < CLINT_MSIP + 4 * MAX_HARTS:
+            value &= 0x1  # only bit 0 of msip is writable
+        self.data[index:index + nbytes] = int.to_bytes(value, nbytes, byteorder='little')
+
+    def msip(self, hartid):
+        return self.data[CLINT_MSIP + 4 * hartid] & 0x1
@@ -0,0 +1,48 @@
+from .params import *
+
+# What varies between machines: where DRAM is and how big, which optional
+# devices sit on the bus, which ISA extensions decode and which engine runs
+# them. The params constants are the defaults. Everything is checked and
+# derived once here; the CPU, bus and DRAM copy what they need into their
+# own attributes, so machines with different configurations can run side
+# by side in one process. The UART and CLINT are part of every machine.
+
+DEVICES = ("block", "dma", "framebuffer")  # optional devices
+EXTENSIONS = "IMAC"  # extensions that can be turned off, besides I
+ENGINES = ("fast", "plain")  # fast fuses pairs and runs idiom loops in bulk, plain steps one instruction at a time
+
+MISA_BITS = {"I": 1 << 8, "M": 1 << 12, "A": 1 << 0, "C": 1 << 2}
+MISA_FIXED = (1 << 30) | (1 << 18) | (1 << 20)  # RV32 with S and U modes
+
+class MachineConfig:
+    """
+        Configuration of one machine, e.g.
+        ``CPU(program, config=MachineConfig(dram_size=64 << 20, extensions="IM"))``.
+    """
+
+    def __init__(self, dram_base=DRAM_BASE, dram_size=DRAM_SIZE, devices=DEVICES, extensions=EXTENSIONS, engine="fast"):
+        if dram_base & ((1 << PAGE_SHIFT) - 1) or dram_size <= 0 or dram_size & ((1 << PAGE_SHIFT) - 1):
+            raise ValueError("DRAM base and size must be multiples of the page size")
+        if dram_base + dram_size > 1 << 32:
+            raise ValueError("DRAM must fit in the 32-bit address space")
+        unknown = set(devices) - set(DEVICES)
+        if unknown:
+            raise ValueError(f"unknown devices {sorted(unknown)}, expected some of {DEVICES}")
+        extensions = extensions.upper()
+        if "I" not in extensions or set(extensions) - set(EXTENSIONS):
+            raise ValueError(f"extensions must include I and be among {EXTENSIONS}")
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine {engine}, expected one of {ENGINES}")
+        self.dram_base = dram_base
+        self.dram_size = dram_size
+        self.dram_end = dram_base + dram_size - 1
+        self.devices = tuple(devices)
+        self.extensions = "".join(extension for extension in EXTENSIONS if extension in extensions)
+        self.engine = engine
+        self.misa = MISA_FIXED | sum(MISA_BITS[extension] for extension in self.extensions)
+
+    def __repr__(self):
+        return (f"MachineConfig(dram_base={self.dram_base:#x}, dram_size={self.dram_size:#x}, "
+                f"devices={self.devices}, extensions={self.extensions!r}, engine={self.engine!r})")
+
+DEFAULT_CONFIG = MachineConfig()
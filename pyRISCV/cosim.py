@@ -0,0 +1,171 @@
+import io
+import gzip
+import bz2
+import lzma
+from collections import deque
+from .params import *
+
+# Differential co-simulation against a reference commit log, as written by
+# ``spike --log-commits``:
+#
+#   core   0: 3 0x80000004 (0x02028593) x11 0x80000020
+#   core   0: 3 0x8000000c (0x00b62023) mem 0x80001000 0x00000001
+#   core   0: exception trap_illegal_instruction, epc 0x80000010
+#
+# The log is read line by line, so it never has to fit in memory, and may
+# be gzip, bzip2 or xz compressed. Each simulated instruction is checked
+# against the next commit: its pc, the registers it wrote and the stores it
+# made. Loads, CSR and FP writes in the log are not compared. Entries before
+# the simulator's first pc (Spike's boot ROM) are skipped.
+
+COMPRESSED = ((b"\x1f\x8b", gzip.open), (b"BZh", bz2.open), (b"\xfd7zXZ\x00", lzma.open))
+
+def open_log(path):
+    """
+        Binary line stream of a commit log, decompressing if needed"""
+    raw = open(path, "rb", buffering=LOG_BUFFER_SIZE)
+    magic = raw.peek(6)[:6]
+    for prefix, opener in COMPRESSED:
+        if magic.startswith(prefix):
+            return io.BufferedReader(opener(raw), LOG_BUFFER_SIZE)
+    return raw
+
+def parse_commits(lines):
+    """
+        (pc, register writes, stores, line) per committed instruction, with
+        register writes None for instructions that trapped. Register writes
+        are {register: value}, stores [(address, value, size in bits)]."""
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 4 or parts[0] != b"core":
+            continue
+        if parts[2] == b"exception":
+            yield int(parts[-1], 16) & 0xFFFFFFFF, None, None, line
+            continue
+        if len(parts) < 5 or not parts[4].startswith(b"(0x"):
+            continue
+        writes = {}
+        stores = []
+        i, count = 5, len(parts)
+        while i + 1 < count:
+            token = parts[i]
+            if token == b"mem":
+                if i + 2 < count and parts[i + 2].startswith(b"0x"):
+                    value = parts[i + 2]
+                    stores.append((int(parts[i + 1], 16) & 0xFFFFFFFF, int(value, 16), (len(value) - 2) * 4))
+                    i += 3
+                else:
+                    i += 2  # a load
+                continue
+            if token[0] == 0x78:  # x<n>
+                writes[int(token[1:])] = int(parts[i + 1], 16) & 0xFFFFFFFF
+            i += 2
+        yield int(parts[3], 16) & 0xFFFFFFFF, writes, stores, line
+
+class Divergence(Exception):
+    """
+        The first instruction where the simulator and the reference differ,
+        with the reference lines around it in context."""
+
+    def __init__(self, retired, pc, reason, context):
+        super().__init__(f"diverged at instruction {retired}, pc {pc:#010x}: {reason}")
+        self.retired = retired
+        self.pc = pc
+        self.reason = reason
+        self.context = context
+
+    def report(self):
+        return [str(self)] + self.context
+
+class CoSimulator:
+    """
+        Runs cpu in lock step with a reference commit log, e.g.
+        ``CoSimulator(cpu, open_log(path)).run()``, raising Divergence at the
+        first difference. Fused pairs and bulk loops are turned off, as the
+        log has one entry per instruction.
+    """
+
+    def __init__(self, cpu, lines, context=COSIM_CONTEXT):
+        self.cpu = cpu
+        self.commits = parse_commits(lines)
+        self.context = context
+        self.history = deque(maxlen=context)  # reference lines already matched
+        self.stores = []  # (address, value, size) stored by the current instruction
+        cpu.fuse_pairs = False
+        cpu.recognize_idioms = False
+        cpu.flush_decode_cache()
+        self.bus_store = cpu.bus.store
+        cpu.bus.store = self.store
+
+    def store(self, address, value, size):
+        self.bus_store(address, value, size)
+        self.stores.append((address, value & ((1 << size) - 1), size))
+
+    def diverged(self, pc, reason, line=None):
+        """
+            Divergence at pc, against the reference line, or past the end of
+            the reference when line is None"""
+        context = [line.decode(errors="replace").rstrip() for line in self.history]
+        if line is not None:
+            context.append(">> " + line.decode(errors="replace").rstrip())
+        for _, (_, _, _, following) in zip(range(self.context // 2), self.commits):
+            context.append(following.decode(errors="replace").rstrip())
+        context.append(f"simulator: pc {pc:#010x}, stores {[(hex(a), hex(v), s) for a, v, s in self.stores]}")
+        return Divergence(self.cpu.retired(), pc, reason, context)
+
+    def check(self, pc, before, commit):
+        """
+            Reason the instruction just executed at pc differs from commit,
+            or None"""
+        ref_pc, writes, stores, _ = commit
+        if ref_pc != pc:
+            return f"pc {pc:#010x}, reference {ref_pc:#010x}"
+        if writes is None:
+            return None  # trapped in the reference; the handler's pc is checked next
+        regs = self.cpu.regs
+        for rd, value in writes.items():
+            if rd and regs[rd] != value:
+                return f"x{rd} = {regs[rd]:#010x}, reference {value:#010x}"
+        for rd in range(1, 32):
+            if regs[rd] != before[rd] and rd not in writes:
+                return f"x{rd} written with {regs[rd]:#010x}, not in the reference"
+        if self.stores != stores:
+            return f"stores {self.stores}, reference {stores}"
+        return None
+
+    def run(self, max_instructions=None):
+        """
+            Run until the program ends or max_instructions have executed.
+            Returns the number of instructions compared. The log ending
+            before the program or going on after it is a divergence, and so
+            is a log that never reaches the simulator's first pc."""
+        cpu = self.cpu
+        commit = next(self.commits, None)
+        while commit is not None and commit[0] != cpu.pc:
+            commit = next(self.commits, None)  # boot ROM
+        if commit is None:
+            raise self.diverged(cpu.pc, f"the reference never reaches pc {cpu.pc:#010x}")
+        executed = 0
+        while commit is not None and not cpu.halted and (max_instructions is None or executed < max_instructions):
+            if executed % INTERRUPT_POLL_INTERVAL == 0:
+                cpu.check_interrupts()
+            pc = cpu.pc
+            before = list(cpu.regs)
+            self.stores.clear()
+            if cpu.step():
+                cpu.instret += 1  # as in run(), the instruction that ends the program is not counted
+            else:
+                cpu.halted = True
+            executed += 1
+            reason = self.check(pc, before, commit)
+            if reason is not None:
+                raise self.diverged(pc, reason, commit[3])
+            self.history.append(commit[3])
+            commit = next(self.commits, None)
+        if max_instructions is not None and executed == max_instructions:
+            return executed
+        if commit is None and not cpu.halted:
+            raise self.diverged(cpu.pc, "the reference ended, the simulator did not")
+        if commit is not None:
+            raise self.diverged(cpu.pc, "the simulator ended, the reference did not", commit[3])
+        return executed
@@ -0,0 +1,88 @@
+from .params import *
+from .csr import register_csr
+from .rv_exception import RVException, ExceptionType
+from .rv_enum import PrivilegeLevel
+
+class Counters:
+    """
+        cycle, time, instret and hpmcounter3..31 of one hart. Nothing here is
+        bumped per instruction: cycle and instret are derived from
+        CPU.retired() when read, time from mtime, and the hpm counters from
+        event tallies the CPU only collects while some mhpmevent selects them.
+        Software writes are kept as offsets from the derived value.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.offsets = [0] * NUM_COUNTERS
+        self.selectors = [HPM_EVENT_NONE] * NUM_COUNTERS  # mhpmevent per counter
+        self.events = [0] * NUM_HPM_EVENTS  # tally per event id
+
+    def base(self, index):
+        if index == 1:
+            return self.cpu.mtime()
+        if index < 3:
+            return self.cpu.retired()  # one cycle per instruction
+        return self.events[self.selectors[index]]
+
+    def value(self, index):
+        return (self.base(index) + self.offsets[index]) & 0xFFFFFFFFFFFFFFFF
+
+    def write(self, index, data, high):
+        value = self.value(index)
+        if high:
+            value = (value & 0xFFFFFFFF) | (data << 32)
+        else:
+            value = (value & ~0xFFFFFFFF) | data
+        self.offsets[index] = value - self.base(index)
+
+    def select(self, index, event):
+        """
+            Point hpm counter index at another event, keeping its value"""
+        value = self.value(index)
+        self.selectors[index] = event if event < NUM_HPM_EVENTS else HPM_EVENT_NONE
+        self.offsets[index] = value - self.base(index)
+        self.cpu.update_event_hooks()
+
+    def enabled_events(self):
+        return set(self.selectors[3:]) - {HPM_EVENT_NONE}
+
+def counter_enabled(csr, index, privilege):
+    """
+        User-level counter reads below machine mode need the counter's bit in
+        mcounteren, and in user mode also in scounteren."""
+    if privilege < PrivilegeLevel.MACHINE.value and not (csr.csrs[MCOUNTEREN] >> index) & 0x1:
+        return False
+    if privilege < PrivilegeLevel.SUPERVISOR.value and not (csr.csrs[SCOUNTEREN] >> index) & 0x1:
+        return False
+    return True
+
+def counter_hooks(addr, index, high):
+    def read(csr, privilege):
+        if not counter_enabled(csr, index, privilege):
+            raise RVException(ExceptionType.ILLEGAL_INSTRUCTION, addr)
+        value = csr.cpu.counters.value(index)
+        return value >> 32 if high else value & 0xFFFFFFFF
+
+    def write(csr, data):
+        csr.cpu.counters.write(index, data, high)
+    return read, write
+
+def event_hooks(index):
+    def read(csr, privilege):
+        return csr.cpu.counters.selectors[index]
+
+    def write(csr, data):
+        csr.cpu.counters.select(index, data)
+    return read, write
+
+for index in range(NUM_COUNTERS):
+    for low, high in ((CYCLE, CYCLEH), (MCYCLE, MCYCLEH)):
+        if index == 1 and low == MCYCLE:
+            continue  # time has no machine-mode counterpart
+        for addr, is_high in ((low + index, False), (high + index, True)):
+            read, write = counter_hooks(addr, index, is_high)
+            register_csr(addr, read_hook=read, write_hook=write)
+for index in range(3, NUM_COUNTERS):
+    read, write = event_hooks(index)
+    register_csr(MHPMEVENT3 + index - 3, read_hook=read, write_hook=write)
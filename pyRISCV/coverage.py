@@ -0,0 +1,144 @@
+import struct
+from bisect import bisect_right
+from .params import *
+
+# Code coverage as one bit per halfword of DRAM, set for the first halfword
+# of every instruction that executed. Bits are set when an entry is added to
+# the decode cache rather than when it runs, so a covered run costs one call
+# per decoded entry (an instruction or a fused pair, covering both) and
+# nothing per instruction executed. A bulk loop marks its first instruction
+# when decoded and its whole body each time it actually runs in bulk, as it
+# may fall back to stepping the loop instead.
+#
+# Bitmaps from separate runs or processes merge by OR-ing them together. The
+# file format is COVERAGE_MAGIC, the base address and the number of bytes
+# covered as two little-endian words, then the bitmap.
+
+COVERAGE_MAGIC = b"RVCOV\x01"
+HEADER_FORMAT = "<6sII"
+
+def instructions(data, start, end, base=DRAM_BASE):
+    """
+        Addresses of the instructions from start up to end in data, which
+        holds memory from base"""
+    pc = start
+    while pc < end:
+        index = pc - base
+        if index < 0 or index >= len(data):
+            return
+        yield pc
+        pc += 4 if data[index] & 0x3 == 0x3 else 2
+
+class Coverage:
+    """
+        Executed pcs, with a per-function report when given symbols. Attach
+        with ``cpu.attach_coverage(Coverage())``; several harts may share one.
+    """
+
+    def __init__(self, base=DRAM_BASE, size=DRAM_SIZE):
+        self.base = base
+        self.size = size
+        self.bitmap = bytearray(size >> 4)
+        self.data = None  # memory the pcs were executed from, to find instruction boundaries
+        self.image_end = base  # end of the loaded program, where the last function stops at the latest
+
+    def hit(self, pc, length):
+        """
+            Mark the instructions from pc up to pc + length as executed"""
+        bitmap = self.bitmap
+        index = (pc - self.base) >> 1
+        if index < 0 or index >= self.size >> 1:
+            return  # outside the covered memory, e.g. a fault fetching from MMIO
+        bitmap[index >> 3] |= 1 << (index & 0x7)
+        if length > 4 or (length == 4 and self.data[pc - self.base] & 0x3 != 0x3):
+            for covered in instructions(self.data, pc, pc + length, self.base):
+                index = (covered - self.base) >> 1
+                bitmap[index >> 3] |= 1 << (index & 0x7)
+
+    def is_hit(self, pc):
+        index = (pc - self.base) >> 1
+        if index < 0 or index >= self.size >> 1:
+            return False
+        return bool(self.bitmap[index >> 3] >> (index & 0x7) & 0x1)
+
+    def addresses(self):
+        """
+            Executed pcs in ascending order"""
+        base = self.base
+        for position, byte in enumerate(self.bitmap):
+            while byte:
+                bit = (byte & -byte).bit_length() - 1
+                yield base + (((position << 3) | bit) << 1)
+                byte &= byte - 1
+
+    def merge(self, other):
+        """
+            Add the pcs executed in other, e.g. by another process"""
+        if (other.base, other.size) != (self.base, self.size):
+            raise ValueError("coverage of different memory ranges")
+        merged = int.from_bytes(self.bitmap, "little") | int.from_bytes(other.bitmap, "little")
+        self.bitmap[:] = merged.to_bytes(len(self.bitmap), "little")
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, COVERAGE_MAGIC, self.base, self.size))
+            f.write(self.bitmap)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            contents = f.read()
+        header = struct.calcsize(HEADER_FORMAT)
+        magic, base, size = struct.unpack_from(HEADER_FORMAT, contents)
+        if magic != COVERAGE_MAGIC or len(contents) != header + (size >> 4):
+            raise ValueError(f"{path} is not a coverage file")
+        coverage = cls(base, size)
+        coverage.bitmap[:] = contents[header:]
+        return coverage
+
+    def use_program(self, elf):
+        """
+            Take instruction boundaries from an ELF's segments, to report on
+            a coverage loaded from a file rather than attached to a CPU."""
+        self.data = bytearray(self.size)
+        for vaddr, contents, memsz in elf.segments:
+            self.data[vaddr - self.base:vaddr - self.base + len(contents)] = contents
+            self.image_end = max(self.image_end, vaddr + memsz)
+
+    def export(self, path):
+        """
+            Write the executed pcs one hex address per line, the input
+            addr2line and disassembler coverage plugins take."""
+        with open(path, "w") as f:
+            f.writelines(f"{pc:#010x}\n" for pc in self.addresses())
+
+    def functions(self, symbols, sizes=None):
+        """
+            {function: (instructions executed, instructions)} for symbols
+            (name -> address, e.g. ELF(data).functions). A function without
+            a size in sizes extends to the next symbol."""
+        sizes = sizes or {}
+        symbols = sorted((address, name) for name, address in symbols.items())
+        addresses = [address for address, _ in symbols]
+        functions = {}
+        for address, name in symbols:
+            end = address + sizes[name] if name in sizes else None
+            if end is None:
+                following = bisect_right(addresses, address)
+                end = addresses[following] if following < len(addresses) else self.image_end
+            pcs = list(instructions(self.data, address, end, self.base))
+            functions[name] = (sum(1 for pc in pcs if self.is_hit(pc)), len(pcs))
+        return functions
+
+    def report(self, symbols, sizes=None):
+        lines = []
+        functions = self.functions(symbols, sizes)
+        executed = sum(hit for hit, _ in functions.values())
+        total = sum(count for _, count in functions.values())
+        called = sum(1 for hit, _ in functions.values() if hit)
+        percent = 100.0 * executed / total if total else 0.0
+        lines.append(f"{called}/{len(functions)} functions hit, {executed}/{total} instructions ({percent:.1f}%)")
+        for name, (hit, count) in sorted(functions.items(), key=lambda item: (-item[1][0], item[0])):
+            percent = 100.0 * hit / count if count else 0.0
+            lines.append(f"  {name}: {hit}/{count} instructions ({percent:.1f}%){'' if hit else ', missed'}")
+        return lines
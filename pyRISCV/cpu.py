@@ -1,11 +1,44 @@
 import logging
+from operator import length_hint
 from .params import *
 from .bus import BUS
+from .config import DEFAULT_CONFIG
 from .csr import Csr
-from .instruction_executor import InstructionExecutor
+from .counters import Counters
+from .rvc import expand
+from .fusion import FUSION_FIRST, fuse
+from .idiom import IDIOM_FIRST, MAX_IDIOM_BODY, recognize
+from .instruction_executor import InstructionExecutor, to_signed
+from .checkpoint import Checkpoint, capture_state, restore_state
 from .rv_exception import RVException, ExceptionType
 from .rv_enum import PrivilegeLevel
 
+class TrapTarget:
+    """
+        The CSRs and status fields a trap into one privilege level writes,
+        worked out once rather than on every trap.
+    """
+    __slots__ = ("privilege", "status", "tvec", "epc", "cause", "tval",
+                 "ie_mask", "ie_shift", "pie_shift", "pp_shift", "clear_mask")
+
+    def __init__(self, privilege, status, tvec, epc, cause, tval, ie_mask, ie_shift, pie_mask, pie_shift, pp_mask, pp_shift):
+        self.privilege = privilege
+        self.status = status
+        self.tvec = tvec
+        self.epc = epc
+        self.cause = cause
+        self.tval = tval
+        self.ie_mask = ie_mask
+        self.ie_shift = ie_shift
+        self.pie_shift = pie_shift
+        self.pp_shift = pp_shift
+        self.clear_mask = ~(ie_mask | pie_mask | pp_mask)
+
+M_TRAP = TrapTarget(PrivilegeLevel.MACHINE, MSTATUS, MTVEC, MEPC, MCAUSE, MTVAL,
+                    MASK_MIE, 3, MASK_MPIE, 7, MASK_MPP, 11)
+S_TRAP = TrapTarget(PrivilegeLevel.SUPERVISOR, MSTATUS, STVEC, SEPC, SCAUSE, STVAL,
+                    MASK_SIE, 1, MASK_SPIE, 5, MASK_SPP, 8)
+
 class CPU(object):
 
     RVABI = [
@@ -15,16 +48,206 @@ class CPU(object):
         "s8", "s9", "s10", "s11", "t3", "t4", "t5", "t6",
     ]
 
-    instructionExecutor = InstructionExecutor()
-
-    def __init__(self, program):
-        self.pc = DRAM_BASE  # set program counter to start of DRAM
+    def __init__(self, program, hartid=0, bus=None, config=None):
+        self.bus = BUS(program, config=config or DEFAULT_CONFIG) if bus is None else bus
+        self.config = self.bus.config
+        self.pc = self.config.dram_base  # set program counter to start of DRAM
         self.regs = [0] * 32
-        self.bus = BUS(program)
-        
-        self.regs[2] = DRAM_END  # set stack pointer to end of DRAM
-        self.csr = Csr()
+        self.regs[2] = self.config.dram_end  # set stack pointer to end of DRAM
+        self.regs[10] = hartid  # pass hart id in a0, as boot ROMs do
+        self.instructionExecutor = InstructionExecutor(self.config.extensions)
+        self.compressed = "C" in self.config.extensions  # decode 16-bit instructions
+        self.csr = Csr(self)
+        self.csr.csrs[MHARTID] = hartid  # read-only to software
+        self.csr.csrs[MISA] = self.config.misa
+        self.hartid = hartid
         self.privilegeLevel = PrivilegeLevel.MACHINE
+        self.reserved_value = None  # value observed by the last LR
+        self.halted = False
+        self.exit_code = None  # status passed to the exit syscall
+        self.syscalls = None  # SyscallProxy handling ecalls on the host, if any
+        self.counters = Counters(self)
+        self.count_traps = False
+        self.count_branches = False
+        self.next_pc = self.pc + 4  # address after the executing instruction
+        self.decode_cache = {}  # pc -> (handler, inst, length)
+        self.covered = {}  # pc inside a fused or bulk entry -> pc of that entry
+        self.bus.dram.code_written = self.invalidate_decoded
+        self.instret = 0  # instructions retired before the current run() chunk
+        self.fused = 0  # second halves of fused pairs, retired without a loop iteration
+        self.fuse_pairs = self.config.engine == "fast"  # let decode() fuse common instruction pairs
+        self.bulk = 0  # instructions retired by loops executed in bulk, less one per loop
+        self.recognize_idioms = self.config.engine == "fast"  # let decode() run copy/fill/scan loops in bulk
+        self.intercepts = {}  # pc -> builder of a native handler for the function there
+        self.caches = None  # CacheHierarchy fed by every fetch, load and store, if attached
+        self.branch_profiler = None  # BranchProfiler fed by every jump and branch, if attached
+        self.timing = None  # TimingModel fed by every control transfer and trap, if attached
+        self.coverage = None  # Coverage marked with every decoded entry, if attached
+        self.dispatch_hook = None  # called with (cpu, handler, inst) before every decoded entry runs, if attached
+        self.transaction = None  # Checkpoint opened by begin(), collecting the pages written since
+        self.budget = iter(())  # iterator run() pulls one item from per instruction
+        self.budget_size = 0  # length of budget, 0 outside run()
+        self.bus.clint.time_source = self.mtime
+        self.bus.events.time_source = self.retired
+
+    def retired(self):
+        """
+            Instructions retired so far. Within run() this is derived from how
+            far the loop has drained its budget iterator, so retiring an
+            instruction costs nothing beyond the loop itself."""
+        if self.budget_size:
+            return self.instret + self.fused + self.bulk + self.budget_size - length_hint(self.budget) - 1
+        return self.instret + self.fused + self.bulk
+
+    def mtime(self):
+        return self.retired() // INSTRUCTIONS_PER_TICK
+
+    def update_event_hooks(self):
+        """
+            Install counting versions of load and store, and of branch handlers
+            in the decode cache, only while an mhpmevent selects their event,
+            so unmonitored runs pay nothing."""
+        enabled = self.counters.enabled_events()
+        for name, event in (("load", HPM_EVENT_LOAD), ("store", HPM_EVENT_STORE)):
+            if event in enabled:
+                setattr(self, name, getattr(self, name + "_counted"))
+            else:
+                self.__dict__.pop(name, None)
+        self.count_branches = HPM_EVENT_BRANCH_TAKEN in enabled
+        self.flush_decode_cache()  # re-decode branches and bulk loops for the new events
+        self.count_traps = HPM_EVENT_TRAP in enabled
+
+    def load_counted(self, address, size):
+        self.counters.events[HPM_EVENT_LOAD] += 1
+        return CPU.load(self, address, size)
+
+    def store_counted(self, address, value, size):
+        self.counters.events[HPM_EVENT_STORE] += 1
+        CPU.store(self, address, value, size)
+
+    def count_taken(self, handler):
+        events = self.counters.events
+
+        def counted(cpu, inst):
+            pc = handler(cpu, inst)
+            if pc != cpu.next_pc:
+                events[HPM_EVENT_BRANCH_TAKEN] += 1
+            return pc
+        return counted
+
+    def attach_caches(self, caches):
+        """
+            Feed a CacheHierarchy from every instruction fetch, load and store,
+            or stop with None. Fusion, bulk loops and intercepts are not
+            decoded while caches are attached, as they skip accesses."""
+        if caches is not None:
+            caches.cpu = self
+            caches.use_dram(self.bus.dram.base, self.bus.dram.end)
+        self.caches = caches
+        self.bus.attach_caches(caches)
+        self.flush_decode_cache()
+
+    def attach_branch_profiler(self, profiler):
+        """
+            Feed a BranchProfiler from every branch, jal and jalr, or stop with
+            None. As with caches, fused pairs and bulk loops are not decoded
+            while it is attached."""
+        if self.branch_profiler is not None:
+            self.branch_profiler.flush()
+        self.branch_profiler = profiler
+        self.flush_decode_cache()
+
+    def attach_timing(self, model):
+        """
+            Feed a TimingModel from every control transfer and trap, or stop
+            with None."""
+        if self.timing is not None:
+            self.timing.flush()
+        self.timing = model
+        self.flush_decode_cache()
+
+    def attach_coverage(self, coverage):
+        """
+            Mark every instruction executed from now on in a Coverage, or stop
+            with None. Instructions are marked as they are decoded, so
+            coverage costs nothing once the code is in the decode cache."""
+        if coverage is not None:
+            coverage.data = self.bus.dram.data
+            coverage.image_end = self.bus.dram.base + self.bus.dram.image_size
+        self.coverage = coverage
+        self.flush_decode_cache()
+
+    def attach_dispatch_hook(self, hook):
+        """
+            Call hook(cpu, handler, inst) before every decoded entry runs, a
+            fused pair or bulk loop being one entry with its own handler, or
+            stop with None. Used by the fuzzer to measure which handlers ran."""
+        self.dispatch_hook = hook
+        self.flush_decode_cache()
+
+    def dispatched(self, handler):
+        hook = self.dispatch_hook
+
+        def hooked(cpu, inst):
+            hook(cpu, handler, inst)
+            return handler(cpu, inst)
+        return hooked
+
+    def observe(self, entry, pc):
+        """
+            entry with its handler wrapped for the attached cache model,
+            branch profiler and timing model"""
+        handler, inst, length = entry
+        if self.branch_profiler is not None:
+            handler = self.branch_profiler.wrap(handler, pc, inst, length)
+        if self.timing is not None:
+            handler = self.timing.wrap(handler, pc, inst, length)
+        if self.caches is not None:
+            handler = self.fetch_cached(handler, pc)
+        return (handler, inst, length)
+
+    def fetch_cached(self, handler, pc):
+        fetch = self.caches.fetch
+
+        def fetched(cpu, inst):
+            fetch(pc)
+            return handler(cpu, inst)
+        return fetched
+
+    def begin(self):
+        """
+            Open a transaction: from here on, the first store to each DRAM
+            page saves its old contents, so rollback() costs what the run
+            touched rather than the size of memory."""
+        dram = self.bus.dram
+        if dram.page_saver is not None:
+            raise RuntimeError("DRAM is already journaled by a transaction or checkpoints")
+        self.transaction = Checkpoint(self.retired(), capture_state(self))
+        dram.page_saver = self.save_page
+        dram.save_all()
+
+    def save_page(self, page):
+        self.transaction.pages[page] = self.bus.dram.page(page)
+
+    def rollback(self):
+        """
+            Return to the state at begin(). The transaction stays open, so a
+            fuzzer can run and roll back any number of inputs."""
+        dram = self.bus.dram
+        transaction = self.transaction
+        for page, contents in transaction.pages.items():
+            dram.restore_page(page, contents)
+        transaction.pages = {}
+        restore_state(self, transaction.state)
+        dram.save_all()
+
+    def commit(self):
+        """
+            Keep the changes made since begin() and close the transaction"""
+        dram = self.bus.dram
+        dram.unsave_all()
+        dram.page_saver = None
+        self.transaction = None
 
     def load(self, address, size):
         address &= 0xFFFFFFFF  # make sure address is unsigned 32-bit
@@ -34,74 +257,346 @@ class CPU(object):
         address &= 0xFFFFFFFF  # make sure address is unsigned 32-bit
         self.bus.store(address, value, size)
 
+    def load_reserved(self, address):
+        address &= 0xFFFFFFFF
+        reservations = self.bus.reservations
+        with reservations.lock:
+            value = self.bus.load(address, 32)
+            reservations.reserve(self.hartid, address)
+        self.reserved_value = value
+        return value
+
+    def store_conditional(self, address, value):
+        """
+            Returns True if the store was performed. Plain stores from other
+            harts break the reservation (DRAM.store calls
+            Reservations.written), so A->B->A between LR and SC fails too.
+            They check the table without the lock, so the word must also
+            still hold the value seen by LR, which catches the one store
+            that can land between that check and this SC."""
+        address &= 0xFFFFFFFF
+        reservations = self.bus.reservations
+        with reservations.lock:
+            success = reservations.take(self.hartid, address) \
+                and self.bus.load(address, 32) == self.reserved_value
+            if success:
+                self.bus.store(address, value, 32)
+                reservations.invalidate(self.hartid, address)
+        return success
+
+    def amo(self, address, op):
+        """
+            Atomically replace the word at address with op(old) and return old"""
+        address &= 0xFFFFFFFF
+        reservations = self.bus.reservations
+        with reservations.lock:
+            old = self.bus.load(address, 32)
+            self.bus.store(address, op(old) & 0xFFFFFFFF, 32)
+            reservations.invalidate(self.hartid, address)
+        return old
+
     def update_pc(self):
-        return self.pc + 4
+        return self.next_pc
 
     def fetch(self):
+        """
+            The instruction at pc: the 16-bit parcel of a compressed
+            instruction, otherwise all 32 bits."""
+        pc = self.pc
+        if pc & 0x1:
+            raise RVException(ExceptionType.INSTRUCTION_ADDRESS_MISALIGNED, pc)
         try:
-            inst = self.load(self.pc, 32)
+            inst = self.bus.fetch(pc, 16)
+            if inst & 0x3 == 0x3:
+                inst |= self.bus.fetch(pc + 2, 16) << 16
             return inst
         except RVException:
-            logging.warning("Error fetching instruction at address 0x{:08x}".format(self.pc))
+            if logging.root.isEnabledFor(logging.WARNING):
+                logging.warning("Error fetching instruction at address 0x{:08x}".format(self.pc))
             raise RVException(ExceptionType.INSTRUCTION_ACCESS_FAULT, self.pc)
-    
+
+    def decode_single(self):
+        """
+            Fetch and decode the instruction at pc into (handler, inst, length),
+            with compressed instructions expanded to their 32-bit form.
+            Returns None for a zero instruction (end of program)."""
+        raw = self.fetch()
+        if raw == 0:
+            return None
+        inst, length = raw, 4
+        if raw & 0x3 != 0x3:
+            inst, length = expand(raw) if self.compressed else None, 2
+        handler = None if inst is None else self.instructionExecutor.decode(inst)
+        if handler is None:
+            inst = raw  # e.g. a reserved or disabled compressed encoding, whose opcode matches nothing
+            def handler(cpu, inst):
+                return cpu.exception(ExceptionType.ILLEGAL_INSTRUCTION.value, raw)
+        elif self.count_branches and inst & 0x7F == 0x63:
+            handler = self.count_taken(handler)
+        return (handler, inst, length)
+
+    def decode(self):
+        """
+            Decode the instruction at pc, fused with the next one where they
+            form a known idiom or replaced by an intercepted function, and
+            add the entry to the decode cache. Returns the entry, or None at the end of the program."""
+        pc = self.pc
+        entry = self.decode_single()
+        if entry is None:
+            return None
+        op = entry[1] & 0x7F
+        single = entry
+        intercept = self.intercepts.get(pc, None)
+        covered = None  # bytes of the entry marked in the coverage now, all of it unless it is a bulk loop
+        if self.caches is not None or self.branch_profiler is not None or self.timing is not None:
+            entry = self.observe(entry, pc)  # every instruction runs on its own to be seen
+        elif intercept is not None and not self.counters.enabled_events():
+            entry = (intercept(entry[0]), entry[1], entry[2])
+        elif self.recognize_idioms and op in IDIOM_FIRST and not self.counters.enabled_events():
+            entry = self.recognize_loop(entry) or entry
+            if entry is not single:
+                covered = single[2]  # the body is marked by the bulk handler when it runs in bulk
+        if entry is single and self.fuse_pairs and op in FUSION_FIRST:
+            entry = self.fuse_next(entry) or entry
+        if self.dispatch_hook is not None:
+            entry = (self.dispatched(entry[0]), entry[1], entry[2])
+        self.decode_cache[pc] = entry
+        self.bus.dram.mark_code(pc)
+        if entry[2] != single[2]:
+            self.cover(pc, entry[2])
+        if self.coverage is not None:
+            self.coverage.hit(pc, entry[2] if covered is None else covered)
+        return entry
+
+    def decode_at(self, pc):
+        """
+            decode_single() at another pc, or None if it cannot be decoded"""
+        saved = self.pc
+        self.pc = pc
+        try:
+            entry = self.decode_single()
+            return entry  # None at the end of the program
+        except RVException:
+            return None  # e.g. past the end of memory, leave it to the step that gets there
+        finally:
+            self.pc = saved
+
+    def cover(self, pc, length):
+        """
+            Record that the entry at pc also spans the instructions up to
+            pc + length, so stores to any of them drop it."""
+        dram = self.bus.dram
+        for covered in range(pc + 2, pc + length, 2):
+            self.covered[covered] = pc
+            dram.mark_code(covered)
+
+    def fuse_next(self, first):
+        """
+            Decode the instruction after first and return a fused entry for
+            the pair, or None if they do not form a known idiom. The second
+            instruction keeps its own entry for jumps and traps landing on it."""
+        pc = self.pc
+        second = self.decode_at(pc + first[2])
+        if second is None:
+            return None
+        handler = fuse(first, second, pc)
+        if handler is None:
+            return None
+        return (handler, first[1], first[2] + second[2])
+
+    def recognize_loop(self, first):
+        """
+            Decode a short loop starting at pc and return an entry running all
+            of its remaining iterations in bulk if it is a copy, fill or scan
+            loop, else None."""
+        pc = self.pc
+        body = [first]
+        end = pc + first[2]
+        while len(body) < MAX_IDIOM_BODY and body[-1][1] & 0x7F != 0x63:
+            entry = self.decode_at(end)
+            if entry is None:
+                return None
+            body.append(entry)
+            end += entry[2]
+        handler = recognize(pc, body, first[0])
+        if handler is None:
+            return None
+        return (handler, first[1], end - pc)
+
+    def invalidate_decoded(self, address, length):
+        """
+            Drop decoded instructions overlapping a store to code, including
+            fused and bulk entries spanning them"""
+        cache = self.decode_cache
+        for pc in range((address - 2) & ~0x1, address + length, 2):
+            cache.pop(pc, None)
+            head = self.covered.pop(pc, None)
+            if head is not None:
+                cache.pop(head, None)
+
+    def flush_decode_cache(self):
+        self.decode_cache.clear()
+        self.covered.clear()
+
     def execute(self, inst):
-        exe = self.instructionExecutor.execute(self, inst)
-        return exe
+        """
+            Execute an instruction as returned by fetch(), without the decode
+            cache."""
+        length = 4
+        if inst & 0x3 != 0x3:
+            parcel, inst, length = inst, expand(inst) if self.compressed else None, 2
+            if inst is None:
+                return self.exception(ExceptionType.ILLEGAL_INSTRUCTION.value, parcel)
+        self.next_pc = self.pc + length
+        return self.instructionExecutor.execute(self, inst)
+
+    def step(self):
+        """
+            Execute one instruction, entering the trap handler on exceptions.
+            Returns False when a zero instruction (end of program) is fetched
+            or the program exits through a syscall.
+            Only instructions executed through run() count as retired."""
+        try:
+            entry = self.decode_cache.get(self.pc, None)
+            if entry is None:
+                entry = self.decode()
+                if entry is None:
+                    return False
+            handler, inst, length = entry
+            self.regs[0] = 0
+            self.next_pc = self.pc + length
+            self.pc = handler(self, inst)
+        except RVException as e:
+            self.handle_exception(e)
+        return not self.halted
+
+    def run(self, max_instructions=None):
+        """
+            Run until the program ends or max_instructions have executed,
+            checking for interrupts every INTERRUPT_POLL_INTERVAL instructions.
+            Returns the number of instructions executed."""
+        start = self.retired()
+        executed = 0
+        step = self.step
+        events = self.bus.events
+        while not self.halted and (max_instructions is None or executed < max_instructions):
+            chunk = INTERRUPT_POLL_INTERVAL
+            if max_instructions is not None:
+                chunk = min(chunk, max_instructions - executed)
+            self.check_interrupts()
+            chunk = max(1, min(chunk, events.next - self.retired()))  # stop at the next device event
+            budget = self.budget = iter(range(chunk))
+            self.budget_size = chunk
+            completed = False
+            try:
+                for _ in budget:
+                    if not step():
+                        self.halted = True
+                        break
+                else:
+                    completed = True
+            finally:
+                self.instret += chunk if completed else chunk - length_hint(budget) - 1
+                self.budget_size = 0
+            if self.branch_profiler is not None:
+                self.branch_profiler.flush()
+            if self.timing is not None:
+                self.timing.flush()
+            executed = self.retired() - start
+        return executed
+
+    def check_interrupts(self):
+        """
+            Run the device events due, latch the CLINT msip bit and the
+            external interrupt line into mip and take the highest priority
+            pending interrupt if it is enabled. Returns True if one was taken."""
+        csrs = self.csr.csrs
+        bus = self.bus
+        if bus.events.next <= self.retired():
+            bus.events.run(self.retired())
+        if bus.clint.msip(self.hartid):
+            csrs[MIP] |= MASK_MSIP
+        else:
+            csrs[MIP] &= ~MASK_MSIP
+        if bus.external_interrupt():
+            csrs[MIP] |= MASK_MEIP
+        else:
+            csrs[MIP] &= ~MASK_MEIP
+        pending = csrs[MIP] & csrs[MIE]
+        if not pending:
+            return False
+        level = self.privilegeLevel.value
+        m_enabled = level < PrivilegeLevel.MACHINE.value or csrs[MSTATUS] & MASK_MIE
+        s_enabled = level < PrivilegeLevel.SUPERVISOR.value or \
+            (level == PrivilegeLevel.SUPERVISOR.value and csrs[MSTATUS] & MASK_SIE)
+        for code in IRQ_PRIORITY:
+            bit = 1 << code
+            if not pending & bit:
+                continue
+            if s_enabled if csrs[MIDELEG] & bit else m_enabled:
+                self.handle_interrupt(code)
+                return True
+        return False
 
     def dump_regs(self):
         print("------------------------------------------")
         print("Registers:\tDecimal\t\t\tHex")
         for i in range(32):
-            dec = self.regs[i]
-            print("x{} ({}):\t{:#10d}\t\t{:#010x}".format(i, self.RVABI[i], dec, dec))
+            value = self.regs[i]
+            print("x{} ({}):\t{:#10d}\t\t{:#010x}".format(i, self.RVABI[i], to_signed(value, 32), value))
 
     def dump_pc(self):
         print("------------------------------------------")
         print("PC:\t\t{}\t\t{}".format(self.pc, hex(self.pc)))
 
     def handle_exception(self, exception):
-        logging.warning("Exception occurred: {}".format(exception))
-        pc = self.pc
-        privaledgeLevel = self.privilegeLevel
-        cause = exception.get_type()
-        trap_in_s_mode = (privaledgeLevel.value <= PrivilegeLevel.SUPERVISOR.value) and self.csr.is_medelegated(cause.value)
-        if trap_in_s_mode:
-            logging.warning("Exception is delegated to supervisor mode")
-            self.privilegeLevel = PrivilegeLevel.SUPERVISOR
-            STATUS = SSTATUS
-            TVEC = STVEC
-            CAUSE = SCAUSE
-            TVAL = STVAL
-            EPC = SEPC
-            MASK_PIE = MASK_SPIE
-            pie_i = 5
-            MASK_IE = MASK_SIE
-            ie_i = 1
-            MASK_PP = MASK_SPP
-            pp_i = 8
-        else:
-            self.privilegeLevel = PrivilegeLevel.MACHINE
-            STATUS = MSTATUS
-            TVEC = MTVEC
-            CAUSE = MCAUSE
-            TVAL = MTVAL
-            EPC = MEPC
-            MASK_PIE = MASK_MIE
-            pie_i = 7
-            MASK_IE = MASK_MIE
-            ie_i = 3
-            MASK_PP = 0
-            pp_i = 11
-        
-        self.pc = self.csr.load(TVEC) & 0xFFFFFFFC  # set PC to base address of vector
-        self.csr.store(EPC, pc)  # set EPC to faulting instruction address
-        self.csr.store(CAUSE, cause)  # set CAUSE to exception type
-        self.csr.store(TVAL, exception.get_value())  # set TVAL to exception value
-
-        status = self.csr.load(STATUS)  # get current status
-        ie = (status & MASK_IE) >> ie_i  # get IE bit
-        status = (status & ~MASK_PIE) | (ie << pie_i)  # set PIE bit if IE bit is set
-        status &= ~MASK_IE  # clear IE bit
-        status = (status & ~MASK_PP) | (privaledgeLevel.value << pp_i)  # set PP to current privilege level
-        self.csr.store(STATUS, status)  # update status with new IE and PP bits
\ No newline at end of file
+        """
+            Take the trap for an RVException raised while executing. Only
+            bus faults (access faults on loads, stores and fetches) still
+            arrive this way; instruction handlers signal everything else
+            through exception() without raising."""
+        if logging.root.isEnabledFor(logging.WARNING):
+            logging.warning("Exception occurred: {}".format(exception))
+        self.exception(exception.get_type().value, exception.get_value())
+
+    def exception(self, cause, tval):
+        """
+            Take a synchronous exception without raising one. Instruction
+            handlers return the result, the trap handler address, as their
+            next pc."""
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("Exception {} (tval {:#010x}) on hart {}".format(cause, tval, self.hartid))
+        return self.trap(cause, tval, (self.csr.csrs[MEDELEG] >> cause) & 0x1)
+
+    def handle_interrupt(self, code):
+        if logging.root.isEnabledFor(logging.INFO):
+            logging.info("Interrupt {} taken on hart {}".format(code, self.hartid))
+        self.trap(INTERRUPT_BIT | code, 0, self.csr.is_midelegated(code))
+
+    def trap(self, cause, tval, delegated):
+        """
+            Enter the trap handler for cause, writing the CSR slots directly.
+            Traps taken in S or U mode go to S mode if delegated. Sets and
+            returns the new pc."""
+        if self.count_traps:
+            self.counters.events[HPM_EVENT_TRAP] += 1
+        previous = self.privilegeLevel
+        target = S_TRAP if delegated and previous.value <= PrivilegeLevel.SUPERVISOR.value else M_TRAP
+        csrs = self.csr.csrs
+        self.privilegeLevel = target.privilege
+        tvec = csrs[target.tvec]
+        pc = tvec & 0xFFFFFFFC  # base address of the vector
+        if cause & INTERRUPT_BIT and tvec & 0x1:
+            pc += 4 * (cause & ~INTERRUPT_BIT)  # vectored mode
+        csrs[target.epc] = self.pc  # faulting instruction address
+        csrs[target.cause] = cause
+        csrs[target.tval] = tval & 0xFFFFFFFF
+        status = csrs[target.status]
+        ie = (status & target.ie_mask) >> target.ie_shift
+        # PIE takes IE, IE is cleared and PP records the previous privilege level
+        csrs[target.status] = (status & target.clear_mask) | (ie << target.pie_shift) \
+            | (previous.value << target.pp_shift)
+        if self.timing is not None:
+            self.timing.trapped(self.pc, pc)
+        self.pc = pc
+        return pc
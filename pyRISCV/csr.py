@@ -1,8 +1,70 @@
 from .params import *
+from .rv_exception import RVException, ExceptionType
+from .rv_enum import PrivilegeLevel
+
+class CsrDescriptor:
+    """
+        How one CSR address is accessed: the storage slot backing it, the
+        bits visible on read and changed on write, the lowest privilege
+        level allowed to access it, and optional hooks replacing the plain
+        slot access for CSRs with side effects or derived values.
+    """
+    __slots__ = ("slot", "read_mask", "write_mask", "privilege", "read_only", "read_hook", "write_hook")
+
+    def __init__(self, slot, read_mask, write_mask, privilege, read_only, read_hook, write_hook):
+        self.slot = slot
+        self.read_mask = read_mask
+        self.write_mask = write_mask
+        self.privilege = privilege
+        self.read_only = read_only
+        self.read_hook = read_hook
+        self.write_hook = write_hook
+
+CSR_TABLE = [None] * NUM_CSRS  # descriptor per CSR address, None when unimplemented
+
+def register_csr(addr, slot=None, read_mask=0xFFFFFFFF, write_mask=0xFFFFFFFF, read_hook=None, write_hook=None):
+    """
+        Add a CSR to the table. The privilege level and whether the CSR is
+        read-only follow from its address, as laid out by the privileged spec.
+        read_hook(csr, privilege) returns the value; write_hook(csr, data) stores it.
+    """
+    CSR_TABLE[addr] = CsrDescriptor(addr if slot is None else slot, read_mask, write_mask,
+                                    (addr >> 8) & 0x3, (addr >> 10) == 0x3, read_hook, write_hook)
+
+def read_sie(csr, privilege):
+    return csr.csrs[MIE] & csr.csrs[MIDELEG]
+
+def write_sie(csr, data):
+    csr.csrs[MIE] = (csr.csrs[MIE] & ~csr.csrs[MIDELEG]) | (data & csr.csrs[MIDELEG])
+
+def read_sip(csr, privilege):
+    return csr.csrs[MIP] & csr.csrs[MIDELEG]
+
+def write_sip(csr, data):
+    writable = csr.csrs[MIDELEG] & MASK_MIP_WRITABLE
+    csr.csrs[MIP] = (csr.csrs[MIP] & ~writable) | (data & writable)
+
+for addr in (MVENDORID, MARCHID, MIMPID, MHARTID):
+    register_csr(addr, write_mask=0)
+for addr in (MSTATUS, MEDELEG, MIDELEG, MIE, MTVEC, MCOUNTEREN, MSCRATCH, MEPC, MCAUSE, MTVAL):
+    register_csr(addr)
+register_csr(MISA, write_mask=0)  # WARL: writes are ignored
+register_csr(MIP, write_mask=MASK_MIP_WRITABLE)
+for i in range(4):
+    register_csr(PMPCFG0 + i)
+for i in range(16):
+    register_csr(PMPADDR0 + i)
+for addr in (STVEC, SCOUNTEREN, SSCRATCH, SEPC, SCAUSE, STVAL, SATP):
+    register_csr(addr)
+register_csr(SSTATUS, slot=MSTATUS, read_mask=MASK_SSTATUS, write_mask=MASK_SSTATUS)  # a restricted view of mstatus
+register_csr(SIE, read_hook=read_sie, write_hook=write_sie)
+register_csr(SIP, read_hook=read_sip, write_hook=write_sip)
 
 class Csr:
-    def __init__(self):
+    def __init__(self, cpu=None):
+        self.cpu = cpu  # lets hooks reach machine state beyond the CSRs
         self.csrs = [0] * NUM_CSRS
+        self.csrs[MISA] = MISA_VALUE
     
     def dump_csrs(self):
         print("-----------------------------")
@@ -17,28 +79,40 @@ class Csr:
         print("sepc: {:#010x}".format(self.load(SEPC)))
         print("scause: {:#010x}".format(self.load(SCAUSE)))
 
+    def read(self, addr, privilege):
+        """
+            CSR read by an instruction running at privilege; accesses to
+            unimplemented CSRs or from too low a privilege level trap.
+        """
+        desc = CSR_TABLE[addr]
+        if desc is None or privilege < desc.privilege:
+            raise RVException(ExceptionType.ILLEGAL_INSTRUCTION, addr)
+        if desc.read_hook is not None:
+            return desc.read_hook(self, privilege)
+        return self.csrs[desc.slot] & desc.read_mask
+
+    def write(self, addr, data, privilege):
+        """
+            CSR write by an instruction running at privilege; writes to
+            read-only CSRs trap as well.
+        """
+        desc = CSR_TABLE[addr]
+        if desc is None or privilege < desc.privilege or desc.read_only:
+            raise RVException(ExceptionType.ILLEGAL_INSTRUCTION, addr)
+        if desc.write_hook is not None:
+            desc.write_hook(self, data)
+            return
+        mask = desc.write_mask
+        self.csrs[desc.slot] = (self.csrs[desc.slot] & ~mask) | (data & mask)
+
     def load(self, addr):
-        if addr == SIE:
-            return self.csrs[MIE] & self.csrs[MIDELEG]
-        elif addr == SIP:
-            return self.csrs[MIP] & self.csrs[MIDELEG]
-        elif addr == SSTATUS:
-            return self.csrs[SSTATUS] & MASK_SSTATUS
-        else:
-            return self.csrs[addr]
+        return self.read(addr, PrivilegeLevel.MACHINE.value)
 
     def store(self, addr, data):
-        if addr == SIE:
-            self.csrs[MIE] = (self.csrs[MIE] & ~self.csrs[MIDELEG]) | (data & self.csrs[MIDELEG])
-        elif addr == SIP:
-            self.csrs[MIP] = (self.csrs[MIP] & ~self.csrs[MIDELEG]) | (data & self.csrs[MIDELEG])
-        elif addr == SSTATUS:
-            self.csrs[SSTATUS] = (self.csrs[SSTATUS] & ~MASK_SSTATUS) | (data & MASK_SSTATUS)
-        else:
-            self.csrs[addr] = data
+        self.write(addr, data, PrivilegeLevel.MACHINE.value)
 
     def is_medelegated(self, value):
         return ((self.csrs[MEDELEG] >> value) & 0x1) == 1
     
     def is_midelegated(self, cause):
-        return ((self.csrs[MIDELEG] >> cause) & 0x1) == 1
\ No newline at end of file
+        return ((self.csrs[MIDELEG] >> cause) & 0x1) == 1
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import argparse
+import logging
+import socketserver
+import multiprocessing
+from collections import OrderedDict
+from .params import *
+from .cpu import CPU
+from .config import MachineConfig
+from .elf import ELF, is_elf
+from .syscall import SyscallProxy
+
+# A long-running simulator for many short jobs. The daemon listens on a
+# Unix socket for one JSON object per line:
+#
+#   {"path": "prog.elf"} or {"program": "<base64>"}, and optionally
+#   "max_instructions", "input" (base64 bytes for the UART and fd 0), "memory"
+#   (MB), "isa", "engine" and "outputs", a list of exit_code, output,
+#   retired, pc and regs
+#
+# and answers each with one JSON object holding the outputs asked for,
+# "ok", and "latency", the seconds from reading the request to replying.
+# Jobs run in a pool of worker processes started up front. A worker keeps
+# an allocated machine per configuration, journaled with CPU.begin(), and
+# rolls it back after each job, so a job costs what it touches rather than
+# interpreter startup, imports and DRAM allocation.
+
+OUTPUTS = ("exit_code", "output", "retired", "pc", "regs")  # results a job may ask for
+machines = OrderedDict()  # (memory, isa, engine) -> CPU, per worker process
+
+def machine(memory, isa, engine):
+    """
+        The worker's machine for a configuration, allocated on first use"""
+    key = (memory, isa, engine)
+    cpu = machines.pop(key, None)
+    if cpu is None:
+        if len(machines) == DAEMON_MACHINES:
+            machines.popitem(last=False)
+        cpu = CPU(b"", config=MachineConfig(dram_size=memory << 20, extensions=isa, engine=engine))
+        cpu.begin()
+    machines[key] = cpu
+    return cpu
+
+def warm():
+    machine(DRAM_SIZE >> 20, "IMAC", "fast")
+
+def run_job(job):
+    """
+        Run one job on a warm machine and return its result"""
+    started = time.perf_counter()
+    try:
+        cpu = machine(job.get("memory", DRAM_SIZE >> 20), job.get("isa", "IMAC"), job.get("engine", "fast"))
+    except Exception as e:  # a configuration MachineConfig rejects
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    output = bytearray()
+    try:
+        stdin = bytearray(base64.b64decode(job.get("input", "")))
+        if "program" in job:
+            program = base64.b64decode(job["program"])
+        else:
+            with open(job["path"], "rb") as f:
+                program = f.read()
+        load(cpu, program)
+        cpu.bus.serial.feed(stdin)
+        cpu.bus.serial.store = lambda addr, value, size: output.append(value & 0xFF)
+        cpu.syscalls = proxy = SyscallProxy(cpu)
+        proxy.table[SYS_WRITE] = lambda fd, buf, count, *_: capture(proxy, output, fd, buf, count)
+        proxy.table[SYS_READ] = lambda fd, buf, count, *_: feed(proxy, stdin, fd, buf, count)
+        cpu.run(job.get("max_instructions", None))
+        result = {"ok": True, "exit_code": cpu.exit_code or 0, "output": output.decode(errors="replace"),
+                  "retired": cpu.retired(), "pc": cpu.pc, "regs": list(cpu.regs)}
+    except Exception as e:  # a broken program or request must not take the worker down
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        if cpu.syscalls is not None:
+            for fd in cpu.syscalls.fds.values():
+                os.close(fd)
+            cpu.syscalls = None
+        cpu.bus.serial.__dict__.pop("store", None)
+        cpu.rollback()
+    if result["ok"]:
+        result = {key: result[key] for key in ("ok",) + tuple(job.get("outputs", DAEMON_OUTPUTS))}
+    result["run_time"] = time.perf_counter() - started
+    return result
+
+def validate(job):
+    """
+        Raise ValueError unless job is a well-formed request"""
+    if not isinstance(job, dict) or ("path" not in job and "program" not in job):
+        raise ValueError("a job needs a path or a program")
+    for key in ("path", "program", "input", "isa", "engine"):
+        if key in job and not isinstance(job[key], str):
+            raise ValueError(f"{key} must be a string")
+    budget = job.get("max_instructions", None)
+    if budget is not None and (type(budget) is not int or budget < 0):
+        raise ValueError("max_instructions must be a non-negative integer")
+    if "memory" in job and (type(job["memory"]) is not int or job["memory"] <= 0):
+        raise ValueError("memory must be a positive number of megabytes")
+    outputs = job.get("outputs", DAEMON_OUTPUTS)
+    if not isinstance(outputs, (list, tuple)) or not set(outputs) <= set(OUTPUTS):
+        raise ValueError(f"outputs must be a list of {', '.join(OUTPUTS)}")
+
+def load(cpu, program):
+    dram = cpu.bus.dram
+    if is_elf(program):
+        ELF(program).load(cpu)
+    else:
+        dram.store_bytes(dram.base, program)
+        dram.image_size = len(program)
+
+def capture(proxy, output, fd, buf, count):
+    if fd in (1, 2):
+        output += proxy.dram.load_bytes(buf, count)
+        return count
+    return proxy.sys_write(fd, buf, count)
+
+def feed(proxy, stdin, fd, buf, count):
+    if fd == 0:
+        data = stdin[:count]
+        del stdin[:count]
+        proxy.dram.writable_bytes(buf, len(data))[:] = data
+        return len(data)
+    return proxy.sys_read(fd, buf, count)
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in iter(lambda: self.rfile.readline(DAEMON_MAX_REQUEST), b""):
+            received = time.perf_counter()
+            try:
+                job = json.loads(line)
+                validate(job)
+            except ValueError as e:
+                result = {"ok": False, "error": str(e)}
+            else:
+                try:
+                    result = self.server.pool.apply(run_job, (job,))
+                except Exception as e:  # raised in the worker, e.g. by a bug in the simulator
+                    result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            result["latency"] = time.perf_counter() - received
+            self.wfile.write(json.dumps(result).encode() + b"\n")
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        Serves jobs on a Unix socket at path with a pool of worker processes,
+        e.g. ``with Daemon(path) as daemon: daemon.serve_forever()``.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, workers=None):
+        if os.path.exists(path):
+            os.unlink(path)  # left over from a daemon that did not shut down
+        self.path = path
+        self.pool = multiprocessing.Pool(workers, initializer=warm)
+        super().__init__(path, Handler)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.terminate()
+        self.pool.join()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+def submit(path, jobs):
+    """
+        Send jobs to the daemon at path over one connection and return the
+        results in order"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        stream = connection.makefile("rwb")
+        results = []
+        for job in jobs:
+            stream.write(json.dumps(job).encode() + b"\n")
+            stream.flush()
+            results.append(json.loads(stream.readline()))
+        return results
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description="RISC-V simulation daemon")
+    commands = argparser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Run the daemon")
+    serve.add_argument("socket", type=str, help="Path of the Unix socket to listen on")
+    serve.add_argument("--workers", type=int, help="Worker processes, one per host CPU by default")
+    run = commands.add_parser("run", help="Run programs on a running daemon")
+    run.add_argument("socket", type=str, help="Path of the daemon's Unix socket")
+    run.add_argument("programs", type=str, nargs="+", help="Programs, sent as paths the daemon opens")
+    run.add_argument("--max-instructions", type=int, help="Instruction budget per program")
+    run.add_argument("--memory", type=int, default=DRAM_SIZE >> 20, help="Megabytes of DRAM")
+    run.add_argument("--isa", type=str, default="IMAC", help="ISA extensions to decode")
+    run.add_argument("--latency", action="store_true", help="Print each job's latency to stderr")
+    args = argparser.parse_args(argv)
+    if args.command == "serve":
+        with Daemon(args.socket, args.workers) as daemon:
+            try:
+                daemon.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+    jobs = [{"path": os.path.abspath(program), "max_instructions": args.max_instructions,
+             "memory": args.memory, "isa": args.isa} for program in args.programs]
+    status = 0
+    for program, result in zip(args.programs, submit(args.socket, jobs)):
+        if not result["ok"]:
+            print(f"{program}: {result['error']}", file=sys.stderr)
+            status = 1
+            continue
+        sys.stdout.write(result["output"])
+        status = status or result["exit_code"]
+        if args.latency:
+            print(f"{program}: {result['latency'] * 1000:.2f} ms", file=sys.stderr)
+    return status
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    sys.exit(main())
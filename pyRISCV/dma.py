@@ -0,0 +1,103 @@
+from .params import *
+from .rv_exception import RVException
+
+# A DMA controller. The guest builds a chain of descriptors in DRAM, writes
+# the first one's address to DESCRIPTOR and DMA_START to CONTROL. The chain
+# is read then, and completes DMA_SETUP_DELAY plus one instruction per
+# DMA_BYTES_PER_INSTRUCTION bytes later through the bus's event queue: each
+# descriptor is copied as one DRAM slice, through writable_bytes so decoded
+# code and checkpointed pages in the destination are dealt with, then DONE
+# (or ERROR) is set, raising the external interrupt if enabled. Until then
+# the destination still holds its old contents.
+
+class DMA:
+    def __init__(self, dram, events):
+        self.regs = bytearray(DMA_REGISTERS)
+        self.dram = dram
+        self.events = events
+        self.chain = None  # [(source, destination, length)] of the chain in flight
+        self.deadline = None  # time the chain in flight completes
+
+    def reg(self, offset):
+        return int.from_bytes(self.regs[offset:offset + 4], byteorder='little')
+
+    def set_reg(self, offset, value):
+        self.regs[offset:offset + 4] = int.to_bytes(value, 4, byteorder='little')
+
+    def interrupting(self):
+        return bool(self.reg(DMA_CONTROL) & DMA_INTERRUPT_ENABLE and self.reg(DMA_STATUS) & (DMA_DONE | DMA_ERROR))
+
+    def load(self, addr, size):
+        index = addr - DMA_BASE
+        return int.from_bytes(self.regs[index:index + size // 8], byteorder='little')
+
+    def store(self, addr, value, size):
+        index = addr - DMA_BASE
+        nbytes = size // 8
+        if index + nbytes > DMA_REGISTERS:
+            return
+        if index == DMA_STATUS:
+            self.set_reg(DMA_STATUS, self.reg(DMA_STATUS) & ~(value & (DMA_DONE | DMA_ERROR)))
+            return
+        self.regs[index:index + nbytes] = int.to_bytes(value & ((1 << size) - 1), nbytes, byteorder='little')
+        if index == DMA_CONTROL and value & DMA_START:
+            self.set_reg(DMA_CONTROL, value & ~DMA_START)
+            if not self.reg(DMA_STATUS) & DMA_BUSY:
+                self.start()
+
+    def read_chain(self):
+        """
+            (source, destination, length) of each descriptor from DESCRIPTOR
+            on, or None if one lies outside DRAM or the chain is too long"""
+        chain = []
+        address = self.reg(DMA_DESCRIPTOR)
+        while address:
+            if len(chain) == DMA_MAX_DESCRIPTORS or not self.dram.contains(address, DMA_DESCRIPTOR_SIZE):
+                return None
+            descriptor = self.dram.load_bytes(address, DMA_DESCRIPTOR_SIZE)
+            source, destination, length, address = (int.from_bytes(descriptor[i:i + 4], byteorder='little')
+                                                    for i in range(0, DMA_DESCRIPTOR_SIZE, 4))
+            chain.append((source, destination, length))
+        return chain
+
+    def start(self):
+        chain = self.read_chain()
+        self.chain = chain
+        copied = sum(length for _, _, length in chain) if chain is not None else 0
+        self.set_reg(DMA_STATUS, DMA_BUSY)
+        self.deadline = self.events.now() + DMA_SETUP_DELAY + copied // DMA_BYTES_PER_INSTRUCTION
+        self.events.schedule_at(self.deadline, self.complete)
+
+    def copy(self, chain):
+        """
+            Copy each descriptor's range, returning False if one lies
+            outside DRAM"""
+        if chain is None:
+            return False
+        try:
+            for source, destination, length in chain:
+                data = self.dram.load_bytes(source, length)
+                if source < destination + length and destination < source + length:
+                    data = bytes(data)  # overlapping ranges
+                self.dram.writable_bytes(destination, length)[:] = data
+        except RVException:
+            return False
+        return True
+
+    def complete(self):
+        status = DMA_DONE if self.copy(self.chain) else DMA_ERROR
+        self.chain = None
+        self.deadline = None
+        self.set_reg(DMA_STATUS, status)
+
+    def capture(self):
+        return bytes(self.regs), self.chain, self.deadline
+
+    def restore(self, state):
+        """
+            Put back registers and the chain in flight from capture(),
+            scheduling its completion again"""
+        regs, self.chain, self.deadline = state
+        self.regs[:] = regs
+        if self.deadline is not None:
+            self.events.schedule_at(self.deadline, self.complete)
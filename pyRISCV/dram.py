@@ -2,11 +2,29 @@ from .params import *
 import logging
 from .rv_exception import RVException, ExceptionType
 
+SET_SAVE = bytes(flags | PAGE_SAVE for flags in range(256))  # bytes.translate tables
+CLEAR_SAVE = bytes(flags & ~PAGE_SAVE for flags in range(256))
+
 class DRAM:
-    def __init__(self, program):
-        self.size = DRAM_SIZE
-        self.data = [0] * DRAM_SIZE 
+    def __init__(self, program, buffer=None, base=DRAM_BASE, size=DRAM_SIZE):
+        self.base = base
+        self.size = size
+        self.end = base + size - 1
+        # ``buffer`` lets several harts share one memory (e.g. a
+        # ``multiprocessing.shared_memory`` block); otherwise DRAM is private.
+        if buffer is None:
+            self.data = bytearray(size)
+        else:
+            self.data = memoryview(buffer)[:size]
         self.data[:len(program)] = program
+        self.image_size = len(program)  # the program break starts past the image
+        # PAGE_CODE and PAGE_SAVE flags per page; stores to flagged pages go
+        # through before_write, which calls code_written and page_saver
+        self.page_flags = bytearray(size >> PAGE_SHIFT)
+        self.code_written = None
+        self.page_saver = None
+        self.reservations = None  # LR/SC reservations of other harts sharing the memory, in SMP mode
+        self.hartid = 0  # hart whose stores go through this instance
 
     def load(self, address, size):
         if size != 8 and size!= 16 and size!= 32:
@@ -14,13 +32,12 @@ class DRAM:
             raise RVException(ExceptionType.LOAD_ACCESS_FAULT, address)
         
         nbytes = size // 8
-        index = address - DRAM_BASE
-        if index < 0 or index + nbytes > DRAM_SIZE:
+        index = address - self.base
+        if index < 0 or index + nbytes > self.size:
             logging.warning(f"Invalid address {address}")
             raise RVException(ExceptionType.LOAD_ACCESS_FAULT, address)
         
-        data = self.data[index:index+nbytes]
-        return int.from_bytes(data, byteorder='little')
+        return int.from_bytes(self.data[index:index+nbytes], byteorder='little')
     
     def store(self, address, value, size):
         if size != 8 and size!= 16 and size != 32:
@@ -28,9 +45,127 @@ class DRAM:
             raise RVException(ExceptionType.STORE_AMO_ACCESS_FAULT, address)
         
         nbytes = size // 8
-        index = address - DRAM_BASE
-        if index < 0 or index + nbytes > DRAM_SIZE:
+        index = address - self.base
+        if index < 0 or index + nbytes > self.size:
             logging.warning(f"Invalid address {address}")
             raise RVException(ExceptionType.STORE_AMO_ACCESS_FAULT, address)
-        data = list(int.to_bytes(value, nbytes, byteorder='little'))
-        self.data[index:index+nbytes] = data
\ No newline at end of file
+        if self.page_flags[index >> PAGE_SHIFT] or self.page_flags[(index + nbytes - 1) >> PAGE_SHIFT]:
+            self.before_write(address, nbytes)
+        if self.reservations is not None:
+            self.reservations.written(self.hartid, address, nbytes)
+        self.data[index:index+nbytes] = int.to_bytes(value, nbytes, byteorder='little')
+
+    def load_bytes(self, address, length):
+        """
+            Zero-copy view of length bytes at address, for bulk transfers
+            that would otherwise take one load per byte."""
+        index = address - self.base
+        if index < 0 or length < 0 or index + length > self.size:
+            raise RVException(ExceptionType.LOAD_ACCESS_FAULT, address)
+        return memoryview(self.data)[index:index + length]
+
+    def store_bytes(self, address, data):
+        index = address - self.base
+        if index < 0 or index + len(data) > self.size:
+            raise RVException(ExceptionType.STORE_AMO_ACCESS_FAULT, address)
+        if data and any(self.page_flags[index >> PAGE_SHIFT:((index + len(data) - 1) >> PAGE_SHIFT) + 1]):
+            self.before_write(address, len(data))
+        if data and self.reservations is not None:
+            self.reservations.written(self.hartid, address, len(data))
+        self.data[index:index + len(data)] = data
+
+    def writable_bytes(self, address, length):
+        """
+            Zero-copy view of length bytes at address for the host to write
+            into, e.g. with os.readv"""
+        index = address - self.base
+        if index < 0 or length < 0 or index + length > self.size:
+            raise RVException(ExceptionType.STORE_AMO_ACCESS_FAULT, address)
+        if length and any(self.page_flags[index >> PAGE_SHIFT:((index + length - 1) >> PAGE_SHIFT) + 1]):
+            self.before_write(address, length)
+        if length and self.reservations is not None:
+            self.reservations.written(self.hartid, address, length)
+        return memoryview(self.data)[index:index + length]
+
+    def watch_reservations(self, reservations, hartid):
+        """
+            Have stores through this instance, made by hartid, break other
+            harts' LR/SC reservations on the words they write"""
+        self.reservations = reservations
+        self.hartid = hartid
+
+    def before_write(self, address, length):
+        """
+            Save pages flagged PAGE_SAVE through page_saver, once each, and
+            report writes to decoded code through code_written."""
+        index = address - self.base
+        code = False
+        for page in range(index >> PAGE_SHIFT, ((index + length - 1) >> PAGE_SHIFT) + 1):
+            flags = self.page_flags[page]
+            if flags & PAGE_SAVE:
+                self.page_flags[page] = flags & ~PAGE_SAVE
+                if self.page_saver is not None:
+                    self.page_saver(page)
+            code = code or flags & PAGE_CODE
+        if code and self.code_written is not None:
+            self.code_written(address, length)
+
+    def save_all(self):
+        """
+            Flag every page PAGE_SAVE"""
+        self.page_flags[:] = self.page_flags.translate(SET_SAVE)
+
+    def unsave_all(self):
+        self.page_flags[:] = self.page_flags.translate(CLEAR_SAVE)
+
+    def page(self, page):
+        return bytes(self.data[page << PAGE_SHIFT:(page + 1) << PAGE_SHIFT])
+
+    def restore_page(self, page, contents):
+        """
+            Put back contents saved from page without saving it again,
+            dropping any code decoded from it"""
+        index = page << PAGE_SHIFT
+        self.data[index:index + len(contents)] = contents
+        if self.page_flags[page] & PAGE_CODE and self.code_written is not None:
+            self.code_written(self.base + index, len(contents))
+
+    def mark_code(self, address):
+        index = address - self.base
+        if 0 <= index < self.size:
+            self.page_flags[index >> PAGE_SHIFT] |= PAGE_CODE
+
+    def contains(self, address, length):
+        index = address - self.base
+        return 0 <= index and index + length <= self.size
+
+    def is_plain(self, address, length):
+        """
+            True if the range is in DRAM and has no page flags (decoded code,
+            pages to save) or other harts' reservations, so it can be written
+            in bulk without any hooks."""
+        if not self.contains(address, length):
+            return False
+        if self.reservations is not None and self.reservations.held(self.hartid, address, length):
+            return False
+        index = address - self.base
+        return not any(self.page_flags[index >> PAGE_SHIFT:((index + length - 1) >> PAGE_SHIFT) + 1])
+
+    def find_byte(self, address, value):
+        """
+            Distance from address to the first byte equal to value, or -1"""
+        index = address - self.base
+        if not 0 <= index < self.size:
+            return -1
+        if isinstance(self.data, bytearray):
+            position = self.data.find(value, index)
+            return position - index if position >= 0 else -1
+        # a memoryview has no find: copy growing chunks rather than the rest of DRAM
+        start, chunk = index, FIND_CHUNK
+        while start < self.size:
+            position = bytes(self.data[start:start + chunk]).find(value)
+            if position >= 0:
+                return start + position - index
+            start += chunk
+            chunk <<= 1
+        return -1
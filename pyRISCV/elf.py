@@ -0,0 +1,71 @@
+import struct
+from .params import *
+
+ELF_MAGIC = b"\x7fELF"
+ELFCLASS32 = 1
+ELFDATA2LSB = 1
+EM_RISCV = 243
+PT_LOAD = 1
+SHT_SYMTAB = 2
+STT_FUNC = 2
+
+EHDR_FORMAT = "<16sHHIIIIIHHHHHH"
+PHDR_FORMAT = "<IIIIIIII"
+SHDR_FORMAT = "<IIIIIIIIII"
+SYM_FORMAT = "<IIIBBH"
+
+def is_elf(data):
+    return data[:4] == ELF_MAGIC
+
+class ELF:
+    """
+        Minimal reader for statically linked RV32 little-endian executables:
+        the entry point, the loadable segments and the symbol table.
+    """
+
+    def __init__(self, data):
+        if not is_elf(data):
+            raise ValueError("not an ELF file")
+        (ident, self.type, machine, _, self.entry, phoff, shoff, _, _,
+         phentsize, phnum, shentsize, shnum, _) = struct.unpack_from(EHDR_FORMAT, data)
+        if ident[4] != ELFCLASS32 or ident[5] != ELFDATA2LSB or machine != EM_RISCV:
+            raise ValueError("not a 32-bit little-endian RISC-V ELF file")
+        self.data = data
+        self.segments = []  # (vaddr, file bytes, memsz)
+        for i in range(phnum):
+            p_type, offset, vaddr, _, filesz, memsz, _, _ = \
+                struct.unpack_from(PHDR_FORMAT, data, phoff + i * phentsize)
+            if p_type == PT_LOAD:
+                self.segments.append((vaddr, data[offset:offset + filesz], memsz))
+        sections = [struct.unpack_from(SHDR_FORMAT, data, shoff + i * shentsize) for i in range(shnum)]
+        self.symbols = {}  # name -> address
+        self.functions = {}  # name -> address, of symbols typed as functions
+        self.sizes = {}  # name -> size in bytes, of functions that record one
+        for section in sections:
+            if section[1] != SHT_SYMTAB:
+                continue
+            _, _, _, _, offset, size, link, _, _, entsize = section
+            strtab = sections[link]
+            strings = data[strtab[4]:strtab[4] + strtab[5]]
+            for position in range(offset, offset + size, entsize):
+                name, value, size, info, _, shndx = struct.unpack_from(SYM_FORMAT, data, position)
+                if name and shndx:
+                    name = strings[name:strings.index(b"\0", name)].decode()
+                    self.symbols[name] = value
+                    if info & 0xF == STT_FUNC:
+                        self.functions[name] = value
+                        if size:
+                            self.sizes[name] = size
+
+    def load(self, cpu):
+        """
+            Copy the segments into DRAM, zero-filling .bss, and start the CPU
+            at the entry point."""
+        dram = cpu.bus.dram
+        image_end = dram.base
+        for vaddr, contents, memsz in self.segments:
+            dram.store_bytes(vaddr, contents)
+            dram.store_bytes(vaddr + len(contents), bytes(memsz - len(contents)))
+            image_end = max(image_end, vaddr + memsz)
+        dram.image_size = image_end - dram.base
+        cpu.pc = self.entry
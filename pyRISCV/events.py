@@ -0,0 +1,42 @@
+import heapq
+from itertools import count
+
+# Device events in simulated time, counted in retired instructions like
+# mtime. CPU.check_interrupts runs every event due before looking at mip,
+# and run() shortens its chunks to stop at the next deadline, so a device
+# raising its interrupt line from an event is seen on time. Events scheduled
+# while a chunk runs are due at the end of it at the earliest, i.e. within
+# INTERRUPT_POLL_INTERVAL instructions of their deadline.
+
+NEVER = 1 << 64  # deadline of an empty queue
+
+class EventQueue:
+    def __init__(self):
+        self.queue = []  # (time, sequence, callback) heap
+        self.sequence = count()  # keeps events due at the same time in order
+        self.next = NEVER  # time of the earliest event
+        self.time_source = None  # callable returning instructions retired, set by the CPU
+
+    def now(self):
+        return self.time_source() if self.time_source is not None else 0
+
+    def schedule_at(self, time, callback):
+        heapq.heappush(self.queue, (time, next(self.sequence), callback))
+        self.next = self.queue[0][0]
+
+    def schedule(self, delay, callback):
+        """
+            Call callback() once delay more instructions have retired"""
+        self.schedule_at(self.now() + delay, callback)
+
+    def run(self, now):
+        """
+            Call the callbacks due by now, in time order"""
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            heapq.heappop(queue)[2]()
+        self.next = queue[0][0] if queue else NEVER
+
+    def clear(self):
+        self.queue.clear()
+        self.next = NEVER
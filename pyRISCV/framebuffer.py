@@ -0,0 +1,147 @@
+import sys
+import zlib
+import struct
+from multiprocessing import shared_memory
+from .params import *
+
+# A linear framebuffer of FB_WIDTH x FB_HEIGHT 0x00RRGGBB pixels. The pixel
+# memory is accessed by BUS.load and BUS.store directly, like DRAM, rather
+# than through a device method. Writing the vsync register completes a
+# frame, which is exported as PPM or PNG when an output pattern is set;
+# frames can also be exported every so many instructions through the bus's
+# event queue. After share() the pixels live in shared memory, so a viewer
+# process (python -m pyRISCV.framebuffer NAME) can show them without the
+# simulator copying anything. Checkpoints and transactions save the pixels
+# along with the frame count and the periodic export, copying them only if
+# the guest wrote to them since the last snapshot was taken or restored.
+
+def to_rgb(pixels):
+    """
+        Packed RGB bytes of little-endian 0x00RRGGBB pixels"""
+    rgb = bytearray(len(pixels) // 4 * 3)
+    rgb[0::3] = pixels[2::4]
+    rgb[1::3] = pixels[1::4]
+    rgb[2::3] = pixels[0::4]
+    return rgb
+
+def encode_ppm(pixels, width=FB_WIDTH, height=FB_HEIGHT):
+    return b"P6\n%d %d\n255\n" % (width, height) + to_rgb(pixels)
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def encode_png(pixels, width=FB_WIDTH, height=FB_HEIGHT):
+    rgb = to_rgb(pixels)
+    stride = width * 3
+    rows = b"".join(b"\x00" + rgb[row:row + stride] for row in range(0, len(rgb), stride))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)  # 8-bit RGB
+    return b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header) + \
+        png_chunk(b"IDAT", zlib.compress(rows, 1)) + png_chunk(b"IEND", b"")
+
+class Framebuffer:
+    def __init__(self):
+        self.pixels = bytearray(FB_SIZE)
+        self.shm = None  # SharedMemory holding the pixels after share()
+        self.frames = 0  # vsync writes so far
+        self.output = None  # path pattern, e.g. "frames/{:05d}.png", frames are exported to
+        self.exported = 0  # frames written so far, numbering the files
+        self.events = None  # EventQueue driving export_every, set by the bus
+        self.snapshot = None  # copy of the pixels from the last capture() or restore()
+        self.dirty = True  # pixels written since snapshot, set by BUS.store
+        self.interval = None  # instructions between periodic exports, if export_every was called
+        self.deadline = None  # time of the next periodic export
+
+    def share(self):
+        """
+            Move the pixels into shared memory and return its name, for a
+            viewer process to attach to"""
+        if self.shm is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=FB_SIZE)
+            self.shm.buf[:FB_SIZE] = self.pixels
+            self.pixels = self.shm.buf[:FB_SIZE]
+        return self.shm.name
+
+    def close(self):
+        if self.shm is not None:
+            shared, self.pixels = self.pixels, bytearray(self.pixels)
+            shared.release()
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def load(self, addr, size):
+        index = addr - FB_CONTROL_BASE
+        if index == FB_FRAMES:
+            return self.frames & ((1 << size) - 1)
+        if index == FB_GEOMETRY:
+            return (FB_WIDTH | FB_HEIGHT << 16) & ((1 << size) - 1)
+        return 0
+
+    def store(self, addr, value, size):
+        if addr - FB_CONTROL_BASE == FB_VSYNC:
+            self.frames += 1
+            if self.output is not None:
+                self.export()
+
+    def export(self, path=None):
+        """
+            Write the current frame to path, or to the next file of the
+            output pattern, as PNG if the name ends in .png, else PPM"""
+        if path is None:
+            path = self.output.format(self.exported)
+        self.exported += 1
+        encode = encode_png if path.endswith(".png") else encode_ppm
+        with open(path, "wb") as f:
+            f.write(encode(self.pixels))
+        return path
+
+    def export_every(self, interval):
+        """
+            Export a frame every interval instructions, besides on vsync"""
+        self.interval = interval
+        self.deadline = self.events.now() + interval
+        self.events.schedule_at(self.deadline, self.tick)
+
+    def tick(self):
+        self.export()
+        self.deadline += self.interval
+        self.events.schedule_at(self.deadline, self.tick)
+
+    def capture(self):
+        if self.dirty:
+            self.snapshot = bytes(self.pixels)
+            self.dirty = False
+        return self.snapshot, self.frames, self.interval, self.deadline
+
+    def restore(self, state):
+        """
+            Put back the pixels, frame count and periodic export from
+            capture(), scheduling the export again. The pixels are copied
+            only if they differ from that capture's."""
+        pixels, self.frames, self.interval, self.deadline = state
+        if self.dirty or pixels is not self.snapshot:
+            self.pixels[:] = pixels  # in place, as a viewer may be attached to shared pixels
+            self.snapshot = pixels
+            self.dirty = False
+        if self.deadline is not None:
+            self.events.schedule_at(self.deadline, self.tick)
+
+def view(name):
+    """
+        Show the framebuffer in shared memory name in a window until closed"""
+    import tkinter
+    shm = shared_memory.SharedMemory(name=name)
+    root = tkinter.Tk()
+    root.title("pyRISCV framebuffer")
+    image = tkinter.PhotoImage(width=FB_WIDTH, height=FB_HEIGHT)
+    tkinter.Label(root, image=image).pack()
+
+    def redraw():
+        image.configure(data=encode_ppm(shm.buf[:FB_SIZE]), format="PPM")
+        root.after(FB_VIEWER_PERIOD, redraw)
+    redraw()
+    root.mainloop()
+    shm.close()
+
+if __name__ == '__main__':
+    view(sys.argv[1])
@@ -0,0 +1,74 @@
+from .instruction_executor import get_imm
+
+# Macro-op fusion: pairs of instructions the compiler emits together are
+# decoded into one handler, saving a dispatch for the second instruction.
+# None of the fused first instructions can trap, so a fused pair either
+# completes entirely or traps in its second half with cpu.pc pointing at it.
+
+FUSION_FIRST = {0x37, 0x17, 0x13, 0x33}  # lui, auipc, OP-IMM, OP
+
+def load_constant(rd, value):
+    def fused_li(cpu, inst):
+        cpu.regs[rd] = value
+        cpu.fused += 1
+        return cpu.next_pc
+    return fused_li
+
+def call(rd_auipc, base, rd_jalr, target):
+    def fused_call(cpu, inst):
+        cpu.regs[rd_auipc] = base
+        cpu.regs[rd_jalr] = cpu.next_pc & 0xFFFFFFFF
+        cpu.fused += 1
+        return target
+    return fused_call
+
+def zero_extend(rd, rs, mask):
+    def fused_zext(cpu, inst):
+        cpu.regs[rd] = cpu.regs[rs] & mask
+        cpu.fused += 1
+        return cpu.next_pc
+    return fused_zext
+
+def pair(first, second):
+    """
+        Run both handlers back to back, moving pc to the second instruction
+        in between so that it branches and traps from its own address."""
+    handler1, inst1, length1 = first
+    handler2, inst2, length2 = second
+
+    def fused_pair(cpu, inst):
+        handler1(cpu, inst1)
+        cpu.regs[0] = 0
+        pc = cpu.pc = cpu.pc + length1
+        cpu.next_pc = pc + length2
+        cpu.fused += 1
+        return handler2(cpu, inst2)
+    return fused_pair
+
+def fuse(first, second, pc):
+    """
+        A handler executing the decoded entries first and second (at pc) as
+        one, or None if they are not a fusible idiom."""
+    inst1, inst2 = first[1], second[1]
+    op1, op2 = inst1 & 0x7F, inst2 & 0x7F
+    rd1 = (inst1 >> 7) & 0x1F
+    funct3_1, funct3_2 = (inst1 >> 12) & 0x7, (inst2 >> 12) & 0x7
+    rd2, rs1_2, rs2_2 = (inst2 >> 7) & 0x1F, (inst2 >> 15) & 0x1F, (inst2 >> 20) & 0x1F
+    if rd1 == 0:
+        return None
+    upper = inst1 & 0xFFFFF000
+    if op2 == 0x13 and funct3_2 == 0x0 and rd2 == rd1 and rs1_2 == rd1:
+        if op1 == 0x37:  # lui + addi: li
+            return load_constant(rd1, (upper + get_imm(inst2)) & 0xFFFFFFFF)
+        if op1 == 0x17:  # auipc + addi: la
+            return load_constant(rd1, (pc + upper + get_imm(inst2)) & 0xFFFFFFFF)
+    if op1 == 0x17 and op2 == 0x67 and rs1_2 == rd1:  # auipc + jalr: call, tail
+        base = (pc + upper) & 0xFFFFFFFF
+        return call(rd1, base, rd2, (base + get_imm(inst2)) & 0xFFFFFFFE)
+    if op1 == 0x13 and funct3_1 == 0x1 and op2 == 0x13 and funct3_2 == 0x5 and inst2 >> 25 == 0 \
+            and rd2 == rd1 and rs1_2 == rd1 and (inst1 >> 20) & 0x1F == rs2_2:  # slli + srli: zero-extend
+        return zero_extend(rd1, (inst1 >> 15) & 0x1F, 0xFFFFFFFF >> rs2_2)
+    if op2 == 0x63 and funct3_1 in (0x2, 0x3) and (op1 == 0x13 or (op1 == 0x33 and inst1 >> 25 == 0)) \
+            and rd1 in (rs1_2, rs2_2):  # slt(i)(u) + branch on the result
+        return pair(first, second)
+    return None
@@ -0,0 +1,361 @@
+import random
+import multiprocessing
+from .params import *
+from .cpu import CPU
+from .instruction_executor import InstructionExecutor
+
+# Differential fuzzer for the instruction handlers. A case is a short random
+# RV32IM program, the registers it starts with and the contents of a scratch
+# region that loads and stores address through x3. Branches and jal only go
+# forward, so every case ends within len(program) instructions, falling off
+# the end into zeroed memory. Each case is run on the simulator (with the
+# decode cache and fusion it normally uses) and on the small reference model
+# below, written separately from InstructionExecutor, and the final pc,
+# registers and scratch memory are compared. Coverage is a bitmap over
+# (simulator handler, operand classes), recorded by a dispatch hook on the
+# simulator, so fused pairs, bulk loops and traps count as their own paths;
+# the reference model is only compared against. Cases hitting new bits join
+# the corpus that later cases are mutated from. Failing cases are minimized
+# by removing instructions and zeroing registers while they still fail.
+
+SCRATCH_BASE = 3  # x3 points at the middle of the scratch region
+SPECIAL_VALUES = (0, 1, 0xFFFFFFFF, 0x80000000, 0x7FFFFFFF)
+VALUE_CLASSES = {0: 0, 0xFFFFFFFF: 1, 0x80000000: 2}  # coverage class of an operand, 3 for any other
+
+def signed(value):
+    return value - 0x100000000 if value & 0x80000000 else value
+
+def divide(a, b):
+    if b == 0:
+        return 0xFFFFFFFF
+    if a == 0x80000000 and b == 0xFFFFFFFF:
+        return a
+    quotient = abs(signed(a)) // abs(signed(b))
+    return quotient if (a ^ b) & 0x80000000 == 0 else -quotient
+
+def remainder(a, b):
+    if b == 0:
+        return a
+    if a == 0x80000000 and b == 0xFFFFFFFF:
+        return 0
+    value = abs(signed(a)) % abs(signed(b))
+    return -value if a & 0x80000000 else value
+
+# name -> (opcode, funct3, funct7 or None, result of rs1 value a and rs2 value or immediate b)
+ALU = {
+    "add": (0x33, 0, 0x00, lambda a, b: a + b),
+    "sub": (0x33, 0, 0x20, lambda a, b: a - b),
+    "sll": (0x33, 1, 0x00, lambda a, b: a << (b & 31)),
+    "slt": (0x33, 2, 0x00, lambda a, b: int(signed(a) < signed(b))),
+    "sltu": (0x33, 3, 0x00, lambda a, b: int(a < b)),
+    "xor": (0x33, 4, 0x00, lambda a, b: a ^ b),
+    "srl": (0x33, 5, 0x00, lambda a, b: a >> (b & 31)),
+    "sra": (0x33, 5, 0x20, lambda a, b: signed(a) >> (b & 31)),
+    "or": (0x33, 6, 0x00, lambda a, b: a | b),
+    "and": (0x33, 7, 0x00, lambda a, b: a & b),
+    "mul": (0x33, 0, 0x01, lambda a, b: a * b),
+    "mulh": (0x33, 1, 0x01, lambda a, b: signed(a) * signed(b) >> 32),
+    "mulhsu": (0x33, 2, 0x01, lambda a, b: signed(a) * b >> 32),
+    "mulhu": (0x33, 3, 0x01, lambda a, b: a * b >> 32),
+    "div": (0x33, 4, 0x01, divide),
+    "divu": (0x33, 5, 0x01, lambda a, b: a // b if b else 0xFFFFFFFF),
+    "rem": (0x33, 6, 0x01, remainder),
+    "remu": (0x33, 7, 0x01, lambda a, b: a % b if b else a),
+    "addi": (0x13, 0, None, lambda a, b: a + b),
+    "slti": (0x13, 2, None, lambda a, b: int(signed(a) < signed(b))),
+    "sltiu": (0x13, 3, None, lambda a, b: int(a < b)),
+    "xori": (0x13, 4, None, lambda a, b: a ^ b),
+    "ori": (0x13, 6, None, lambda a, b: a | b),
+    "andi": (0x13, 7, None, lambda a, b: a & b),
+    "slli": (0x13, 1, 0x00, lambda a, b: a << b),
+    "srli": (0x13, 5, 0x00, lambda a, b: a >> b),
+    "srai": (0x13, 5, 0x20, lambda a, b: signed(a) >> b),
+}
+LOADS = {"lb": (0, 1, True), "lh": (1, 2, True), "lw": (2, 4, False), "lbu": (4, 1, False), "lhu": (5, 2, False)}
+STORES = {"sb": (0, 1), "sh": (1, 2), "sw": (2, 4)}
+BRANCHES = {
+    "beq": (0, lambda a, b: a == b),
+    "bne": (1, lambda a, b: a != b),
+    "blt": (4, lambda a, b: signed(a) < signed(b)),
+    "bge": (5, lambda a, b: signed(a) >= signed(b)),
+    "bltu": (6, lambda a, b: a < b),
+    "bgeu": (7, lambda a, b: a >= b),
+}
+NAMES = sorted(ALU) + sorted(LOADS) + sorted(STORES) + sorted(BRANCHES) + ["lui", "auipc", "jal"]
+# simulator handlers by coverage index, the same in every worker process; others share the last
+HANDLERS = sorted(name for name in dir(InstructionExecutor) if name.startswith("execute_")) \
+    + ["fused_li", "fused_call", "fused_zext", "fused_pair", "bulk_loop", "trap"]
+HANDLER_INDEX = {name: index for index, name in enumerate(HANDLERS)}
+OTHER_HANDLER = (FUZZ_BITMAP_SIZE >> 6) - 1
+
+def coverage_index(name, a, b, rd, rs1, rs2):
+    """
+        Bitmap index of handler name run with operand values a and b"""
+    return HANDLER_INDEX.get(name, OTHER_HANDLER) << 6 | VALUE_CLASSES.get(a, 3) << 4 | VALUE_CLASSES.get(b, 3) << 2 \
+        | (rd == 0) << 1 | (rs1 == rs2)
+
+def encode(name, rd=0, rs1=0, rs2=0, imm=0):
+    if name in ALU:
+        op, funct3, funct7, _ = ALU[name]
+        if op == 0x33:
+            return funct7 << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | op
+        if funct7 is not None:  # shift by immediate
+            imm = funct7 << 5 | (imm & 0x1F)
+        return (imm & 0xFFF) << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | op
+    if name in LOADS:
+        return (imm & 0xFFF) << 20 | rs1 << 15 | LOADS[name][0] << 12 | rd << 7 | 0x03
+    if name in STORES:
+        return (imm >> 5 & 0x7F) << 25 | rs2 << 20 | rs1 << 15 | STORES[name][0] << 12 | (imm & 0x1F) << 7 | 0x23
+    if name in BRANCHES:
+        return (imm >> 12 & 1) << 31 | (imm >> 5 & 0x3F) << 25 | rs2 << 20 | rs1 << 15 | BRANCHES[name][0] << 12 \
+            | (imm >> 1 & 0xF) << 8 | (imm >> 11 & 1) << 7 | 0x63
+    if name == "jal":
+        return (imm >> 20 & 1) << 31 | (imm >> 1 & 0x3FF) << 21 | (imm >> 11 & 1) << 20 | (imm >> 12 & 0xFF) << 12 \
+            | rd << 7 | 0x6F
+    return (imm & 0xFFFFF) << 12 | rd << 7 | (0x37 if name == "lui" else 0x17)
+
+def decode(inst):
+    """
+        (name, rd, rs1, rs2, imm) of an instruction made by encode()"""
+    op, funct3, funct7 = inst & 0x7F, inst >> 12 & 0x7, inst >> 25
+    rd, rs1, rs2 = inst >> 7 & 0x1F, inst >> 15 & 0x1F, inst >> 20 & 0x1F
+    imm = signed(inst & 0xFFF00000) >> 20
+    if op == 0x33 or op == 0x13:
+        for name, (alu_op, alu_funct3, alu_funct7, _) in ALU.items():
+            if alu_op == op and alu_funct3 == funct3 and (alu_funct7 is None or alu_funct7 == funct7):
+                return name, rd, rs1, rs2, rs2 if funct3 in (1, 5) and op == 0x13 else imm
+    if op == 0x03:
+        return next(name for name, (f3, _, _) in LOADS.items() if f3 == funct3), rd, rs1, 0, imm
+    if op == 0x23:
+        imm = signed(inst & 0xFE000000) >> 20 | rd
+        return next(name for name, (f3, _) in STORES.items() if f3 == funct3), 0, rs1, rs2, imm
+    if op == 0x63:
+        imm = signed((inst >> 31) << 31 | (inst & 0x80) << 23 | (inst >> 25 & 0x3F) << 24 | (inst >> 8 & 0xF) << 20) >> 19
+        return next(name for name, (f3, _) in BRANCHES.items() if f3 == funct3), 0, rs1, rs2, imm
+    if op == 0x6F:
+        imm = signed((inst >> 31) << 31 | (inst >> 12 & 0xFF) << 23 | (inst >> 20 & 1) << 22 | (inst >> 21 & 0x3FF) << 12) >> 11
+        return "jal", rd, 0, 0, imm
+    return "lui" if op == 0x37 else "auipc", rd, 0, 0, inst >> 12
+
+def reference(case):
+    """
+        (pc, registers, scratch memory) after running case"""
+    program, regs, memory = case
+    x = list(regs)
+    memory = bytearray(memory)
+    scratch = FUZZ_SCRATCH - FUZZ_SCRATCH_SIZE // 2  # regs[3] points FUZZ_SCRATCH_SIZE // 2 bytes in
+    offset = 0
+    while offset < 4 * len(program):
+        name, rd, rs1, rs2, imm = decode(program[offset // 4])
+        a, b = x[rs1], x[rs2]
+        pc = DRAM_BASE + offset
+        offset += 4
+        result = None
+        if name in ALU:
+            result = ALU[name][3](a, b if ALU[name][0] == 0x33 else imm & 0xFFFFFFFF if ALU[name][2] is None else imm)
+        elif name in LOADS:
+            _, size, sign = LOADS[name]
+            address = (a + imm) & 0xFFFFFFFF
+            result = int.from_bytes(memory[address - scratch:address - scratch + size], "little")
+            if sign and result >> (8 * size - 1):
+                result -= 1 << 8 * size
+        elif name in STORES:
+            size = STORES[name][1]
+            address = (a + imm) & 0xFFFFFFFF
+            memory[address - scratch:address - scratch + size] = (b & (1 << 8 * size) - 1).to_bytes(size, "little")
+        elif name in BRANCHES:
+            if BRANCHES[name][1](a, b):
+                offset += imm - 4
+        elif name == "jal":
+            result = pc + 4
+            offset += imm - 4
+        else:
+            result = imm << 12 if name == "lui" else pc + (imm << 12)
+        if result is not None and rd:
+            x[rd] = result & 0xFFFFFFFF
+    return DRAM_BASE + offset, x, bytes(memory)
+
+def random_instruction(rng, index, length):
+    name = rng.choice(NAMES)
+    rd = rng.choice([r for r in range(32) if r != SCRATCH_BASE])
+    rs1, rs2 = rng.randrange(32), rng.randrange(32)
+    if name in ALU:
+        imm = rng.randrange(32) if ALU[name][2] is not None else rng.randrange(-2048, 2048)
+    elif name in LOADS or name in STORES:
+        rs1, imm = SCRATCH_BASE, rng.randrange(-2048, 2045)
+    elif name in BRANCHES or name == "jal":
+        imm = 4 * rng.randint(1, min(FUZZ_MAX_SKIP, length - index))  # forward, at most to the end
+    else:
+        imm = rng.randrange(1 << 20)
+    return encode(name, rd, rs1, rs2, imm)
+
+def random_regs(rng):
+    regs = [rng.choice(SPECIAL_VALUES) if rng.random() < 0.5 else rng.getrandbits(32) for _ in range(32)]
+    regs[0] = 0
+    regs[SCRATCH_BASE] = FUZZ_SCRATCH
+    return regs
+
+def random_case(rng, length=FUZZ_PROGRAM_LENGTH):
+    program = [random_instruction(rng, index, length) for index in range(length)]
+    return program, random_regs(rng), rng.randbytes(FUZZ_SCRATCH_SIZE)
+
+def mutate(rng, case):
+    """
+        A copy of case with one instruction or register changed"""
+    program, regs, memory = list(case[0]), list(case[1]), case[2]
+    if rng.random() < 0.75:
+        index = rng.randrange(len(program))
+        program[index] = random_instruction(rng, index, len(program))
+    else:
+        rd = rng.choice([r for r in range(1, 32) if r != SCRATCH_BASE])
+        regs[rd] = rng.choice(SPECIAL_VALUES) if rng.random() < 0.5 else rng.getrandbits(32)
+    return program, regs, memory
+
+machine = None  # CPU reused by check() in this process, rolled back after each case
+covered = set()  # coverage bitmap indices hit by the case machine is running
+
+def record(cpu, handler, inst):
+    regs = cpu.regs
+    rd, rs1, rs2 = inst >> 7 & 0x1F, inst >> 15 & 0x1F, inst >> 20 & 0x1F
+    covered.add(coverage_index(getattr(handler, "__name__", ""), regs[rs1], regs[rs2], rd, rs1, rs2))
+
+def simulate(case):
+    """
+        (pc, registers, scratch memory) after running case on the simulator,
+        and the coverage bitmap indices it hit"""
+    global machine
+    if machine is None:
+        machine = CPU(b"")
+        machine.attach_dispatch_hook(record)
+        trap = machine.trap
+
+        def traced(cause, tval, delegated):
+            covered.add(HANDLER_INDEX["trap"] << 6 | cause & 0x3F)
+            return trap(cause, tval, delegated)
+        machine.trap = traced
+        machine.begin()
+    program, regs, memory = case
+    cpu = machine
+    covered.clear()
+    dram = cpu.bus.dram
+    dram.store_bytes(DRAM_BASE, b"".join(inst.to_bytes(4, "little") for inst in program))
+    dram.store_bytes(FUZZ_SCRATCH - FUZZ_SCRATCH_SIZE // 2, memory)
+    cpu.regs[:] = regs
+    try:
+        cpu.run(len(program) + 1)
+        scratch = bytes(dram.load_bytes(FUZZ_SCRATCH - FUZZ_SCRATCH_SIZE // 2, FUZZ_SCRATCH_SIZE))
+        return (cpu.pc, list(cpu.regs), scratch), set(covered)
+    finally:
+        cpu.rollback()
+
+def check(case):
+    """
+        (case, how the simulator differs from the reference or None, coverage
+        bitmap indices hit). Exceptions raised by the simulator count as
+        differences."""
+    expected = reference(case)
+    try:
+        (pc, regs, memory), hits = simulate(case)
+    except Exception as error:  # a crash of the simulator itself
+        return case, f"simulator raised {error!r}", set(covered)
+    if pc != expected[0]:
+        return case, f"pc {pc:#010x}, reference {expected[0]:#010x}", hits
+    for index in range(1, 32):  # x0 is cleared before each instruction, so it may hold a stale write
+        if regs[index] != expected[1][index]:
+            return case, f"x{index} = {regs[index]:#010x}, reference {expected[1][index]:#010x}", hits
+    if memory != expected[2]:
+        index = next(i for i in range(FUZZ_SCRATCH_SIZE) if memory[i] != expected[2][i])
+        return case, f"memory at {FUZZ_SCRATCH - FUZZ_SCRATCH_SIZE // 2 + index:#010x} differs", hits
+    return case, None, hits
+
+def minimize(case):
+    """
+        A smaller case that still fails: instructions are removed in halving
+        chunks, then registers besides x3 cleared, while the failure stays."""
+    program, regs, memory = list(case[0]), list(case[1]), case[2]
+
+    def fails(program, regs):
+        return bool(program) and check((program, regs, memory))[1] is not None
+    chunk = max(1, len(program) // 2)
+    while chunk:
+        index = 0
+        while index < len(program):
+            smaller = program[:index] + program[index + chunk:]
+            if fails(smaller, regs):
+                program = smaller
+            else:
+                index += chunk
+        chunk //= 2
+    for rd in range(1, 32):
+        if rd != SCRATCH_BASE and regs[rd]:
+            cleared = regs[:rd] + [0] + regs[rd + 1:]
+            if fails(program, cleared):
+                regs = cleared
+    return program, regs, memory
+
+def describe(case):
+    """
+        Assembly listing of a case's program"""
+    lines = []
+    for inst in case[0]:
+        name, rd, rs1, rs2, imm = decode(inst)
+        lines.append(f"{inst:#010x}  {name} rd=x{rd} rs1=x{rs1} rs2=x{rs2} imm={imm}")
+    return lines
+
+class Fuzzer:
+    """
+        Coverage-guided fuzzing over worker processes (in this process with
+        workers 0). ``Fuzzer(workers=8).run(100000)`` returns the failures
+        found, each a minimized case and how it failed.
+    """
+
+    def __init__(self, workers=None, seed=0, length=FUZZ_PROGRAM_LENGTH):
+        self.workers = multiprocessing.cpu_count() if workers is None else workers
+        self.rng = random.Random(seed)
+        self.length = length
+        self.bitmap = bytearray(FUZZ_BITMAP_SIZE)
+        self.corpus = []  # cases that hit new coverage
+        self.failures = []  # (minimized case, reason)
+        self.executed = 0
+
+    def candidate(self):
+        if self.corpus and self.rng.random() < FUZZ_MUTATE_RATIO:
+            return mutate(self.rng, self.rng.choice(self.corpus))
+        return random_case(self.rng, self.length)
+
+    def merge(self, case, reason, hits):
+        new = False
+        for index in hits:
+            if not self.bitmap[index]:
+                self.bitmap[index] = 1
+                new = True
+        if new:
+            self.corpus.append(case)
+        if reason is not None:
+            self.failures.append((minimize(case), reason))
+        self.executed += 1
+
+    def run(self, cases, stop_on_failure=False):
+        pool = multiprocessing.Pool(self.workers) if self.workers else None
+        try:
+            while self.executed < cases and not (stop_on_failure and self.failures):
+                batch = [self.candidate() for _ in range(min(FUZZ_BATCH * max(1, self.workers), cases - self.executed))]
+                results = pool.map(check, batch, FUZZ_BATCH) if pool is not None else map(check, batch)
+                for result in results:
+                    self.merge(*result)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self.failures
+
+    def coverage(self):
+        return sum(self.bitmap)
+
+    def report(self):
+        lines = [f"{self.executed} cases, {self.coverage()} coverage points, corpus {len(self.corpus)}, "
+                 f"{len(self.failures)} failures"]
+        for case, reason in self.failures:
+            lines.append(f"  {reason}:")
+            lines.extend("    " + line for line in describe(case))
+        return lines
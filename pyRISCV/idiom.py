@@ -0,0 +1,152 @@
+from .params import *
+from .instruction_executor import get_imm, sign_extend
+
+# Idiom recognition: byte loops that copy, fill or scan memory are decoded
+# into one handler that performs all remaining iterations as a single slice
+# operation on DRAM and leaves the registers as the loop would have. The
+# loop shapes are those compilers emit for memcpy, memset and strlen:
+#
+#   copy:  lb/lbu t, o1(src)  sb t, o2(dst)  addi src/dst/n, +-1 ...  bne/bltu
+#   fill:  sb v, o(dst)  addi dst/n, +-1 ...  bne/bltu
+#   scan:  lb/lbu t, o(p)  addi p, p, 1  bnez t
+#
+# in any order, as long as the load comes before the store that uses it.
+# The handler falls back to executing the first instruction normally when
+# the ranges reach outside DRAM or into decoded code, or overlap in a way a
+# forward byte copy would not preserve.
+
+IDIOM_FIRST = {0x03, 0x23, 0x13}  # loops start with a load, store or addi
+MAX_IDIOM_BODY = 6  # longest loop body considered, including the branch
+
+BRANCH_BNE = 0x1
+BRANCH_BLTU = 0x6
+
+class LoopShape:
+    """
+        What one iteration of a recognized loop does: the registers stepped
+        by +-1, the byte load and store with their offsets from the
+        iteration's starting pointer values, and the exit condition.
+    """
+
+    def __init__(self):
+        self.steps = {}  # register -> increment per iteration
+        self.load = None  # (rd, base, offset, signed)
+        self.store = None  # (src, base, offset)
+        self.induction = None  # register compared by the branch
+        self.end = None  # loop-invariant register it is compared with
+
+def analyze(pc, body):
+    """
+        LoopShape of the loop body decoded at pc, or None if it is not one
+        of the recognized shapes."""
+    branch = body[-1][1]
+    branch_pc = pc + sum(length for _, _, length in body[:-1])
+    if branch & 0x7F != 0x63 or len(body) < 2:
+        return None
+    funct3 = (branch >> 12) & 0x7
+    imm = sign_extend(((branch >> 19) & 0x1000) | ((branch >> 20) & 0x7E0) |
+                      ((branch >> 7) & 0x1E) | ((branch << 4) & 0x800), 13)
+    if (branch_pc + imm) & 0xFFFFFFFF != pc or funct3 not in (BRANCH_BNE, BRANCH_BLTU):
+        return None
+    shape = LoopShape()
+    for _, inst, _ in body[:-1]:
+        op, funct3_i = inst & 0x7F, (inst >> 12) & 0x7
+        rd, rs1, rs2 = (inst >> 7) & 0x1F, (inst >> 15) & 0x1F, (inst >> 20) & 0x1F
+        if op == 0x13 and funct3_i == 0x0 and rd == rs1 and rd != 0 and rd not in shape.steps \
+                and get_imm(inst) in (1, -1):
+            shape.steps[rd] = get_imm(inst)
+        elif op == 0x03 and funct3_i in (0x0, 0x4) and shape.load is None and shape.store is None \
+                and rd not in (0, rs1):
+            shape.load = (rd, rs1, shape.steps.get(rs1, 0) + get_imm(inst), funct3_i == 0x0)
+        elif op == 0x23 and funct3_i == 0x0 and shape.store is None:
+            offset = sign_extend(((inst >> 20) & 0xFE0) | ((inst >> 7) & 0x1F), 12)
+            shape.store = (rs2, rs1, shape.steps.get(rs1, 0) + offset)
+        else:
+            return None
+    rs1, rs2 = (branch >> 15) & 0x1F, (branch >> 20) & 0x1F
+    loaded = shape.load[0] if shape.load else None
+    if loaded in shape.steps:
+        return None
+    for _, base, *_ in filter(None, (shape.load, shape.store)):
+        if shape.steps.get(base, 0) != 1:
+            return None  # pointers must walk up one byte per iteration
+    if shape.store is not None:
+        if shape.store[0] in shape.steps:
+            return None
+        if shape.load is not None and shape.store[0] != loaded:
+            return None
+    if shape.store is None:  # scan: bnez on the loaded byte
+        if shape.load is None or funct3 != BRANCH_BNE or {rs1, rs2} != {loaded, 0}:
+            return None
+        return shape
+    if rs1 in shape.steps:
+        shape.induction, shape.end = rs1, rs2
+    elif rs2 in shape.steps and funct3 == BRANCH_BNE:
+        shape.induction, shape.end = rs2, rs1
+    else:
+        return None
+    if shape.end in shape.steps or shape.end == loaded:
+        return None
+    if funct3 == BRANCH_BLTU and shape.steps[shape.induction] != 1:
+        return None
+    return shape
+
+def recognize(pc, body, fallback):
+    """
+        A handler running the loop at pc in bulk, or None if the decoded
+        body is not a recognized idiom. fallback executes the first
+        instruction alone."""
+    shape = analyze(pc, body)
+    if shape is None:
+        return None
+    head_length = body[0][2]
+    exit_pc = pc + sum(length for _, _, length in body)
+    n_insts = len(body)
+    funct3 = (body[-1][1] >> 12) & 0x7
+    steps = list(shape.steps.items())
+    load, store, induction, end = shape.load, shape.store, shape.induction, shape.end
+
+    def bulk_loop(cpu, inst):
+        regs = cpu.regs
+        dram = cpu.bus.dram
+        if store is None:
+            start = (regs[load[1]] + load[2]) & 0xFFFFFFFF
+            n = dram.find_byte(start, 0)
+            if n < 0:
+                return run_first(cpu, inst)
+            n += 1
+        else:
+            value = regs[induction]
+            if funct3 == BRANCH_BNE:
+                n = ((regs[end] - value) * shape.steps[induction]) & 0xFFFFFFFF
+            else:
+                n = max(1, regs[end] - value)
+            if n == 0 or n > dram.size:
+                return run_first(cpu, inst)
+            destination = (regs[store[1]] + store[2]) & 0xFFFFFFFF
+            if not dram.is_plain(destination, n):
+                return run_first(cpu, inst)
+            if load is None:
+                dram.data[destination - dram.base:destination - dram.base + n] = bytes([regs[store[0]] & 0xFF]) * n
+            else:
+                start = (regs[load[1]] + load[2]) & 0xFFFFFFFF
+                if not dram.contains(start, n):
+                    return run_first(cpu, inst)
+                if start < destination < start + n:
+                    return run_first(cpu, inst)  # a forward byte copy would repeat the data
+                index = start - dram.base
+                dram.data[destination - dram.base:destination - dram.base + n] = dram.data[index:index + n]
+        for reg, step in steps:
+            regs[reg] = (regs[reg] + step * n) & 0xFFFFFFFF
+        if load is not None:
+            last = dram.data[start - dram.base + n - 1]
+            regs[load[0]] = sign_extend(last, 8) if load[3] else last
+        cpu.bulk += n * n_insts - 1
+        if cpu.coverage is not None:
+            cpu.coverage.hit(pc, exit_pc - pc)
+        return exit_pc
+
+    def run_first(cpu, inst):
+        cpu.next_pc = pc + head_length
+        return fallback(cpu, inst)
+    return bulk_loop
@@ -1,6 +1,7 @@
 from .params import *
 import logging
 from .rv_enum import *
+from .rv_exception import ExceptionType
 
 def uppack_inst(inst):
     rd = (inst >> 7) & 0x1F
@@ -14,6 +15,14 @@ def to_signed(val, bits):
     else:
         return val
 
+def sign_extend(val, bits):
+    """
+        Sign-extend a bits-wide value to the unsigned 32-bit register form"""
+    if val & (1 << (bits - 1)):
+        return val | (0xFFFFFFFF ^ ((1 << bits) - 1))
+    else:
+        return val
+
 def get_imm(inst, signed=True):
     imm = inst >> 20
     if signed:
@@ -22,19 +31,48 @@ def get_imm(inst, signed=True):
         return imm
 
 class InstructionExecutor:
+    """
+        Handlers for the 32-bit instructions of the base ISA and the given
+        extensions, whose other instructions decode as illegal.
+    """
+
+    def __init__(self, extensions="IMAC"):
+        # RV32A: funct7 is funct5 followed by the aq/rl bits, which are
+        # ignored since every access is performed in program order
+        amo_handlers = [
+            (0x00, self.execute_amoadd_w),
+            (0x01, self.execute_amoswap_w),
+            (0x02, self.execute_lr_w),
+            (0x03, self.execute_sc_w),
+            (0x04, self.execute_amoxor_w),
+            (0x08, self.execute_amoor_w),
+            (0x0C, self.execute_amoand_w),
+            (0x10, self.execute_amomin_w),
+            (0x14, self.execute_amomax_w),
+            (0x18, self.execute_amominu_w),
+            (0x1C, self.execute_amomaxu_w),
+        ]
+        self.amo_map = {funct5 << 2 | aqrl: handler
+                        for funct5, handler in amo_handlers for aqrl in range(4)}
+        self.build_instruction_map()
+        if "M" not in extensions:
+            for functs in self.instruction_map[0x33].values():
+                functs.pop(0x01)
+        if "A" not in extensions:
+            del self.instruction_map[0x2F]
 
     def excute_lui(self, cpu, inst):
         rd, _, _ = uppack_inst(inst)
-        imm = to_signed(inst & 0xFFFFF000, 32)
+        imm = inst & 0xFFFFF000
         logging.debug("LUI: x{} = {:#010x}".format(rd, imm))
         cpu.regs[rd] = imm
         return cpu.update_pc()
     
     def execute_auipc(self, cpu, inst):
         rd, _, _ = uppack_inst(inst)
-        imm = to_signed(inst & 0xFFFFF000, 32)
-        logging.debug("AUIPC: x{} = {:#010x}".format(rd, (cpu.pc + imm)))
-        cpu.regs[rd] = cpu.pc + imm
+        imm = inst & 0xFFFFF000
+        logging.debug("AUIPC: x{} = {:#010x}".format(rd, (cpu.pc + imm) & 0xFFFFFFFF))
+        cpu.regs[rd] = (cpu.pc + imm) & 0xFFFFFFFF
         return cpu.update_pc()
     
     def execute_jal(self, cpu, inst):
@@ -43,16 +81,17 @@ class InstructionExecutor:
                 (inst & 0x000FF000) | \
                 ((inst >> 9) & 0x00000800) | \
                 ((inst >> 20) & 0x7FE)
-        logging.debug("JAL: x{} = {:#010x}, PC = {:#010x} + {:#010x}".format(rd, cpu.pc + 4, cpu.pc, imm))
-        cpu.regs[rd] = cpu.pc + 4
-        return cpu.pc + imm
+        logging.debug("JAL: x{} = {:#010x}, PC = {:#010x} + {:#010x}".format(rd, cpu.next_pc, cpu.pc, imm))
+        cpu.regs[rd] = cpu.next_pc & 0xFFFFFFFF
+        return (cpu.pc + imm) & 0xFFFFFFFF
     
     def execute_jalr(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         imm = get_imm(inst)
-        logging.debug("JALR: x{} = {:#010x}, PC = x{} + {:#010x}".format(rd, cpu.pc + 4, rs1, imm))
-        cpu.regs[rd] = cpu.pc + 4
-        return (cpu.regs[rs1] + imm) & 0xFFFFFFFE
+        logging.debug("JALR: x{} = {:#010x}, PC = x{} + {:#010x}".format(rd, cpu.next_pc, rs1, imm))
+        target = (cpu.regs[rs1] + imm) & 0xFFFFFFFE  # read rs1 before rd is written
+        cpu.regs[rd] = cpu.next_pc & 0xFFFFFFFF
+        return target
 
     def execute_beq(self, cpu, inst):
         _, rs1, rs2 = uppack_inst(inst)
@@ -60,7 +99,7 @@ class InstructionExecutor:
         imm = to_signed(sign << 12 | ((inst >> 7) & 0x1E) | ((inst >> 20) & 0x7e0) | ((inst << 4) & 0x800), 13)
         logging.debug("BEQ: x{} = x{}? pc = {:#010x} + {:#010x}".format(rs1, rs2, cpu.pc, imm))
         if cpu.regs[rs1] == cpu.regs[rs2]:
-            return cpu.pc + imm
+            return (cpu.pc + imm) & 0xFFFFFFFF
         else:
             return cpu.update_pc()
         
@@ -70,7 +109,7 @@ class InstructionExecutor:
         imm = to_signed(sign << 12 | ((inst >> 7) & 0x1E) | ((inst >> 20) & 0x7e0) | ((inst << 4) & 0x800), 13)
         logging.debug("BNE: x{} = x{}? pc = {:#010x} + {:#010x}".format(rs1, rs2, cpu.pc, imm))
         if cpu.regs[rs1] != cpu.regs[rs2]:
-            return cpu.pc + imm
+            return (cpu.pc + imm) & 0xFFFFFFFF
         else:
             return cpu.update_pc()
         
@@ -79,8 +118,8 @@ class InstructionExecutor:
         sign = (inst >> 31) & 0x1
         imm = to_signed(sign << 12 | ((inst >> 7) & 0x1E) | ((inst >> 20) & 0x7e0) | ((inst << 4) & 0x800), 13)
         logging.debug("BLT: x{} = x{}? pc = {:#010x} + {:#010x}".format(rs1, rs2, cpu.pc, imm))
-        if cpu.regs[rs1] < cpu.regs[rs2]:
-            return cpu.pc + imm
+        if (cpu.regs[rs1] ^ 0x80000000) < (cpu.regs[rs2] ^ 0x80000000):  # signed compare
+            return (cpu.pc + imm) & 0xFFFFFFFF
         else:
             return cpu.update_pc()
         
@@ -89,8 +128,8 @@ class InstructionExecutor:
         sign = (inst >> 31) & 0x1
         imm = to_signed(sign << 12 | ((inst >> 7) & 0x1E) | ((inst >> 20) & 0x7e0) | ((inst << 4) & 0x800), 13)
         logging.debug("BGE: x{} = x{}? pc = {:#010x} + {:#010x}".format(rs1, rs2, cpu.pc, imm))
-        if cpu.regs[rs1] >= cpu.regs[rs2]:
-            return cpu.pc + imm
+        if (cpu.regs[rs1] ^ 0x80000000) >= (cpu.regs[rs2] ^ 0x80000000):  # signed compare
+            return (cpu.pc + imm) & 0xFFFFFFFF
         else:
             return cpu.update_pc()
         
@@ -99,8 +138,8 @@ class InstructionExecutor:
         sign = (inst >> 31) & 0x1
         imm = to_signed(sign << 12 | ((inst >> 7) & 0x1E) | ((inst >> 20) & 0x7e0) | ((inst << 4) & 0x800), 13)
         logging.debug("BLTU: x{} = x{}? pc = {:#010x} + {:#010x}".format(rs1, rs2, cpu.pc, imm))
-        if (cpu.regs[rs1] & 0xFFFFFFFF) < (cpu.regs[rs2] & 0xFFFFFFFF):
-            return cpu.pc + imm
+        if cpu.regs[rs1] < cpu.regs[rs2]:
+            return (cpu.pc + imm) & 0xFFFFFFFF
         else:
             return cpu.update_pc()
         
@@ -109,8 +148,8 @@ class InstructionExecutor:
         sign = (inst >> 31) & 0x1
         imm = to_signed(sign << 12 | ((inst >> 7) & 0x1E) | ((inst >> 20) & 0x7e0) | ((inst << 4) & 0x800), 13)
         logging.debug("BGEU: x{} = x{}? pc = {:#010x} + {:#010x}".format(rs1, rs2, cpu.pc, imm))
-        if (cpu.regs[rs1] & 0xFFFFFFFF) >= (cpu.regs[rs2] & 0xFFFFFFFF):
-            return cpu.pc + imm
+        if cpu.regs[rs1] >= cpu.regs[rs2]:
+            return (cpu.pc + imm) & 0xFFFFFFFF
         else:
             return cpu.update_pc()
 
@@ -118,26 +157,52 @@ class InstructionExecutor:
         logging.debug("FENCE")
         return cpu.update_pc()
 
+    def execute_fence_i(self, cpu, inst):
+        logging.debug("FENCE.I")
+        cpu.flush_decode_cache()  # stores to code become visible to fetch
+        return cpu.update_pc()
+
     def execute_fence_vma(self, cpu, inst):
         logging.debug("FENCE.VMA")
         return cpu.update_pc()
 
+    def execute_env(self, cpu, inst):
+        _, _, rs2 = uppack_inst(inst)
+        if rs2 == 0:
+            return self.execute_ecall(cpu, inst)
+        if rs2 == 1:
+            return self.execute_ebreak(cpu, inst)
+        return cpu.exception(ExceptionType.ILLEGAL_INSTRUCTION.value, inst)
+
+    def execute_ecall(self, cpu, inst):
+        logging.debug("ECALL")
+        if cpu.syscalls is not None:
+            return cpu.syscalls.handle()
+        # ECALL_FROM_U, _S and _M are 8 plus the privilege level
+        return cpu.exception(ExceptionType.ECALL_FROM_U.value + cpu.privilegeLevel.value, 0)
+
+    def execute_ebreak(self, cpu, inst):
+        logging.debug("EBREAK")
+        return cpu.exception(ExceptionType.BREAKPOINT.value, cpu.pc)
+
     def execute_sret(self, cpu, inst):
         logging.debug("SRET")
-        sstatus = cpu.csr.load(SSTATUS)
+        csrs = cpu.csr.csrs  # trap return touches the slots directly, like trap entry
+        sstatus = csrs[MSTATUS]  # sstatus is a view of mstatus
         cpu.privilegeLevel = PrivilegeLevel((sstatus & MASK_SPP) >> 8) # set privilege level to spp
         spie = (sstatus & MASK_SPIE) >> 5 # get spie
         sstatus = (sstatus & ~MASK_SIE) | (spie << 1) # set spie to spp
         sstatus = sstatus | MASK_SPIE # set spie to 1
         sstatus = sstatus & ~MASK_SPP # set spp to 0
-        cpu.csr.store(SSTATUS, sstatus)
-        mepc = cpu.csr.load(SEPC) & ~0b11
+        csrs[MSTATUS] = sstatus
+        mepc = csrs[SEPC] & ~0b1  # 2-byte aligned with RVC
         cpu.pc = mepc # set pc to mepc
         return mepc
 
     def execute_mret(self, cpu, inst):
         logging.debug("MRET")
-        mstatus = cpu.csr.load(MSTATUS)
+        csrs = cpu.csr.csrs
+        mstatus = csrs[MSTATUS]
         cpu.privilegeLevel = PrivilegeLevel((mstatus & MASK_MPP) >> 11)
         mpie = (mstatus & MASK_MPIE) >> 7
         mstatus = (mstatus & ~MASK_MIE) | (mpie << 3)
@@ -145,8 +210,8 @@ class InstructionExecutor:
         mstatus = mstatus & ~MASK_MPP # set mpp to 0
         if (mstatus & MASK_MPP) != PrivilegeLevel.MACHINE.value: # if mpp is not 0b11, set mprv to 1
             mstatus = mstatus & ~MASK_MPRV # clear mprv if not machine mode
-        cpu.csr.store(MSTATUS, mstatus)
-        mepc = cpu.csr.load(MEPC) & ~0b11
+        csrs[MSTATUS] = mstatus
+        mepc = csrs[MEPC] & ~0b1
         cpu.pc = mepc
         return mepc
 
@@ -158,21 +223,21 @@ class InstructionExecutor:
         rd, rs1, _ = uppack_inst(inst)
         imm = get_imm(inst)
         logging.debug("LB: x{} = mem[x{} + {:#010x}]".format(rd, rs1, imm))
-        cpu.regs[rd] = to_signed(cpu.load(cpu.regs[rs1] + imm, 8), 8)
+        cpu.regs[rd] = sign_extend(cpu.load(cpu.regs[rs1] + imm, 8), 8)
         return cpu.update_pc()
     
     def execute_lh(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         imm = get_imm(inst)
         logging.debug("LH: x{} = mem[x{} + {:#010x}]".format(rd, rs1, imm))
-        cpu.regs[rd] = to_signed(cpu.load(cpu.regs[rs1] + imm, 16), 16)
+        cpu.regs[rd] = sign_extend(cpu.load(cpu.regs[rs1] + imm, 16), 16)
         return cpu.update_pc()
     
     def execute_lw(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         imm = get_imm(inst)
         logging.debug("LW: x{} = mem[x{} + {:#010x}]".format(rd, rs1, imm))
-        cpu.regs[rd] = to_signed(cpu.load(cpu.regs[rs1] + imm, 32), 32)
+        cpu.regs[rd] = cpu.load(cpu.regs[rs1] + imm, 32)
         return cpu.update_pc()
     
 
@@ -208,55 +273,54 @@ class InstructionExecutor:
         _, rs1, rs2 = uppack_inst(inst)
         imm = to_signed(((inst >> 7) & 0x1F) | ((inst >> 20) & 0xfe0), 12)
         logging.debug("SW: mem[x{} + {:#010x}] = x{}".format(rs1, imm, rs2))
-        cpu.store(cpu.regs[rs1] + imm, cpu.regs[rs2] & 0xFFFFFFFF, 32)
+        cpu.store(cpu.regs[rs1] + imm, cpu.regs[rs2], 32)
         return cpu.update_pc()
     
     def execute_addi(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         imm = get_imm(inst)
         logging.debug("ADDI: x{} = x{} + {:#010x}".format(rd, rs1, imm))
-        cpu.regs[rd] = cpu.regs[rs1] + imm
+        cpu.regs[rd] = (cpu.regs[rs1] + imm) & 0xFFFFFFFF
         return cpu.update_pc()
     
     def execute_slli(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         shamt = (inst >> 20) & 0x1F
         logging.debug("SLLI: x{} = x{} << {:#010x}".format(rd, rs1, shamt))
-        cpu.regs[rd] = cpu.regs[rs1] << shamt
+        cpu.regs[rd] = (cpu.regs[rs1] << shamt) & 0xFFFFFFFF
         return cpu.update_pc()
     
     def execute_slti(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         imm = get_imm(inst)
         logging.debug("SLTI: x{} = x{} < {:#010x}".format(rd, rs1, imm))
-        cpu.regs[rd] = 1 if cpu.regs[rs1] < imm else 0
+        cpu.regs[rd] = 1 if to_signed(cpu.regs[rs1], 32) < imm else 0
         return cpu.update_pc()  
     
     def execute_sltiu(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
-        imm = get_imm(inst, signed=False)
-        unsigned_rs1 = cpu.regs[rs1] & 0xFFFFFFFF
+        imm = get_imm(inst) & 0xFFFFFFFF  # sign-extended, then compared unsigned
         logging.debug("SLTIU: x{} = x{} < {:#010x}".format(rd, rs1, imm))
-        cpu.regs[rd] = 1 if unsigned_rs1 < imm else 0
+        cpu.regs[rd] = 1 if cpu.regs[rs1] < imm else 0
         return cpu.update_pc()  
     
     def execute_xori(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
-        imm = get_imm(inst)
+        imm = get_imm(inst) & 0xFFFFFFFF
         logging.debug("XORI: x{} = x{} ^ {:#010x}".format(rd, rs1, imm))
         cpu.regs[rd] = cpu.regs[rs1] ^ imm
         return cpu.update_pc()
     
     def execute_ori(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
-        imm = get_imm(inst)
+        imm = get_imm(inst) & 0xFFFFFFFF
         logging.debug("ORI: x{} = x{} | {:#010x}".format(rd, rs1, imm))
         cpu.regs[rd] = cpu.regs[rs1] | imm
         return cpu.update_pc()
 
     def execute_andi(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
-        imm = get_imm(inst)
+        imm = get_imm(inst) & 0xFFFFFFFF
         logging.debug("ANDI: x{} = x{} & {:#010x}".format(rd, rs1, imm))
         cpu.regs[rd] = cpu.regs[rs1] & imm
         return cpu.update_pc()
@@ -265,46 +329,44 @@ class InstructionExecutor:
         rd, rs1, _ = uppack_inst(inst)
         shamt = (inst >> 20) & 0x1F
         logging.debug("SRLI: x{} = x{} >> {:#010x}".format(rd, rs1, shamt))
-        cpu.regs[rd] = cpu.regs[rs1] >> shamt & (0xFFFFFFFF >> shamt)
+        cpu.regs[rd] = cpu.regs[rs1] >> shamt
         return cpu.update_pc()
 
     def execute_srai(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         shamt = (inst >> 20) & 0x1F
         logging.debug("SRAI: x{} = x{} >> {:#010x}".format(rd, rs1, shamt))
-        cpu.regs[rd] = cpu.regs[rs1] >> shamt
+        cpu.regs[rd] = (to_signed(cpu.regs[rs1], 32) >> shamt) & 0xFFFFFFFF
         return cpu.update_pc()
 
     def execute_add(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("ADD: x{} = x{} + x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = cpu.regs[rs1] + cpu.regs[rs2]
+        cpu.regs[rd] = (cpu.regs[rs1] + cpu.regs[rs2]) & 0xFFFFFFFF
         return cpu.update_pc()
     
     def execute_sub(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("SUB: x{} = x{} - x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = cpu.regs[rs1] - cpu.regs[rs2]
+        cpu.regs[rd] = (cpu.regs[rs1] - cpu.regs[rs2]) & 0xFFFFFFFF
         return cpu.update_pc()
     
     def execute_sll(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("SLL: x{} = x{} << x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = cpu.regs[rs1] << cpu.regs[rs2]
+        cpu.regs[rd] = (cpu.regs[rs1] << (cpu.regs[rs2] & 0x1F)) & 0xFFFFFFFF
         return cpu.update_pc()
     
     def execute_slt(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("SLT: x{} = x{} < x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = 1 if cpu.regs[rs1] < cpu.regs[rs2] else 0
+        cpu.regs[rd] = 1 if (cpu.regs[rs1] ^ 0x80000000) < (cpu.regs[rs2] ^ 0x80000000) else 0
         return cpu.update_pc()
     
     def execute_sltu(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("SLTU: x{} = x{} < x{}".format(rd, rs1, rs2))
-        unsigned_rs1 = cpu.regs[rs1] & 0xFFFFFFFF
-        unsigned_rs2 = cpu.regs[rs2] & 0xFFFFFFFF
-        cpu.regs[rd] = 1 if unsigned_rs1 < unsigned_rs2 else 0
+        cpu.regs[rd] = 1 if cpu.regs[rs1] < cpu.regs[rs2] else 0
         return cpu.update_pc()
     
     def execute_xor(self, cpu, inst):
@@ -316,13 +378,13 @@ class InstructionExecutor:
     def execute_srl(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("SRL: x{} = x{} >> x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = (cpu.regs[rs1] & 0xFFFFFFFF) >> cpu.regs[rs2]
+        cpu.regs[rd] = cpu.regs[rs1] >> (cpu.regs[rs2] & 0x1F)
         return cpu.update_pc()
     
     def execute_sra(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("SRA: x{} = x{} >> x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = cpu.regs[rs1] >> cpu.regs[rs2]
+        cpu.regs[rd] = (to_signed(cpu.regs[rs1], 32) >> (cpu.regs[rs2] & 0x1F)) & 0xFFFFFFFF
         return cpu.update_pc()
     
     def execute_or(self, cpu, inst):
@@ -340,124 +402,197 @@ class InstructionExecutor:
     def execute_mul(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("MUL: x{} = x{} * x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = to_signed((cpu.regs[rs1] * cpu.regs[rs2]) & 0xFFFFFFFF, 32)
+        cpu.regs[rd] = (cpu.regs[rs1] * cpu.regs[rs2]) & 0xFFFFFFFF
         return cpu.update_pc()
 
     def execute_mulh(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("MULH: x{} = x{} * x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = (cpu.regs[rs1] * cpu.regs[rs2]) >> 32
+        cpu.regs[rd] = ((to_signed(cpu.regs[rs1], 32) * to_signed(cpu.regs[rs2], 32)) >> 32) & 0xFFFFFFFF
         return cpu.update_pc()
 
     def execute_mulhsu(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("MULHSU: x{} = x{} * x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = (cpu.regs[rs1] * (cpu.regs[rs2] & 0xFFFFFFFF)) >> 32
+        cpu.regs[rd] = ((to_signed(cpu.regs[rs1], 32) * cpu.regs[rs2]) >> 32) & 0xFFFFFFFF
         return cpu.update_pc()
 
     def execute_mulhu(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("MULHU: x{} = x{} * x{}".format(rd, rs1, rs2))
-        cpu.regs[rd] = ((cpu.regs[rs1] & 0xFFFFFFFF) * (cpu.regs[rs2] & 0xFFFFFFFF)) >> 32
+        cpu.regs[rd] = (cpu.regs[rs1] * cpu.regs[rs2]) >> 32
         return cpu.update_pc()
 
     def execute_div(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("DIV: x{} = x{} / x{}".format(rd, rs1, rs2))
-        if rs2 == 0:
-            raise ZeroDivisionError("division by zero")
+        dividend = to_signed(cpu.regs[rs1], 32)
+        divisor = to_signed(cpu.regs[rs2], 32)
+        if divisor == 0:
+            cpu.regs[rd] = 0xFFFFFFFF  # division by zero returns -1
         else:
-            cpu.regs[rd] = cpu.regs[rs1] // cpu.regs[rs2]
+            quotient = abs(dividend) // abs(divisor)  # round towards zero
+            if (dividend < 0) != (divisor < 0):
+                quotient = -quotient
+            cpu.regs[rd] = quotient & 0xFFFFFFFF  # -2**31 / -1 overflows back to -2**31
         return cpu.update_pc()
 
     def execute_divu(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("DIVU: x{} = x{} / x{}".format(rd, rs1, rs2))
-        if rs2 == 0:
-            raise ZeroDivisionError("division by zero")
+        if cpu.regs[rs2] == 0:
+            cpu.regs[rd] = 0xFFFFFFFF  # division by zero returns 2**32 - 1
         else:
-            cpu.regs[rd] = (cpu.regs[rs1] & 0xFFFFFFFF) // (cpu.regs[rs2] & 0xFFFFFFFF)
+            cpu.regs[rd] = cpu.regs[rs1] // cpu.regs[rs2]
         return cpu.update_pc()
 
     def execute_rem(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("REM: x{} = x{} % x{}".format(rd, rs1, rs2))
-        if rs2 == 0:
-            raise ZeroDivisionError("division by zero")
+        dividend = to_signed(cpu.regs[rs1], 32)
+        divisor = to_signed(cpu.regs[rs2], 32)
+        if divisor == 0:
+            cpu.regs[rd] = cpu.regs[rs1]  # remainder of division by zero is the dividend
         else:
-            cpu.regs[rd] = cpu.regs[rs1] % cpu.regs[rs2]
+            remainder = abs(dividend) % abs(divisor)  # takes the sign of the dividend
+            if dividend < 0:
+                remainder = -remainder
+            cpu.regs[rd] = remainder & 0xFFFFFFFF
         return cpu.update_pc()
 
     def execute_remu(self, cpu, inst):
         rd, rs1, rs2 = uppack_inst(inst)
         logging.debug("REMU: x{} = x{} % x{}".format(rd, rs1, rs2))
-        if rs2 == 0:
-            raise ZeroDivisionError("division by zero")
+        if cpu.regs[rs2] == 0:
+            cpu.regs[rd] = cpu.regs[rs1]  # remainder of division by zero is the dividend
         else:
-            cpu.regs[rd] = (cpu.regs[rs1] & 0xFFFFFFFF) % (cpu.regs[rs2] & 0xFFFFFFFF)
+            cpu.regs[rd] = cpu.regs[rs1] % cpu.regs[rs2]
         return cpu.update_pc()
 
+    def execute_lr_w(self, cpu, inst):
+        rd, rs1, _ = uppack_inst(inst)
+        address = cpu.regs[rs1]
+        logging.debug("LR.W: x{} = mem[x{}]".format(rd, rs1))
+        if address & 0x3:
+            return cpu.exception(ExceptionType.LOAD_ADDRESS_MISALIGNED.value, address)
+        cpu.regs[rd] = cpu.load_reserved(address)
+        return cpu.update_pc()
+
+    def execute_sc_w(self, cpu, inst):
+        rd, rs1, rs2 = uppack_inst(inst)
+        address = cpu.regs[rs1]
+        logging.debug("SC.W: mem[x{}] = x{}, x{} = fail".format(rs1, rs2, rd))
+        if address & 0x3:
+            return cpu.exception(ExceptionType.STORE_AMO_ADDRESS_MISALIGNED.value, address)
+        success = cpu.store_conditional(address, cpu.regs[rs2])
+        cpu.regs[rd] = 0 if success else 1
+        return cpu.update_pc()
+
+    def execute_amo_w(self, cpu, inst, name, op):
+        rd, rs1, rs2 = uppack_inst(inst)
+        address = cpu.regs[rs1]
+        logging.debug("{}: x{} = mem[x{}], mem[x{}] op= x{}".format(name, rd, rs1, rs1, rs2))
+        if address & 0x3:
+            return cpu.exception(ExceptionType.STORE_AMO_ADDRESS_MISALIGNED.value, address)
+        src = cpu.regs[rs2]
+        cpu.regs[rd] = cpu.amo(address, lambda old: op(old, src))
+        return cpu.update_pc()
+
+    def execute_amoswap_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOSWAP.W", lambda old, src: src)
+
+    def execute_amoadd_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOADD.W", lambda old, src: old + src)
+
+    def execute_amoxor_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOXOR.W", lambda old, src: old ^ src)
+
+    def execute_amoand_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOAND.W", lambda old, src: old & src)
+
+    def execute_amoor_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOOR.W", lambda old, src: old | src)
+
+    def execute_amomin_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOMIN.W",
+                                  lambda old, src: min(to_signed(old, 32), to_signed(src, 32)))
+
+    def execute_amomax_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOMAX.W",
+                                  lambda old, src: max(to_signed(old, 32), to_signed(src, 32)))
+
+    def execute_amominu_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOMINU.W", lambda old, src: min(old, src))
+
+    def execute_amomaxu_w(self, cpu, inst):
+        return self.execute_amo_w(cpu, inst, "AMOMAXU.W", lambda old, src: max(old, src))
+
     def execute_csrrw(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         csr_addr = get_imm(inst, signed=False)
         logging.debug("CSRRW: x{} = CSR[{:#010x}], x{}".format(rd, csr_addr, rs1))
-        t = cpu.csr.load(csr_addr)
-        cpu.csr.store(csr_addr, (cpu.regs[rs1] & 0xFFFFFFFF))
-        cpu.regs[rd] = to_signed(t, 32)
+        privilege = cpu.privilegeLevel.value
+        t = cpu.csr.read(csr_addr, privilege) if rd != 0 else 0  # no read side effects for rd = x0
+        cpu.csr.write(csr_addr, cpu.regs[rs1], privilege)
+        cpu.regs[rd] = t
         return cpu.update_pc()
 
     def execute_csrrs(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         csr_addr = get_imm(inst, signed=False)
         logging.debug("CSRRS: x{} = CSR[{:#010x}], x{}".format(rd, csr_addr, rs1))
-        t = cpu.csr.load(csr_addr)
-        cpu.csr.store(csr_addr, t | (cpu.regs[rs1] & 0xFFFFFFFF))
-        cpu.regs[rd] = to_signed(t, 32)
+        privilege = cpu.privilegeLevel.value
+        t = cpu.csr.read(csr_addr, privilege)
+        if rs1 != 0:  # csrrs with x0 only reads, so read-only CSRs can be read
+            cpu.csr.write(csr_addr, t | cpu.regs[rs1], privilege)
+        cpu.regs[rd] = t
         return cpu.update_pc()
     
     def execute_csrrc(self, cpu, inst):
         rd, rs1, _ = uppack_inst(inst)
         csr_addr = get_imm(inst, signed=False)
         logging.debug("CSRRC: x{} = CSR[{:#010x}], x{}".format(rd, csr_addr, rs1))
-        t = cpu.csr.load(csr_addr)
-        cpu.csr.store(csr_addr, t & (~(cpu.regs[rs1] & 0xFFFFFFFF)))
-        cpu.regs[rd] = to_signed(t, 32)
+        privilege = cpu.privilegeLevel.value
+        t = cpu.csr.read(csr_addr, privilege)
+        if rs1 != 0:
+            cpu.csr.write(csr_addr, t & ~cpu.regs[rs1], privilege)
+        cpu.regs[rd] = t
         return cpu.update_pc()
     
     def execute_csrrwi(self, cpu, inst):
         rd, imm, _ = uppack_inst(inst)
         csr_addr = get_imm(inst, signed=False)
         logging.debug("CSRRWI: x{} = CSR[{:#010x}], {:#010x}".format(rd, csr_addr, imm))
-        t = cpu.csr.load(csr_addr)
-        cpu.csr.store(csr_addr, (imm & 0xFFFFFFFF))
-        cpu.regs[rd] = to_signed(t, 32)
+        privilege = cpu.privilegeLevel.value
+        t = cpu.csr.read(csr_addr, privilege) if rd != 0 else 0
+        cpu.csr.write(csr_addr, imm, privilege)
+        cpu.regs[rd] = t
         return cpu.update_pc()
     
     def execute_csrrsi(self, cpu, inst):
         rd, imm, _ = uppack_inst(inst)
         csr_addr = get_imm(inst, signed=False)
         logging.debug("CSRRSI: x{} = CSR[{:#010x}], {:#010x}".format(rd, csr_addr, imm))
-        t = cpu.csr.load(csr_addr)
-        cpu.csr.store(csr_addr, t | (imm & 0xFFFFFFFF))
-        cpu.regs[rd] = to_signed(t, 32)
+        privilege = cpu.privilegeLevel.value
+        t = cpu.csr.read(csr_addr, privilege)
+        if imm != 0:
+            cpu.csr.write(csr_addr, t | imm, privilege)
+        cpu.regs[rd] = t
         return cpu.update_pc()
     
     def execute_csrrci(self, cpu, inst):
         rd, imm, _ = uppack_inst(inst)
         csr_addr = get_imm(inst, signed=False)
         logging.debug("CSRRCI: x{} = CSR[{:#010x}], {:#010x}".format(rd, csr_addr, imm))
-        t = cpu.csr.load(csr_addr)
-        cpu.csr.store(csr_addr, t & (~(imm & 0xFFFFFFFF)))
-        cpu.regs[rd] = to_signed(t, 32)
+        privilege = cpu.privilegeLevel.value
+        t = cpu.csr.read(csr_addr, privilege)
+        if imm != 0:
+            cpu.csr.write(csr_addr, t & ~imm, privilege)
+        cpu.regs[rd] = t
         return cpu.update_pc()
 
-    def execute(self, cpu, inst):
-        op = inst & 0x7F
-        funct3 = (inst >> 12) & 0x7
-        funct7 = (inst >> 25) & 0x7F
-        cpu.regs[0] = 0  # set x0 to 0
-        logging.debug("Executing instruction: {:#010x}, funct3: {:#04x}".format(inst, funct3))
-        instruction_map = {
+    def build_instruction_map(self):
+        self.instruction_map = {
             0x37: self.excute_lui,          # U-type
             0x17: self.execute_auipc,       # U-type
             0x6F: self.execute_jal,         # J-type
@@ -532,7 +667,11 @@ class InstructionExecutor:
                 }
             },
             0x0f:{
-                0x0: self.execute_fence
+                0x0: self.execute_fence,
+                0x1: self.execute_fence_i,
+            },
+            0x2F:{ # opcode 0x2F (RV32A)
+                0x2: self.amo_map,  # funct3 0x2 (.W)
             },
             0x73:{ # opcode 0x73
                 0x1: self.execute_csrrw,
@@ -542,6 +681,7 @@ class InstructionExecutor:
                 0x6: self.execute_csrrsi,
                 0x7: self.execute_csrrci,
                 0x0:{  # funct3 0x0
+                    0x00: self.execute_env,  # funct7 0x00 ECALL/EBREAK
                     0x08: self.execute_sret,  # funct7 0x08 SRET
                     0x18: self.execute_mret,  # funct7 0x18 MRET
                     # 0x20: self.execute_wfi,  # funct7 0x20 WFI
@@ -549,16 +689,21 @@ class InstructionExecutor:
                 }
             }
         }
-        exe = instruction_map.get(op, None)
-        if exe is None:
-            raise Exception("Invalid opcode: {:#010x}".format(op))
+
+    def decode(self, inst):
+        """
+            The handler for a 32-bit instruction, or None if it is illegal"""
+        exe = self.instruction_map.get(inst & 0x7F, None)
         if isinstance(exe, dict):
-            exe = exe.get(funct3, None)
-            if exe is None:
-                raise Exception("Invalid funct3: {:#04x}".format(funct3))
+            exe = exe.get((inst >> 12) & 0x7, None)
             if isinstance(exe, dict):
-                exe = exe.get(funct7, None)
-                if exe is None:
-                    raise Exception("Invalid funct7: {:#07x}".format(funct7))
+                exe = exe.get((inst >> 25) & 0x7F, None)
+        return exe
 
-        return exe(cpu, inst)
\ No newline at end of file
+    def execute(self, cpu, inst):
+        cpu.regs[0] = 0  # set x0 to 0
+        logging.debug("Executing instruction: {:#010x}, funct3: {:#04x}".format(inst, (inst >> 12) & 0x7))
+        exe = self.decode(inst)
+        if exe is None:
+            return cpu.exception(ExceptionType.ILLEGAL_INSTRUCTION.value, inst)
+        return exe(cpu, inst)
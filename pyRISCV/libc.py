@@ -0,0 +1,92 @@
+from .params import *
+
+# Host implementations of the libc memory and string functions. With
+# intercept_libc() a call to one of them is decoded into a handler that does
+# the work directly on the DRAM buffer, puts the result in a0 and returns to
+# ra. The instructions the function would have retired are estimated from
+# the byte loops of newlib's size-optimized versions and charged to the
+# counters, so cycle/instret/time advance as if it had run.
+#
+# Each implementation returns (a0, bytes processed), or None to run the
+# function's own code instead: when a range reaches outside DRAM, a
+# destination holds decoded code, or a string is not terminated.
+
+def memcpy(dram, dest, src, n):
+    if not dram.is_plain(dest, n) or not dram.contains(src, n):
+        return None
+    index = src - dram.base
+    dram.data[dest - dram.base:dest - dram.base + n] = bytes(dram.data[index:index + n])
+    return dest, n
+
+def memset(dram, dest, c, n):
+    if not dram.is_plain(dest, n):
+        return None
+    dram.data[dest - dram.base:dest - dram.base + n] = bytes([c & 0xFF]) * n
+    return dest, n
+
+def strlen(dram, s, *_):
+    n = dram.find_byte(s, 0)
+    if n < 0:
+        return None
+    return n, n + 1
+
+def compare(a, b):
+    """
+        (difference of the first differing bytes, bytes examined)"""
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return x - y, i + 1
+    return 0, len(a)
+
+def memcmp(dram, s1, s2, n):
+    if not dram.contains(s1, n) or not dram.contains(s2, n):
+        return None
+    a, b = dram.load_bytes(s1, n), dram.load_bytes(s2, n)
+    if a == b:
+        return 0, n
+    return compare(a, b)
+
+def strcmp(dram, s1, s2, _):
+    n1, n2 = dram.find_byte(s1, 0), dram.find_byte(s2, 0)
+    if n1 < 0 or n2 < 0:
+        return None
+    n = min(n1, n2) + 1  # the shorter string's terminator decides the rest
+    return compare(dram.load_bytes(s1, n), dram.load_bytes(s2, n))
+
+# name -> (implementation, instructions per call, instructions per byte)
+LIBC_FUNCTIONS = {
+    "memcpy": (memcpy, 4, 5),
+    "memmove": (memcpy, 8, 5),  # slices copy through a temporary, so overlap is safe
+    "memset": (memset, 4, 3),
+    "strlen": (strlen, 3, 3),
+    "strcmp": (strcmp, 3, 6),
+    "memcmp": (memcmp, 4, 6),
+}
+
+def intercept(function, fixed, per_byte):
+    """
+        Builder for the decode-time handler of one function: given the
+        handler of its first instruction, returns one that runs the
+        function natively, falling back to that instruction."""
+    def build(fallback):
+        def native(cpu, inst):
+            regs = cpu.regs
+            result = function(cpu.bus.dram, regs[10], regs[11], regs[12])
+            if result is None:
+                return fallback(cpu, inst)
+            value, n = result
+            regs[10] = value & 0xFFFFFFFF
+            cpu.bulk += fixed + per_byte * n - 1
+            return regs[1] & 0xFFFFFFFE
+        return native
+    return build
+
+def intercept_libc(cpu, symbols):
+    """
+        Intercept calls to the libc functions found in symbols (name ->
+        address, e.g. ELF(data).symbols). Returns the names intercepted."""
+    names = [name for name in LIBC_FUNCTIONS if name in symbols]
+    for name in names:
+        cpu.intercepts[symbols[name]] = intercept(*LIBC_FUNCTIONS[name])
+    cpu.flush_decode_cache()
+    return names
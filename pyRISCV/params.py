@@ -6,14 +6,145 @@ DRAM_END = DRAM_BASE + DRAM_SIZE - 1  # End address of DRAM
 SERIAL_BASE = 0x10000000  # Base address of serial device
 SERIAL_SIZE = 0x1000  # Size of serial device
 SERIAL_END = SERIAL_BASE + SERIAL_SIZE - 1  # End address of serial device
+SERIAL_RBR = 0x0  # Offset of the receive buffer register, 16550 style
+SERIAL_LSR = 0x5  # Offset of the line status register
+SERIAL_LSR_DR = 0x01  # LSR: received data ready
+SERIAL_LSR_THRE = 0x20  # LSR: transmitter ready for another byte
+
+# Block device backed by a memory-mapped host file
+BLOCK_BASE = 0x10001000  # Base address of the block device
+BLOCK_SIZE = 0x1000  # Size of the block device
+BLOCK_END = BLOCK_BASE + BLOCK_SIZE - 1  # End address of the block device
+BLOCK_SECTOR = 0x0  # Offset of the first sector to transfer
+BLOCK_BUFFER = 0x4  # Offset of the DRAM address to transfer to or from
+BLOCK_COUNT = 0x8  # Offset of the number of sectors to transfer
+BLOCK_COMMAND = 0xC  # Offset of the command register, writing it performs the request
+BLOCK_STATUS = 0x10  # Offset of the status of the last request
+BLOCK_CAPACITY = 0x14  # Offset of the number of sectors, 8 bytes, read-only
+BLOCK_REGISTERS = 0x1C  # Bytes of registers
+BLOCK_READ = 1  # Command: copy sectors from the device into DRAM
+BLOCK_WRITE = 2  # Command: copy DRAM into sectors of the device
+BLOCK_OK = 0  # Status: the request completed
+BLOCK_ERROR = 1  # Status: bad command, sectors past the end, buffer outside DRAM or a read-only device
+SECTOR_SIZE = 512  # Bytes per sector
+
+# DMA controller copying chains of descriptors between DRAM ranges
+DMA_BASE = 0x10002000  # Base address of the DMA controller
+DMA_SIZE = 0x1000  # Size of the DMA controller
+DMA_END = DMA_BASE + DMA_SIZE - 1  # End address of the DMA controller
+DMA_DESCRIPTOR = 0x0  # Offset of the DRAM address of the first descriptor
+DMA_CONTROL = 0x4  # Offset of the control register
+DMA_STATUS = 0x8  # Offset of the status register, write 1s to clear DONE and ERROR
+DMA_REGISTERS = 0xC  # Bytes of registers
+DMA_START = 0x1  # CONTROL: start the chain at DESCRIPTOR, reads back as 0
+DMA_INTERRUPT_ENABLE = 0x2  # CONTROL: raise the external interrupt while DONE or ERROR is set
+DMA_BUSY = 0x1  # STATUS: a chain is in flight
+DMA_DONE = 0x2  # STATUS: the last chain completed
+DMA_ERROR = 0x4  # STATUS: the last chain had a descriptor or range outside DRAM
+DMA_DESCRIPTOR_SIZE = 16  # Bytes per descriptor: source, destination, length, next (0 ends the chain)
+DMA_MAX_DESCRIPTORS = 4096  # Longest chain, so a looping chain ends in an error
+DMA_SETUP_DELAY = 50  # Instructions retired between start and completion, besides the copying
+DMA_BYTES_PER_INSTRUCTION = 8  # Bytes copied per instruction retired meanwhile
+
+# Framebuffer: pixel memory mapped straight into the bus, and its registers
+FB_BASE = 0x30000000  # Base address of the pixel memory
+FB_WIDTH = 320  # Pixels per row
+FB_HEIGHT = 240  # Rows
+FB_SIZE = FB_WIDTH * FB_HEIGHT * 4  # Bytes of pixel memory, one 0x00RRGGBB word per pixel
+FB_END = FB_BASE + FB_SIZE - 1  # End address of the pixel memory
+FB_CONTROL_BASE = 0x10003000  # Base address of the framebuffer registers
+FB_CONTROL_SIZE = 0x1000  # Size of the framebuffer registers
+FB_CONTROL_END = FB_CONTROL_BASE + FB_CONTROL_SIZE - 1  # End address of the framebuffer registers
+FB_VSYNC = 0x0  # Offset of the vsync register, writing it completes a frame
+FB_FRAMES = 0x4  # Offset of the number of frames completed, read-only
+FB_GEOMETRY = 0x8  # Offset of width | height << 16, read-only
+FB_VIEWER_PERIOD = 50  # Milliseconds between redraws in the viewer process
+
+# Core-local interruptor (CLINT), laid out like the SiFive CLINT
+CLINT_BASE = 0x2000000  # Base address of CLINT
+CLINT_SIZE = 0x10000  # Size of CLINT
+CLINT_END = CLINT_BASE + CLINT_SIZE - 1  # End address of CLINT
+CLINT_MSIP = 0x0  # Offset of msip registers, 4 bytes per hart
+CLINT_MTIMECMP = 0x4000  # Offset of mtimecmp registers, 8 bytes per hart
+CLINT_MTIME = 0xBFF8  # Offset of the mtime register
+PAGE_SHIFT = 12  # DRAM is tracked in 4KB pages for decode cache invalidation and checkpoints
+PAGE_CODE = 0x1  # page flag: holds decoded instructions
+PAGE_SAVE = 0x2  # page flag: save its contents before the next write (checkpoints)
+FIND_CHUNK = 256  # Bytes copied by the first step of a byte search in shared DRAM, doubling after each
+INSTRUCTIONS_PER_TICK = 10  # Instructions retired per mtime tick
+
+# Default cache geometry for the optional cache model
+CACHE_LINE_SIZE = 64  # Bytes per cache line
+L1_SIZE = 16 * 1024  # Bytes in each of the L1 instruction and data caches
+L1_ASSOC = 4  # Ways per L1 set
+L2_SIZE = 256 * 1024  # Bytes in the unified L2 cache
+L2_ASSOC = 8  # Ways per L2 set
+
+# Costs in cycles for the in-order 5-stage timing model
+MUL_CYCLES = 3  # mul/mulh* occupy execute for this long
+DIV_CYCLES = 34  # div/rem are iterative
+LOAD_USE_STALL = 1  # Bubble when the next instruction reads a loaded register
+JAL_PENALTY = 1  # jal redirects fetch from decode
+TAKEN_PENALTY = 2  # Taken branches and jalr redirect fetch from execute
+MISPREDICT_PENALTY = 2  # Replaces TAKEN_PENALTY when a branch predictor is modelled
+TRAP_PENALTY = 4  # Pipeline flush on a trap or xret
+L1_MISS_PENALTY = 10  # Extra cycles for an access missing L1
+L2_MISS_PENALTY = 100  # Extra cycles for an access missing L2 as well
+MAX_BLOCK = 4096  # Longest straight-line block the timing model walks
+
+# Checkpoints behind reverse execution in the debugger
+CHECKPOINT_INTERVAL = 100000  # Instructions between checkpoints
+CHECKPOINT_BUDGET = 64 << 20  # Bytes of saved pages kept before the oldest checkpoints are dropped
+
+# Co-simulation against a reference commit log
+COSIM_CONTEXT = 8  # Reference lines shown before a divergence
+LOG_BUFFER_SIZE = 1 << 20  # Read buffer for commit logs
+
+# Differential instruction fuzzer
+FUZZ_PROGRAM_LENGTH = 32  # Instructions per generated program
+FUZZ_MAX_SKIP = 4  # Furthest forward branch or jal, in instructions
+FUZZ_SCRATCH = DRAM_BASE + 0x10000  # Middle of the region fuzzed loads and stores address, kept in x3
+FUZZ_SCRATCH_SIZE = 0x1000  # Bytes of scratch memory, covering every 12-bit offset from x3
+FUZZ_BITMAP_SIZE = 0x2000  # Coverage points: 128 simulator handlers x operand classes
+FUZZ_MUTATE_RATIO = 0.8  # Share of cases mutated from the corpus rather than generated
+FUZZ_BATCH = 64  # Cases per worker task
+
+# Simulation daemon serving jobs over a Unix socket
+DAEMON_MACHINES = 4  # Machine configurations each worker keeps allocated
+DAEMON_MAX_REQUEST = 64 << 20  # Longest job request line, in bytes
+DAEMON_OUTPUTS = ("exit_code", "output", "retired")  # Results returned when a job does not ask for others
+
+# Syscall numbers of the RISC-V Linux/newlib ABI, passed in a7
+SYS_OPENAT = 56
+SYS_CLOSE = 57
+SYS_READ = 63
+SYS_WRITE = 64
+SYS_FSTAT = 80
+SYS_EXIT = 93
+SYS_EXIT_GROUP = 94
+SYS_GETTIMEOFDAY = 169
+SYS_BRK = 214
+SYS_OPEN = 1024  # newlib's legacy open
+AT_FDCWD = -100  # openat dirfd meaning the current directory
+PATH_MAX = 4096  # Longest path read from the guest
+BRK_ALIGN = 0x1000  # Initial program break is page aligned
+
+# SMP parameters
+MAX_HARTS = 8  # Maximum number of harts in an SMP machine
+INTERRUPT_POLL_INTERVAL = 1024  # Instructions executed between interrupt checks
+HART_POLL_TIMEOUT = 0.5  # Seconds between checks for hart processes that died without reporting
 
 # Machine CSR parameters
 NUM_CSRS = 4096  # Number of CSRs
 # Machine Information Registers (M-mode CSRs)
+MVENDORID = 0xF11  # Vendor ID register
+MARCHID = 0xF12  # Architecture ID register
+MIMPID = 0xF13  # Implementation ID register
 MHARTID = 0xF14  # MHARTID register value
 
 # Machine trap setup CSRs
 MSTATUS = 0x300  # Machine status register
+MISA = 0x301  # ISA and extensions register
 MEDELEG = 0x302  # Machine exception delegation register
 MIDELEG = 0x303  # Machine interrupt delegation register
 MIE = 0x304  # Machine interrupt-enable register
@@ -27,6 +158,36 @@ MCAUSE = 0x342  # Machine trap cause register
 MTVAL = 0x343  # Machine bad address or instruction
 MIP = 0x344  # Machine interrupt pending register
 
+# Counters and hardware performance monitor CSRs
+MCYCLE = 0xB00  # Machine cycle counter
+MINSTRET = 0xB02  # Machine instructions-retired counter
+MHPMCOUNTER3 = 0xB03  # First of 29 machine performance-monitoring counters
+MCYCLEH = 0xB80  # Upper 32 bits of mcycle
+MINSTRETH = 0xB82  # Upper 32 bits of minstret
+MHPMCOUNTER3H = 0xB83  # Upper 32 bits of mhpmcounter3
+CYCLE = 0xC00  # Cycle counter for RDCYCLE
+TIME = 0xC01  # Timer for RDTIME
+INSTRET = 0xC02  # Instructions-retired counter for RDINSTRET
+HPMCOUNTER3 = 0xC03  # First of 29 user performance-monitoring counters
+CYCLEH = 0xC80  # Upper 32 bits of cycle
+TIMEH = 0xC81  # Upper 32 bits of time
+INSTRETH = 0xC82  # Upper 32 bits of instret
+HPMCOUNTER3H = 0xC83  # Upper 32 bits of hpmcounter3
+MHPMEVENT3 = 0x323  # First of 29 machine performance-monitoring event selectors
+NUM_COUNTERS = 32  # cycle, time, instret and hpmcounter3..31
+
+# Events selectable through mhpmevent, counted only while selected
+HPM_EVENT_NONE = 0  # Counter does not count
+HPM_EVENT_LOAD = 1  # Loads executed
+HPM_EVENT_STORE = 2  # Stores executed
+HPM_EVENT_BRANCH_TAKEN = 3  # Conditional branches taken
+HPM_EVENT_TRAP = 4  # Exceptions and interrupts taken
+NUM_HPM_EVENTS = 5  # Number of event ids
+
+# Machine memory protection CSRs
+PMPCFG0 = 0x3A0  # First of 4 PMP configuration registers
+PMPADDR0 = 0x3B0  # First of 16 PMP address registers
+
 # Supervisor CSR parameters
 SSTATUS = 0x100  # Supervisor status register
 SIE = 0x104  # Supervisor interrupt-enable register
@@ -65,3 +226,17 @@ MASK_STIP = 1 << 5  # 监管定时器中断挂起掩码
 MASK_MTIP = 1 << 7  # 机器定时器中断挂起掩码
 MASK_SEIP = 1 << 9  # 监管外部中断挂起掩码
 MASK_MEIP = 1 << 11  # 机器外部中断挂起掩码
+MASK_MIP_WRITABLE = MASK_SSIP | MASK_STIP | MASK_SEIP  # mip 中软件可写的位
+
+# misa value: RV32 with the I, M, A, C, S and U extensions
+MISA_VALUE = (1 << 30) | (1 << 0) | (1 << 2) | (1 << 8) | (1 << 12) | (1 << 18) | (1 << 20)
+
+# Interrupt causes
+INTERRUPT_BIT = 1 << 31  # 中断标志位 (mcause/scause 最高位)
+IRQ_S_SOFT = 1  # 监管软件中断
+IRQ_M_SOFT = 3  # 机器软件中断
+IRQ_S_TIMER = 5  # 监管定时器中断
+IRQ_M_TIMER = 7  # 机器定时器中断
+IRQ_S_EXT = 9  # 监管外部中断
+IRQ_M_EXT = 11  # 机器外部中断
+IRQ_PRIORITY = [IRQ_M_EXT, IRQ_M_SOFT, IRQ_M_TIMER, IRQ_S_EXT, IRQ_S_SOFT, IRQ_S_TIMER]  # 中断优先级
@@ -0,0 +1,130 @@
+import struct
+from .params import *
+from .syscall import SyscallProxy, STAT_FORMAT, TIMEVAL_FORMAT
+from .instruction_executor import to_signed
+
+# Record/replay of the inputs that make a run non-deterministic: bytes read
+# from the UART and the results of host syscalls, together with the guest
+# memory those syscalls wrote. mtime is derived from the instruction count,
+# so timer reads replay by themselves. The log is a magic string followed
+# by events, each an EVENT_FORMAT header (instructions retired before the
+# event, kind, payload length) and a payload:
+#
+#   EVENT_UART:     the byte (or status) the load returned, as one byte
+#   EVENT_SYSCALL:  SYSCALL_FORMAT (number, result, address written), then
+#                   the bytes written there
+#
+# Replaying checks each event's kind and instruction count, so a replay that
+# drifts from the recording stops with ReplayError instead of going on with
+# the wrong inputs.
+
+LOG_MAGIC = b"RVRL\x01"
+EVENT_FORMAT = "<QBI"
+SYSCALL_FORMAT = "<IiI"
+EVENT_UART = 1
+EVENT_SYSCALL = 2
+
+# syscalls whose effect depends only on the guest, so replay runs them again
+DETERMINISTIC_SYSCALLS = {SYS_EXIT, SYS_EXIT_GROUP, SYS_BRK}
+
+def syscall_output(number, args, result):
+    """
+        (address, length) of the guest memory the syscall wrote, if any"""
+    if number == SYS_READ and result > 0:
+        return args[1], result
+    if number == SYS_FSTAT and result == 0:
+        return args[1], struct.calcsize(STAT_FORMAT)
+    if number == SYS_GETTIMEOFDAY and args[0]:
+        return args[0], struct.calcsize(TIMEVAL_FORMAT)
+    return 0, 0
+
+class ReplayError(Exception):
+    pass
+
+class Recorder:
+    """
+        Logs the inputs of a run to stream, a binary file. Attach after the
+        syscall proxy, if any: ``Recorder(cpu, open(path, "wb"))``.
+    """
+
+    def __init__(self, cpu, stream):
+        self.cpu = cpu
+        self.stream = stream
+        stream.write(LOG_MAGIC)
+        self.serial_load = cpu.bus.serial.load
+        cpu.bus.serial.load = self.uart_load
+        self.proxy = cpu.syscalls
+        if self.proxy is not None:
+            self.proxy.handle = self.syscall
+
+    def event(self, retired, kind, payload):
+        self.stream.write(struct.pack(EVENT_FORMAT, retired, kind, len(payload)) + payload)
+
+    def uart_load(self, addr, size):
+        value = self.serial_load(addr, size)
+        self.event(self.cpu.retired(), EVENT_UART, bytes([value & 0xFF]))
+        return value
+
+    def syscall(self):
+        regs = self.cpu.regs
+        number, args = regs[17], regs[10:16]
+        retired = self.cpu.retired()
+        next_pc = SyscallProxy.handle(self.proxy)
+        result = to_signed(regs[10], 32)
+        address, length = syscall_output(number, args, result)
+        data = bytes(self.cpu.bus.dram.load_bytes(address, length)) if length else b""
+        self.event(retired, EVENT_SYSCALL, struct.pack(SYSCALL_FORMAT, number, result, address) + data)
+        return next_pc
+
+    def close(self):
+        self.stream.close()
+
+class Replayer:
+    """
+        Feeds a recorded log back into a CPU loaded with the same program:
+        UART loads and syscalls return what they returned when recorded,
+        without touching the host. Attach after the syscall proxy, if any.
+    """
+
+    def __init__(self, cpu, stream):
+        self.cpu = cpu
+        if stream.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ReplayError("not a record/replay log")
+        self.data = stream.read()
+        self.position = 0
+        cpu.bus.serial.load = self.uart_load
+        self.proxy = cpu.syscalls
+        if self.proxy is not None:
+            self.proxy.handle = self.syscall
+
+    def done(self):
+        return self.position == len(self.data)
+
+    def next_event(self, kind):
+        retired = self.cpu.retired()
+        if self.done():
+            raise ReplayError(f"log ended before the input at instruction {retired}")
+        at, logged_kind, length = struct.unpack_from(EVENT_FORMAT, self.data, self.position)
+        start = self.position + struct.calcsize(EVENT_FORMAT)
+        if logged_kind != kind or at != retired:
+            raise ReplayError(f"replay diverged at instruction {retired}: "
+                              f"log has event kind {logged_kind} at instruction {at}, expected kind {kind}")
+        self.position = start + length
+        return self.data[start:start + length]
+
+    def uart_load(self, addr, size):
+        return self.next_event(EVENT_UART)[0]
+
+    def syscall(self):
+        regs = self.cpu.regs
+        payload = self.next_event(EVENT_SYSCALL)
+        number, result, address = struct.unpack_from(SYSCALL_FORMAT, payload)
+        if number != regs[17]:
+            raise ReplayError(f"replay diverged: syscall {regs[17]} where the log has {number}")
+        if number in DETERMINISTIC_SYSCALLS:
+            return SyscallProxy.handle(self.proxy)
+        data = payload[struct.calcsize(SYSCALL_FORMAT):]
+        if data:
+            self.cpu.bus.dram.store_bytes(address, data)
+        regs[10] = result & 0xFFFFFFFF
+        return self.cpu.update_pc()
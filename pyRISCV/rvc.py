@@ -0,0 +1,120 @@
+from .instruction_executor import sign_extend
+
+# Expansion of RV32C compressed instructions into their 32-bit equivalents,
+# done once per PC by the CPU's decode cache. Floating point forms are not
+# supported, like the F and D extensions themselves.
+
+def i_type(op, funct3, rd, rs1, imm):
+    return (imm & 0xFFF) << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | op
+
+def s_type(funct3, rs1, rs2, imm):
+    return ((imm >> 5) & 0x7F) << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12 | (imm & 0x1F) << 7 | 0x23
+
+def b_type(funct3, rs1, rs2, imm):
+    return ((imm >> 12) & 0x1) << 31 | ((imm >> 5) & 0x3F) << 25 | rs2 << 20 | rs1 << 15 | \
+        funct3 << 12 | ((imm >> 1) & 0xF) << 8 | ((imm >> 11) & 0x1) << 7 | 0x63
+
+def j_type(rd, imm):
+    return ((imm >> 20) & 0x1) << 31 | ((imm >> 1) & 0x3FF) << 21 | ((imm >> 11) & 0x1) << 20 | \
+        ((imm >> 12) & 0xFF) << 12 | rd << 7 | 0x6F
+
+def r_type(funct7, funct3, rd, rs1, rs2):
+    return funct7 << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | 0x33
+
+def imm6(parcel):
+    """
+        Sign-extended imm[5] (bit 12) and imm[4:0] (bits 6:2)"""
+    return sign_extend(((parcel >> 7) & 0x20) | ((parcel >> 2) & 0x1F), 6)
+
+def cj_imm(parcel):
+    imm = ((parcel >> 1) & 0x800) | ((parcel >> 7) & 0x10) | ((parcel >> 1) & 0x300) | \
+        ((parcel << 2) & 0x400) | ((parcel >> 1) & 0x40) | ((parcel << 1) & 0x80) | \
+        ((parcel >> 2) & 0xE) | ((parcel << 3) & 0x20)
+    return sign_extend(imm, 12)
+
+def cb_imm(parcel):
+    imm = ((parcel >> 4) & 0x100) | ((parcel >> 7) & 0x18) | ((parcel << 1) & 0xC0) | \
+        ((parcel >> 2) & 0x6) | ((parcel << 3) & 0x20)
+    return sign_extend(imm, 9)
+
+def expand_quadrant0(parcel, funct3):
+    rd = ((parcel >> 2) & 0x7) + 8
+    rs1 = ((parcel >> 7) & 0x7) + 8
+    if funct3 == 0x0:  # C.ADDI4SPN
+        imm = ((parcel >> 7) & 0x30) | ((parcel >> 1) & 0x3C0) | ((parcel >> 4) & 0x4) | ((parcel >> 2) & 0x8)
+        return i_type(0x13, 0x0, rd, 2, imm) if imm else None
+    offset = ((parcel >> 7) & 0x38) | ((parcel >> 4) & 0x4) | ((parcel << 1) & 0x40)
+    if funct3 == 0x2:  # C.LW
+        return i_type(0x03, 0x2, rd, rs1, offset)
+    if funct3 == 0x6:  # C.SW
+        return s_type(0x2, rs1, rd, offset)
+    return None
+
+def expand_quadrant1(parcel, funct3):
+    rd = (parcel >> 7) & 0x1F
+    if funct3 == 0x0:  # C.ADDI, C.NOP
+        return i_type(0x13, 0x0, rd, rd, imm6(parcel))
+    if funct3 == 0x1:  # C.JAL
+        return j_type(1, cj_imm(parcel))
+    if funct3 == 0x2:  # C.LI
+        return i_type(0x13, 0x0, rd, 0, imm6(parcel))
+    if funct3 == 0x3:
+        if rd == 2:  # C.ADDI16SP
+            imm = ((parcel >> 3) & 0x200) | ((parcel >> 2) & 0x10) | ((parcel << 1) & 0x40) | \
+                ((parcel << 4) & 0x180) | ((parcel << 3) & 0x20)
+            return i_type(0x13, 0x0, 2, 2, sign_extend(imm, 10)) if imm else None
+        imm = imm6(parcel)  # C.LUI
+        return (imm & 0xFFFFF) << 12 | rd << 7 | 0x37 if imm else None
+    if funct3 == 0x4:
+        rd = ((parcel >> 7) & 0x7) + 8
+        rs2 = ((parcel >> 2) & 0x7) + 8
+        funct2 = (parcel >> 10) & 0x3
+        if funct2 == 0x0 or funct2 == 0x1:  # C.SRLI, C.SRAI
+            if parcel & 0x1000:
+                return None  # shamt[5] must be zero on RV32
+            return i_type(0x13, 0x5, rd, rd, (funct2 << 10) | ((parcel >> 2) & 0x1F))
+        if funct2 == 0x2:  # C.ANDI
+            return i_type(0x13, 0x7, rd, rd, imm6(parcel))
+        if parcel & 0x1000:
+            return None  # C.SUBW and C.ADDW are RV64 only
+        funct = (parcel >> 5) & 0x3
+        if funct == 0x0:  # C.SUB
+            return r_type(0x20, 0x0, rd, rd, rs2)
+        return r_type(0x00, (0x4, 0x6, 0x7)[funct - 1], rd, rd, rs2)  # C.XOR, C.OR, C.AND
+    if funct3 == 0x5:  # C.J
+        return j_type(0, cj_imm(parcel))
+    rs1 = ((parcel >> 7) & 0x7) + 8
+    return b_type(funct3 - 0x6, rs1, 0, cb_imm(parcel))  # C.BEQZ, C.BNEZ
+
+def expand_quadrant2(parcel, funct3):
+    rd = (parcel >> 7) & 0x1F
+    rs2 = (parcel >> 2) & 0x1F
+    if funct3 == 0x0:  # C.SLLI
+        if parcel & 0x1000:
+            return None
+        return i_type(0x13, 0x1, rd, rd, rs2)
+    if funct3 == 0x2:  # C.LWSP
+        offset = ((parcel >> 7) & 0x20) | ((parcel >> 2) & 0x1C) | ((parcel << 4) & 0xC0)
+        return i_type(0x03, 0x2, rd, 2, offset) if rd else None
+    if funct3 == 0x4:
+        if not parcel & 0x1000:
+            if rs2 == 0:  # C.JR
+                return i_type(0x67, 0x0, 0, rd, 0) if rd else None
+            return r_type(0x00, 0x0, rd, 0, rs2)  # C.MV
+        if rs2 == 0:
+            if rd == 0:  # C.EBREAK
+                return 0x00100073
+            return i_type(0x67, 0x0, 1, rd, 0)  # C.JALR
+        return r_type(0x00, 0x0, rd, rd, rs2)  # C.ADD
+    if funct3 == 0x6:  # C.SWSP
+        offset = ((parcel >> 7) & 0x3C) | ((parcel >> 1) & 0xC0)
+        return s_type(0x2, 2, rs2, offset)
+    return None
+
+QUADRANTS = (expand_quadrant0, expand_quadrant1, expand_quadrant2)
+
+def expand(parcel):
+    """
+        The 32-bit instruction a 16-bit parcel stands for, or None if the
+        parcel is not a supported compressed instruction."""
+    return QUADRANTS[parcel & 0x3](parcel, (parcel >> 13) & 0x7)
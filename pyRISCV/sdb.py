@@ -1,8 +1,8 @@
 from .cpu import CPU
-import logging
+from .params import *
+from .checkpoint import Checkpoints
 import cmd
 import time
-from .rv_exception import RVException
 
 class SDB(cmd.Cmd):
     """
@@ -12,19 +12,25 @@ class SDB(cmd.Cmd):
     intro = "Welcome to the Simple Debugger"
     prompt = "sdb> "
 
-    def __init__(self, program):
+    def __init__(self, program, checkpoint_interval=CHECKPOINT_INTERVAL, checkpoint_budget=CHECKPOINT_BUDGET):
         super().__init__()
         if type(program) == str:
             print(f"Loading program from file: {program}")
             program = open(program, "rb").read()
         cpu = CPU(program)
+        cpu.fuse_pairs = False  # si and breakpoints must see both halves of a pair
         self.cpu = cpu
+        self.checkpoints = Checkpoints(cpu, checkpoint_interval, checkpoint_budget)
         self.cmd_dict = {}
         self.watch_points = {}
+        self.break_points = []
         self.cmd_dict["help"] = self.do_help
         self.cmd_dict["q"] = self.do_q
         self.cmd_dict["c"] = self.do_c
         self.cmd_dict["si"] = self.do_si
+        self.cmd_dict["rsi"] = self.do_rsi
+        self.cmd_dict["rc"] = self.do_rc
+        self.cmd_dict["b"] = self.do_b
         self.cmd_dict["info"] = self.do_info
         self.cmd_dict["x"] = self.do_x
         self.cmd_dict["w"] = self.do_w
@@ -32,27 +38,68 @@ class SDB(cmd.Cmd):
         self.cmd_dict["d"] = self.do_d
 
     def execute_once(self):
-        try:
-            inst = self.cpu.fetch()
-            if inst == 0:
-                return False
-            new_pc = self.cpu.execute(inst)
-            self.cpu.pc = new_pc
-        except RVException as e:
-            logging.info(f"Exception occurred: {e}")
-            self.cpu.handle_exception(e)
-        return True
-    
+        executed = self.cpu.run(1) >= 1  # a bulk loop retires several at once
+        self.checkpoints.tick()
+        return executed
+
+    def hit(self, values):
+        """
+            Breakpoint or watch point reached by the last instruction, given
+            the watched values before it (updated in place), or None"""
+        if self.cpu.pc in self.break_points:
+            return f"Break point reached at {self.cpu.pc:#010x}"
+        for address in values:
+            value = self.cpu.load(address, 32)
+            if value != values[address]:
+                values[address] = value
+                return f"Watch point triggered at {address:08x}"
+        return None
+
     def execute(self, n_cycles=1):
-        for i in range(n_cycles):
+        """
+            Step up to n_cycles instructions (until the program ends with
+            None), stopping at breakpoints and watch points"""
+        i = 0
+        while n_cycles is None or i < n_cycles:
             if not self.execute_once():
                 print("Program terminated")
                 return
-            for address in self.watch_points:
-                if self.cpu.load(address, 32)!= self.watch_points[address]:
-                    print(f"Watch point triggered at {address:08x}")
-                    self.watch_points[address] = self.cpu.load(address, 32)
-                    return
+            message = self.hit(self.watch_points)
+            if message is not None:
+                print(message)
+                return
+            i += 1
+
+    def find_previous_hit(self):
+        """
+            Instruction count of the last breakpoint or watch point hit before
+            the current one, replaying the checkpoint windows newest first,
+            or None"""
+        checkpoints = self.checkpoints
+        now = self.cpu.retired()
+        starts = [checkpoint.retired for checkpoint in checkpoints.saved if checkpoint.retired < now]
+        for index in reversed(range(len(starts))):
+            end = starts[index + 1] if index + 1 < len(starts) else now
+            checkpoints.restore(index)
+            values = {address: self.cpu.load(address, 32) for address in self.watch_points}
+            last = None
+            self.cpu.bus.serial.muted = True
+            try:
+                while self.cpu.retired() < end and self.execute_once():
+                    if self.hit(values) is not None and self.cpu.retired() < now:
+                        last = self.cpu.retired()
+            finally:
+                self.cpu.bus.serial.muted = False
+            if last is not None:
+                return last
+        return None
+
+    def moved(self):
+        """
+            Report the position after going backwards"""
+        for address in self.watch_points:
+            self.watch_points[address] = self.cpu.load(address, 32)
+        print(f"At instruction {self.cpu.retired()}, pc {self.cpu.pc:#010x}")
 
     def do_help(self, *args):
         """
@@ -62,14 +109,18 @@ class SDB(cmd.Cmd):
 
     def do_c(self, *args):
         """
-            Continue execution until program terminates"""
+            Continue execution until program terminates or a breakpoint or
+            watch point is hit"""
         start_time = time.time()
-        instructions = 0
+        start = self.cpu.retired()
         try:
-            while self.execute_once():
-                instructions += 1
+            if self.break_points or self.watch_points:
+                self.execute(None)
+            else:
+                self.checkpoints.advance()
         except KeyboardInterrupt:
             end_time = time.time()
+            instructions = self.cpu.retired() - start
             print("\r--------Execution interrupted---------")
             print(f"Execution time: {end_time - start_time:.2f} seconds")
             print(f"Instructions executed: {instructions}")
@@ -96,10 +147,62 @@ class SDB(cmd.Cmd):
         print(f"Single stepping {n_cycles} cycles")
         self.execute(n_cycles)
 
+    def do_rsi(self, *args):
+        """
+            Step backwards
+            Usage: rsi [n_cycles]"""
+        n_cycles = 1
+        args = args[0].strip().split(" ")
+        if args[0]:
+            try:
+                n_cycles = int(args[0])
+            except ValueError:
+                print("Invalid argument for n_cycles")
+                return
+        target = self.cpu.retired() - n_cycles
+        if target < self.checkpoints.oldest():
+            print(f"Only {self.cpu.retired() - self.checkpoints.oldest()} instructions are kept, "
+                  f"stepping back to the oldest checkpoint")
+        print(f"Stepping back {n_cycles} cycles")
+        self.checkpoints.seek(target)
+        self.moved()
+
+    def do_rc(self, *args):
+        """
+            Continue backwards to the previous breakpoint or watch point hit"""
+        if not self.break_points and not self.watch_points:
+            print("No break points or watch points set")
+            return
+        target = self.find_previous_hit()
+        if target is None:
+            print("No earlier hit, stopping at the oldest checkpoint")
+            target = self.checkpoints.oldest()
+        self.checkpoints.seek(target)
+        self.moved()
+
+    def do_b(self, *args):
+        """
+            Set a break point
+            Usage: b [address]"""
+        args = args[0].strip().replace(" ", "")
+        if not args:
+            print("No address provided for break point")
+            return
+        try:
+            address = self.parse_expression(args)
+        except ValueError:
+            print("Invalid argument for address")
+            return
+        if address in self.break_points:
+            print(f"Break point already set at {address:#010x}")
+        else:
+            self.break_points.append(address)
+            print(f"Break point set at {address:#010x}")
+
     def do_info(self, *args):
         """
             Print CPU information
-            Usage: info r|w"""
+            Usage: info r|w|b"""
         
         if args[0] == "r":
             self.cpu.dump_regs()
@@ -107,6 +210,9 @@ class SDB(cmd.Cmd):
         elif args[0] == "w":
             for address in self.watch_points:
                 print(f"Watch point at {address:#010x}: {self.watch_points[address]:#010x}")
+        elif args[0] == "b":
+            for address in self.break_points:
+                print(f"Break point at {address:#010x}")
         else:
             print("Invalid argument for info")
 
@@ -181,13 +287,20 @@ class SDB(cmd.Cmd):
 
     def do_d(self, *args):
         """
-            Delete a watch point
-            Usage: d N"""
+            Delete a watch point, or a break point with b
+            Usage: d [b] N"""
         
         args = args[0].strip().replace(" ", "")
         if not args:
             print("No argument provided for d")
             return
+        if args.startswith("b"):
+            try:
+                address = self.break_points.pop(int(args[1:]))
+                print(f"Break point at {address:#010x} deleted")
+            except (ValueError, IndexError):
+                print(f"Invalid argument for d: {args}")
+            return
         try:
             index = int(args)
             if index < 0 or index >= len(self.watch_points):
@@ -215,7 +328,7 @@ class SDB(cmd.Cmd):
             offset = self.parse_expression(parts[1])
             if offset is None:
                 return None
-            return base + offset
+            return (base + offset) & 0xFFFFFFFF
         elif "-" in expr:
             parts = expr.split("-")
             if len(parts) != 2:
@@ -227,7 +340,7 @@ class SDB(cmd.Cmd):
             offset = self.parse_expression(parts[1])
             if offset is None:
                 return None
-            return base - offset
+            return (base - offset) & 0xFFFFFFFF
         else:
             if expr.startswith("$"):
                 expr = expr[1:]
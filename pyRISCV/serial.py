@@ -1,9 +1,23 @@
+from collections import deque
+from .params import *
 
 class Serial:
+    def __init__(self):
+        self.rx = deque()  # bytes received from the host, read one at a time from RBR
+        self.muted = False  # drop output, e.g. while re-executing already printed code
+
+    def feed(self, data):
+        self.rx.extend(data)
 
     def store(self, addr, value, size):
         assert size == 8, "Serial.store: size must be 8"
-        print("%c" % (value & 0xff), end='')
+        if not self.muted:
+            print("%c" % (value & 0xff), end='')
 
     def load(self, addr, size):
-        pass
\ No newline at end of file
+        index = addr - SERIAL_BASE
+        if index == SERIAL_RBR:
+            return self.rx.popleft() if self.rx else 0
+        if index == SERIAL_LSR:
+            return SERIAL_LSR_THRE | (SERIAL_LSR_DR if self.rx else 0)
+        return 0
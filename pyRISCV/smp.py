@@ -0,0 +1,109 @@
+import queue
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+from .params import *
+from .cpu import CPU
+from .bus import BUS
+from .dram import DRAM
+from .clint import Clint
+from .atomic import Reservations
+
+def hart_main(hartid, dram_shm, clint_shm, reservation_shm, lock, halt, max_instructions, results):
+    """
+        Worker process body: run one hart over the shared machine state until
+        it halts, hart 0 halts, or max_instructions have executed.
+    """
+    dram = DRAM(b"", dram_shm.buf)
+    clint = Clint(clint_shm.buf)
+    reservations = Reservations(reservation_shm.buf, lock)
+    dram.watch_reservations(reservations, hartid)
+    cpu = CPU(b"", hartid=hartid, bus=BUS(b"", dram=dram, clint=clint, reservations=reservations))
+    executed = 0
+    while not cpu.halted and not halt.is_set():
+        budget = INTERRUPT_POLL_INTERVAL
+        if max_instructions is not None:
+            budget = min(budget, max_instructions - executed)
+            if budget <= 0:
+                break
+        executed += cpu.run(budget)
+    if hartid == 0:
+        halt.set()  # the boot hart ending the program stops the machine
+    logging.info("Hart {} stopped after {} instructions".format(hartid, executed))
+    results.put({"hartid": hartid, "pc": cpu.pc, "regs": list(cpu.regs),
+                 "instructions": executed, "halted": cpu.halted})
+    dram.data.release()
+    clint.data.release()
+    reservations.release()
+
+class SMP:
+    """
+        Symmetric multiprocessing machine: every hart has its own registers,
+        CSRs and mhartid and runs in its own worker process, while DRAM, the
+        CLINT and the LR/SC reservation table live in shared memory.
+    """
+
+    def __init__(self, program, n_harts):
+        if n_harts < 1 or n_harts > MAX_HARTS:
+            raise ValueError(f"n_harts should be between 1 and {MAX_HARTS}, but got {n_harts}")
+        self.n_harts = n_harts
+        self.dram_shm = shared_memory.SharedMemory(create=True, size=DRAM_SIZE)
+        self.clint_shm = shared_memory.SharedMemory(create=True, size=CLINT_SIZE)
+        self.reservation_shm = shared_memory.SharedMemory(create=True, size=4 * MAX_HARTS)
+        self.dram_shm.buf[:len(program)] = program
+        reservations = Reservations(self.reservation_shm.buf)
+        reservations.clear()
+        reservations.release()
+        self.lock = multiprocessing.RLock()  # SC and AMO stores reenter it through DRAM.store
+
+    def run(self, max_instructions=None):
+        """
+            Start one process per hart and wait for all of them.
+            Returns the final state of each hart, ordered by hart id. Raises
+            RuntimeError if a hart's process dies without reporting its state.
+        """
+        halt = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        harts = [multiprocessing.Process(target=hart_main,
+                                         args=(hartid, self.dram_shm, self.clint_shm, self.reservation_shm,
+                                               self.lock, halt, max_instructions, results))
+                 for hartid in range(self.n_harts)]
+        for hart in harts:
+            hart.start()
+        states = {}
+        while len(states) < len(harts):
+            try:
+                state = results.get(timeout=HART_POLL_TIMEOUT)
+                states[state["hartid"]] = state
+                continue
+            except queue.Empty:
+                pass
+            exited = [hartid for hartid, hart in enumerate(harts) if hartid not in states and hart.exitcode is not None]
+            while exited and not results.empty():  # states sent just before exiting
+                state = results.get()
+                states[state["hartid"]] = state
+            dead = [hartid for hartid in exited if hartid not in states]
+            if dead:
+                for hart in harts:
+                    hart.terminate()
+                    hart.join()
+                raise RuntimeError(f"hart {dead[0]} died with exit code {harts[dead[0]].exitcode} "
+                                   "before reporting its state")
+        for hart in harts:
+            hart.join()
+        return [states[hartid] for hartid in range(self.n_harts)]
+
+    def load(self, address, size):
+        index = address - DRAM_BASE
+        return int.from_bytes(self.dram_shm.buf[index:index + size // 8], byteorder='little')
+
+    def close(self):
+        for shm in (self.dram_shm, self.clint_shm, self.reservation_shm):
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import errno
+import struct
+import logging
+from .params import *
+from .instruction_executor import to_signed
+from .rv_exception import RVException
+
+# open flags of the RISC-V Linux ABI, translated to the host's
+OPEN_FLAGS = [
+    (0o100, os.O_CREAT),
+    (0o200, os.O_EXCL),
+    (0o1000, os.O_TRUNC),
+    (0o2000, os.O_APPEND),
+]
+
+STAT_FORMAT = "<QQIIIIQQqiiq" + "qi4x" * 3 + "8x"  # libgloss struct kernel_stat
+TIMEVAL_FORMAT = "<qi4x"  # struct timeval with a 64-bit time_t
+
+class SyscallProxy:
+    """
+        Handles ecalls on the host the way a proxy kernel would: a7 holds the
+        syscall number, a0-a5 the arguments, and the result (or -errno) is
+        returned in a0. Guest buffers are moved in bulk through views of
+        DRAM, so I/O costs one host call rather than a load per byte.
+        Attach with ``cpu.syscalls = SyscallProxy(cpu)``.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.dram = cpu.bus.dram
+        self.fds = {}  # guest fd -> host fd, besides stdin/stdout/stderr
+        self.brk = self.dram.base + (self.dram.image_size + BRK_ALIGN - 1) // BRK_ALIGN * BRK_ALIGN
+        self.table = {
+            SYS_WRITE: self.sys_write,
+            SYS_READ: self.sys_read,
+            SYS_EXIT: self.sys_exit,
+            SYS_EXIT_GROUP: self.sys_exit,
+            SYS_BRK: self.sys_brk,
+            SYS_OPENAT: self.sys_openat,
+            SYS_OPEN: self.sys_open,
+            SYS_CLOSE: self.sys_close,
+            SYS_FSTAT: self.sys_fstat,
+            SYS_GETTIMEOFDAY: self.sys_gettimeofday,
+        }
+
+    def handle(self):
+        """
+            Perform the syscall requested by the current ecall and return the
+            next pc."""
+        regs = self.cpu.regs
+        handler = self.table.get(regs[17], None)
+        if handler is None:
+            logging.warning("Unsupported syscall {}".format(regs[17]))
+            result = -errno.ENOSYS
+        else:
+            try:
+                result = handler(*regs[10:16])
+            except OSError as e:
+                result = -e.errno
+            except RVException:
+                result = -errno.EFAULT  # guest buffer outside DRAM
+        regs[10] = result & 0xFFFFFFFF
+        return self.cpu.update_pc()
+
+    def host_fd(self, fd):
+        if fd <= 2:
+            return fd  # the host's own standard streams
+        if fd not in self.fds:
+            raise OSError(errno.EBADF, "bad file descriptor")
+        return self.fds[fd]
+
+    def read_string(self, address):
+        data = bytes(self.dram.load_bytes(address, min(PATH_MAX, self.dram.end + 1 - address)))
+        end = data.find(b"\0")
+        if end < 0:
+            raise OSError(errno.ENAMETOOLONG, "path too long")
+        return data[:end].decode()
+
+    def sys_write(self, fd, buf, count, *_):
+        data = self.dram.load_bytes(buf, count)
+        if fd in (1, 2):
+            stream = sys.stdout if fd == 1 else sys.stderr
+            stream.flush()
+            stream.buffer.write(data)
+            stream.buffer.flush()
+            return count
+        return os.write(self.host_fd(fd), data)
+
+    def sys_read(self, fd, buf, count, *_):
+        return os.readv(self.host_fd(fd), [self.dram.writable_bytes(buf, count)])
+
+    def sys_exit(self, status, *_):
+        self.cpu.exit_code = to_signed(status, 32)
+        self.cpu.halted = True
+        return status
+
+    def sys_brk(self, address, *_):
+        if self.dram.base < address < self.cpu.regs[2]:  # the heap may not run into the stack
+            self.brk = address
+        return self.brk
+
+    def sys_openat(self, dirfd, path, flags, mode, *_):
+        if to_signed(dirfd, 32) != AT_FDCWD:
+            return -errno.ENOTSUP
+        host_flags = flags & 0x3  # O_RDONLY, O_WRONLY, O_RDWR
+        for guest, host in OPEN_FLAGS:
+            if flags & guest:
+                host_flags |= host
+        host = os.open(self.read_string(path), host_flags, mode)
+        fd = max([2] + list(self.fds)) + 1
+        self.fds[fd] = host
+        return fd
+
+    def sys_open(self, path, flags, mode, *_):
+        return self.sys_openat(AT_FDCWD & 0xFFFFFFFF, path, flags, mode)
+
+    def sys_close(self, fd, *_):
+        if fd <= 2:
+            return 0  # keep the host's standard streams open
+        os.close(self.host_fd(fd))
+        del self.fds[fd]
+        return 0
+
+    def sys_fstat(self, fd, buf, *_):
+        st = os.fstat(self.host_fd(fd))
+        self.dram.store_bytes(buf, struct.pack(STAT_FORMAT,
+            st.st_dev, st.st_ino, st.st_mode, st.st_nlink, st.st_uid, st.st_gid,
+            st.st_rdev, 0, st.st_size, st.st_blksize, 0, st.st_blocks,
+            int(st.st_atime), st.st_atime_ns % 1000000000,
+            int(st.st_mtime), st.st_mtime_ns % 1000000000,
+            int(st.st_ctime), st.st_ctime_ns % 1000000000))
+        return 0
+
+    def sys_gettimeofday(self, tv, tz, *_):
+        if tv:
+            now = time.time_ns() // 1000
+            self.dram.store_bytes(tv, struct.pack(TIMEVAL_FORMAT, now // 1000000, now % 1000000))
+        return 0
@@ -0,0 +1,187 @@
+from bisect import bisect_right
+from .params import *
+
+# Approximate cycle counts for a classic 5-stage in-order pipeline. A block
+# is the straight-line code from one control transfer's target up to the
+# next control transfer; its static cost (one cycle per instruction, longer
+# mul/div, load-use bubbles between neighbours) is worked out once, the
+# first time the block ends, from the decoded instructions. At runtime only
+# control transfers are wrapped, appending (pc, next pc) like the branch
+# profiler does; traps append (pc, handler) through CPU.trap. Dynamic
+# penalties (redirects, mispredicts, cache misses) come from the outcomes
+# and from the cache model and branch profiler when they are attached.
+
+BRANCH_OPS = (0x63, 0x67, 0x6F)
+XRETS = (0x30200073, 0x10200073)  # mret, sret
+
+def sources(inst):
+    """
+        Registers an instruction reads"""
+    op = inst & 0x7F
+    rs1, rs2 = (inst >> 15) & 0x1F, (inst >> 20) & 0x1F
+    if op in (0x33, 0x23, 0x63, 0x2F):
+        return (rs1, rs2)
+    if op in (0x13, 0x03, 0x67) or (op == 0x73 and (inst >> 12) & 0x3):
+        return (rs1,)
+    return ()
+
+def static_cost(inst, following):
+    """
+        Cycles inst spends in execute, plus any bubble it causes in the
+        instruction following it (None at the end of a block)."""
+    op = inst & 0x7F
+    if op == 0x33 and inst >> 25 == 0x1:
+        return MUL_CYCLES if (inst >> 12) & 0x7 < 4 else DIV_CYCLES
+    if op in (0x03, 0x2F):
+        rd = (inst >> 7) & 0x1F
+        if rd and following is not None and rd in sources(following):
+            return 1 + LOAD_USE_STALL
+    return 1
+
+class TimingModel:
+    """
+        Estimated cycles and CPI, per function when given symbols (name ->
+        address, e.g. ELF(data).functions). Attach with
+        ``cpu.attach_timing(TimingModel(cpu, symbols))``.
+    """
+
+    def __init__(self, cpu, symbols=None, predictor="gshare"):
+        self.cpu = cpu
+        self.predictor = predictor  # branch profiler model whose mispredicts are charged
+        symbols = sorted((address, name) for name, address in (symbols or {}).items())
+        self.addresses = [address for address, _ in symbols]
+        self.names = [name for _, name in symbols]
+        self.records = []  # (pc, next pc) of control transfers and traps since the last flush
+        self.sites = {}  # pc -> (redirect penalty, fall-through pc, covered by a predictor)
+        self.blocks = {}  # (start, end) -> (instructions, static cycles)
+        self.start = cpu.pc  # first pc of the block being executed
+        self.instructions = {}  # function -> instructions
+        self.static = {}  # function -> static cycles plus redirect penalties
+
+    def function(self, pc):
+        index = bisect_right(self.addresses, pc) - 1
+        return self.names[index] if index >= 0 else f"{pc:#010x}"
+
+    def wrap(self, handler, pc, inst, length):
+        """
+            Handler recording each execution of the control transfer at pc,
+            or handler itself for other instructions."""
+        op = inst & 0x7F
+        if op in BRANCH_OPS:
+            penalty = JAL_PENALTY if op == 0x6F else TAKEN_PENALTY
+        elif inst in XRETS:
+            penalty = TRAP_PENALTY
+        else:
+            return handler
+        self.sites[pc] = (penalty, pc + length, op in BRANCH_OPS)
+        append = self.records.append
+
+        def timed(cpu, inst):
+            next_pc = handler(cpu, inst)
+            append((pc, next_pc))
+            return next_pc
+        return timed
+
+    def trapped(self, pc, handler_pc):
+        self.records.append((pc, handler_pc))
+
+    def block(self, start, end):
+        """
+            (instructions, static cycles) of the straight-line code from start
+            through end, or just end's when it cannot be reached from start
+            by falling through (e.g. after an interrupt). With end None, the
+            code up to the end of the program."""
+        cache = self.cpu.decode_cache
+        body = []
+        pc = start
+        while len(body) < MAX_BLOCK:
+            entry = cache.get(pc, None) or self.cpu.decode_at(pc)
+            if entry is None:
+                break
+            body.append(entry[1])
+            if pc == end:
+                break
+            pc += entry[2]
+        if end is not None and (pc != end or not body):
+            entry = cache.get(end, None) or self.cpu.decode_at(end)
+            body = [entry[1]] if entry is not None else [0x13]
+        body.append(None)
+        return len(body) - 1, sum(static_cost(inst, following) for inst, following in zip(body, body[1:]))
+
+    def flush(self):
+        """
+            Charge the recorded blocks and redirects to their functions."""
+        sites, blocks = self.sites, self.blocks
+        instructions, static = self.instructions, self.static
+        predicted = self.cpu.branch_profiler is not None
+        start = self.start
+        for pc, next_pc in self.records:
+            key = (start, pc)
+            block = blocks.get(key, None)
+            if block is None:
+                block = blocks[key] = self.block(start, pc)
+            name = self.function(pc)
+            cycles = block[1]
+            site = sites.get(pc, None)
+            if site is None:
+                cycles += TRAP_PENALTY
+            elif next_pc != site[1] and not (predicted and site[2]):
+                cycles += site[0]  # without a predictor every redirect stalls
+            instructions[name] = instructions.get(name, 0) + block[0]
+            static[name] = static.get(name, 0) + cycles
+            start = next_pc
+        self.start = start
+        self.records.clear()
+
+    def functions(self):
+        """
+            {function: (instructions, cycles)} including dynamic penalties"""
+        self.flush()
+        cycles = dict(self.static)
+        instructions = dict(self.instructions)
+        if self.cpu.halted:  # the code after the last control transfer
+            count, static = self.block(self.start, None)
+            name = self.function(self.start)
+            instructions[name] = instructions.get(name, 0) + count
+            cycles[name] = cycles.get(name, 0) + static
+        for pc, count in self.penalties().items():
+            name = self.function(pc)
+            cycles[name] = cycles.get(name, 0) + count
+        return {name: (instructions.get(name, 0), cycles[name]) for name in cycles}
+
+    def penalties(self):
+        """
+            pc -> cycles lost to mispredicts and cache misses"""
+        penalties = {}
+        profiler = self.cpu.branch_profiler
+        if profiler is not None:
+            profiler.flush()
+            for pc, count in profiler.mispredicted[self.predictor].items():
+                penalties[pc] = penalties.get(pc, 0) + count * MISPREDICT_PENALTY
+            for pc, count in profiler.mispredicted[profiler.btb.name].items():
+                penalties[pc] = penalties.get(pc, 0) + count * TAKEN_PENALTY
+        caches = self.cpu.caches
+        if caches is not None:
+            for cache, penalty in ((caches.l1i, L1_MISS_PENALTY), (caches.l1d, L1_MISS_PENALTY),
+                                   (caches.l2, L2_MISS_PENALTY)):
+                if cache is None:
+                    continue
+                for pc, (_, misses, _) in cache.by_pc.items():
+                    if pc is not None:
+                        penalties[pc] = penalties.get(pc, 0) + misses * penalty
+        return penalties
+
+    def cycles(self):
+        return sum(cycles for _, cycles in self.functions().values())
+
+    def report(self):
+        lines = []
+        functions = self.functions()
+        total_instructions = sum(instructions for instructions, _ in functions.values())
+        total_cycles = sum(cycles for _, cycles in functions.values())
+        cpi = total_cycles / total_instructions if total_instructions else 0.0
+        lines.append(f"{total_cycles} cycles, {total_instructions} instructions, CPI {cpi:.2f}")
+        for name, (instructions, cycles) in sorted(functions.items(), key=lambda item: -item[1][1]):
+            cpi = cycles / instructions if instructions else 0.0
+            lines.append(f"  {name}: {cycles} cycles, {instructions} instructions, CPI {cpi:.2f}")
+        return lines
@@ -83,7 +83,7 @@ _start:
 """
     cpu = rv_helper(code, "test_xori", 3)
     assert cpu.regs[2] == 15, "test_xori failed"
-    assert cpu.regs[3] == -15, "test_xori failed"
+    assert cpu.regs[3] == -15 & 0xFFFFFFFF, "test_xori failed"
 
 def test_srli():
     code = """
@@ -109,7 +109,7 @@ _start:
 """
     cpu = rv_helper(code, "test_srai", 4)
     assert cpu.regs[2] == 10>>2, "test_srai failed"
-    assert cpu.regs[3] == -10>>2, "test_srai failed"
+    assert cpu.regs[3] == (-10>>2) & 0xFFFFFFFF, "test_srai failed"
 
 def test_andi():
     code = """
@@ -131,7 +131,7 @@ _start:
     lui x2, 0x5678  # 将 0x5678 加载到 x2 中
 """
     cpu = rv_helper(code, "test_lui", 2)
-    assert cpu.regs[1] == -2147483648, "test_lui failed"
+    assert cpu.regs[1] == -2147483648 & 0xFFFFFFFF, "test_lui failed"
     assert cpu.regs[2] == 0x05678000, "test_lui failed"
 
 def test_auipc():
@@ -142,7 +142,7 @@ _start:
     auipc x2, 0x5678  # 将 0x56780000 加载到 x2 中
 """
     cpu = rv_helper(code, "test_auipc", 2)
-    assert cpu.regs[1] == params.DRAM_BASE + -2147483648, "test_auipc failed"
+    assert cpu.regs[1] == (params.DRAM_BASE + -2147483648) & 0xFFFFFFFF, "test_auipc failed"
     assert cpu.regs[2] == params.DRAM_BASE + 0x05678000 + 4, "test_auipc failed"
 
 def test_jal():
@@ -203,9 +203,9 @@ _start:
     lb x4, -16(x2)  # 从 x2 处偏移 -16 处读取一个字节，结果放入 x4 中
 """
     cpu = rv_helper(code, "test_sb", 6)
-    assert cpu.regs[1] == -19, "test_sb failed"
+    assert cpu.regs[1] == -19 & 0xFFFFFFFF, "test_sb failed"
     assert cpu.regs[3] == 16, "test_sb failed"
-    assert cpu.regs[4] == -19, "test_sb failed"
+    assert cpu.regs[4] == -19 & 0xFFFFFFFF, "test_sb failed"
 
 def test_sh_lh():
     code = """
@@ -219,9 +219,9 @@ _start:
     lh x4, -32(x2)  # 从 x2 处偏移 -16 处读取两个字节，结果放入 x4 中
 """
     cpu = rv_helper(code, "test_sh", 6)
-    assert cpu.regs[1] == -19, "test_sh failed"
+    assert cpu.regs[1] == -19 & 0xFFFFFFFF, "test_sh failed"
     assert cpu.regs[3] == 16, "test_sh failed"
-    assert cpu.regs[4] == -19, "test_sh failed"
+    assert cpu.regs[4] == -19 & 0xFFFFFFFF, "test_sh failed"
 
 def test_sw_lw():
     code = """
@@ -235,9 +235,9 @@ _start:
     lw x4, -64(x2)  # 从 x2 处偏移 -16 处读取四个字节，结果放入 x4 中
 """
     cpu = rv_helper(code, "test_sw", 6)
-    assert cpu.regs[1] == -19, "test_sw failed"
+    assert cpu.regs[1] == -19 & 0xFFFFFFFF, "test_sw failed"
     assert cpu.regs[3] == 16, "test_sw failed"
-    assert cpu.regs[4] == -19, "test_sw failed"
+    assert cpu.regs[4] == -19 & 0xFFFFFFFF, "test_sw failed"
 
 def test_beq():
     code = """
@@ -349,9 +349,9 @@ _start:
     sub x7, x5, x6  # x7 = x5 - x6
 """
     cpu = rv_helper(code, "test_sub", 7)
-    assert cpu.regs[3] == -10, "test_sub failed"
-    assert cpu.regs[5] == -40, "test_sub failed"
-    assert cpu.regs[7] == -80, "test_sub failed"
+    assert cpu.regs[3] == -10 & 0xFFFFFFFF, "test_sub failed"
+    assert cpu.regs[5] == -40 & 0xFFFFFFFF, "test_sub failed"
+    assert cpu.regs[7] == -80 & 0xFFFFFFFF, "test_sub failed"
 
 def test_sll():
     code = """
@@ -436,8 +436,8 @@ _start:
     sra x5, x3, x2  # x4 = x3 >> 3
 """
     cpu = rv_helper(code, "test_sra", 6)
-    assert cpu.regs[4] == -10 >> 2, "test_sra failed"
-    assert cpu.regs[5] == -30 >> 3, "test_sra failed"
+    assert cpu.regs[4] == (-10 >> 2) & 0xFFFFFFFF, "test_sra failed"
+    assert cpu.regs[5] == (-30 >> 3) & 0xFFFFFFFF, "test_sra failed"
 
 def test_or():
     code = """
@@ -488,7 +488,7 @@ _start:
 """
     cpu = rv_helper(code, "test_csrrw", 4)
     assert cpu.regs[1] == 0, "test_csrrw failed"
-    assert cpu.regs[4] == -5, "test_csrrw failed"
+    assert cpu.regs[4] == -5 & 0xFFFFFFFF, "test_csrrw failed"
     assert cpu.csr.load(params.MSTATUS) == 10, "test_csrrw failed"
 
 def test_csrrs():
@@ -594,7 +594,7 @@ _start:
 """
     cpu = rv_helper(code, "test_mul", 6)
     assert cpu.regs[3] == 10 * 2, "test_mul failed"
-    assert cpu.regs[5] == -30 * 3, "test_mul failed"
+    assert cpu.regs[5] == (-30 * 3) & 0xFFFFFFFF, "test_mul failed"
 
 def test_mulh():
     code = """
@@ -606,8 +606,8 @@ _start:
     mulh x5, x1, x2  # x5 = (x1 * x2) >> 32
 """
     cpu = rv_helper(code, "test_mulh", 6)
-    assert cpu.regs[3] == (0x12345678 * -2023406815) >> 32, "test_mulh failed"
-    assert cpu.regs[5] == (0x12345678 * -2023406815) >> 32, "test_mulh failed"
+    assert cpu.regs[3] == ((0x12345678 * -2023406815) >> 32) & 0xFFFFFFFF, "test_mulh failed"
+    assert cpu.regs[5] == ((0x12345678 * -2023406815) >> 32) & 0xFFFFFFFF, "test_mulh failed"
 
 def test_mulhsu():
     code = """
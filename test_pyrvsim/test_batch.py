@@ -0,0 +1,108 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU
+
+np = pytest.importorskip("numpy")
+from pyRISCV.batch import BatchCPU, HALTED, FAULTED
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+def run_scalar(program, a0, a1=0, a2=0):
+    cpu = CPU(program)
+    cpu.regs[10] = a0
+    cpu.regs[11] = a1
+    cpu.regs[12] = a2
+    cpu.run(100000)
+    return cpu
+
+def test_batch_divergent_loop():
+    code = """
+.global _start
+_start:
+    li a1, 0           # a1 = collatz steps of a0
+    li t1, 1
+loop:
+    beq a0, t1, done
+    andi t0, a0, 1
+    bnez t0, odd
+    srli a0, a0, 1
+    j next
+odd:
+    slli t0, a0, 1
+    add a0, a0, t0
+    addi a0, a0, 1
+next:
+    addi a1, a1, 1
+    j loop
+done:
+    li t2, 0x80001000
+    sw a1, 0(t2)
+    .word 0
+"""
+    program = rv_build(code, "test_batch_divergent_loop")
+    inputs = list(range(1, 65))
+    batch = BatchCPU(program, len(inputs), mem_size=0x2000)
+    batch.regs[:, 10] = inputs
+    batch.run(100000)
+    assert (batch.status == HALTED).all()
+    for i, a0 in enumerate(inputs):
+        cpu = run_scalar(program, a0)
+        assert int(batch.regs[i, 11]) == cpu.regs[11], f"steps differ for {a0}"
+        assert int(batch.mem[i, 0x1000]) == cpu.bus.dram.data[0x1000]
+        assert int(batch.pc[i]) == cpu.pc
+    assert batch.instructions > len(inputs)
+
+def test_batch_alu_matches_scalar():
+    code = """
+.global _start
+_start:
+    add s0, a0, a1
+    sub s1, a0, a1
+    mul s2, a0, a1
+    mulh s3, a0, a1
+    mulhu s4, a0, a1
+    sra s5, a0, a2
+    srl s6, a0, a2
+    slt s7, a0, a1
+    sltu s8, a0, a1
+    xori s9, a0, -7
+    sll s10, a0, a2
+    lb s11, 1(a0)
+    div t3, a0, a1
+    rem t4, a0, a1
+    divu t5, a1, a2
+    remu t6, a1, a2
+    .word 0
+"""
+    program = rv_build(code, "test_batch_alu_matches_scalar")
+    rng = np.random.default_rng(1)
+    a0 = rng.integers(0, 1 << 32, 16, dtype=np.uint64)
+    a0[:8] = 0x80000000 + rng.integers(0, 0x100, 8)  # lb from DRAM for half of them
+    a1 = rng.integers(0, 1 << 32, 16, dtype=np.uint64)
+    a2 = rng.integers(0, 32, 16, dtype=np.uint64)
+    batch = BatchCPU(program, 16, mem_size=0x1000)
+    batch.regs[:, 10] = a0
+    batch.regs[:, 11] = a1
+    batch.regs[:, 12] = a2
+    batch.run()
+    assert (batch.status[:8] == HALTED).all()
+    assert (batch.status[8:] == FAULTED).all()
+    for i in range(8):
+        cpu = run_scalar(program, int(a0[i]), int(a1[i]), int(a2[i]))
+        for reg in range(8, 32):
+            assert int(batch.regs[i, reg]) == cpu.regs[reg], f"x{reg} differs"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,96 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU
+from pyRISCV.params import DRAM_BASE, SECTOR_SIZE, BLOCK_OK, BLOCK_ERROR
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+BLOCK_CODE = """
+.global _start
+_start:
+    li t0, 0x10001000
+    li t1, 3
+    sw t1, 0(t0)        # sector
+    li t1, 0x80010000
+    sw t1, 4(t0)        # buffer
+    li t1, 4
+    sw t1, 8(t0)        # count
+    li t1, 1
+    sw t1, 12(t0)       # read
+    lw s0, 16(t0)
+    lw s1, 20(t0)       # capacity
+    sw zero, 0(t0)
+    li t1, 1
+    sw t1, 8(t0)
+    li t1, 2
+    sw t1, 12(t0)       # write sector 0 back from the buffer
+    lw s3, 16(t0)
+    li t1, 100
+    sw t1, 0(t0)
+    li t1, 1
+    sw t1, 12(t0)       # read past the end
+    lw s4, 16(t0)
+    .word 0
+"""
+
+def disk(path, sectors):
+    contents = bytes(i * 7 & 0xFF for i in range(sectors * SECTOR_SIZE + 100))
+    with open(path, "wb") as f:
+        f.write(contents)
+    return contents
+
+def run(path, writable):
+    cpu = CPU(rv_build(BLOCK_CODE, "test_block"))
+    cpu.bus.block.attach(path, writable)
+    cpu.run(1000)
+    assert cpu.halted
+    return cpu
+
+def test_read_write_sectors():
+    contents = disk("tmp/test_block.img", 16)
+    cpu = run("tmp/test_block.img", writable=True)
+    sectors = contents[3 * SECTOR_SIZE:7 * SECTOR_SIZE]
+    assert cpu.bus.dram.load_bytes(0x80010000, len(sectors)) == sectors
+    assert cpu.regs[8] == BLOCK_OK and cpu.regs[9] == 16
+    assert cpu.regs[19] == BLOCK_OK and cpu.regs[20] == BLOCK_ERROR
+    cpu.bus.block.close()
+    with open("tmp/test_block.img", "rb") as f:
+        written = f.read()
+    assert written[:SECTOR_SIZE] == sectors[:SECTOR_SIZE] and written[SECTOR_SIZE:] == contents[SECTOR_SIZE:]
+
+def test_read_only_and_missing_disk():
+    contents = disk("tmp/test_block.img", 16)
+    cpu = run("tmp/test_block.img", writable=False)
+    assert cpu.regs[8] == BLOCK_OK and cpu.regs[19] == BLOCK_ERROR
+    with open("tmp/test_block.img", "rb") as f:
+        assert f.read() == contents
+    cpu = CPU(rv_build(BLOCK_CODE, "test_block"))
+    cpu.run(1000)
+    assert cpu.regs[8] == BLOCK_ERROR and cpu.regs[9] == 0
+
+def test_read_over_code():
+    cpu = CPU(rv_build(BLOCK_CODE, "test_block"))
+    with open("tmp/test_block.img", "wb") as f:
+        f.write(bytes(SECTOR_SIZE))
+    cpu.bus.block.attach("tmp/test_block.img")
+    cpu.step()
+    cpu.bus.store(0x10001004, DRAM_BASE, 32)
+    cpu.bus.store(0x10001008, 1, 32)
+    cpu.bus.store(0x1000100C, 1, 32)
+    assert DRAM_BASE not in cpu.decode_cache, "decoded code read over is dropped"
+    assert cpu.bus.dram.load(DRAM_BASE, 32) == 0
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
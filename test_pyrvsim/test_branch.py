@@ -0,0 +1,76 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU
+from pyRISCV.branch import BranchProfiler, BTB, GShare
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+BRANCHES_CODE = """
+.global _start
+_start:
+    li s0, 0
+    li s1, 1000
+    li s2, 0
+loop:
+    andi t0, s0, 1
+    beqz t0, even      # alternates: taken, not taken, ...
+    addi s2, s2, 1
+even:
+    call func
+    addi s0, s0, 1
+    bne s0, s1, loop   # backward, taken until the last iteration
+    .word 0
+func:
+    addi s3, s3, 2
+    ret
+"""
+
+def run(profiler):
+    cpu = CPU(rv_build(BRANCHES_CODE, "test_branch_profile"))
+    cpu.attach_branch_profiler(profiler)
+    executed = cpu.run(100000)
+    assert cpu.halted
+    return cpu, executed
+
+def test_predictor_accuracy():
+    profiler = BranchProfiler()
+    profiled, executed_profiled = run(profiler)
+    plain, executed_plain = run(None)
+    assert profiled.regs == plain.regs and executed_profiled == executed_plain
+    assert profiler.totals("btfn") == (2000, 501)
+    btfn = profiler.mispredicted["btfn"]
+    assert sorted(btfn.values()) == [1, 500], "btfn misses the loop exit and every other alternating branch"
+    assert all(profiler.executed[pc] == 1000 for pc in btfn)
+    assert profiler.accuracy("gshare") > 0.95 > profiler.accuracy("bimodal")
+    assert profiler.totals("btb/ras")[0] == 2000, "one call and one return per iteration"
+    assert profiler.accuracy("btb/ras") > 0.99, "returns come off the return address stack"
+    assert any("gshare" in line for line in profiler.report())
+
+def test_return_stack_overflow():
+    btb = BTB(ras_depth=2)
+    for depth in range(3):
+        btb.update(0x100 + 4 * depth, 2, 0x200, 0x104 + 4 * depth)  # nested calls
+    assert btb.ras == [0x108, 0x10C], "the oldest return address is dropped"
+    assert btb.predict(0x300, 3) == 0x10C
+
+def test_gshare_history():
+    gshare = GShare(index_bits=4, history_bits=2)
+    wrong = {}
+    gshare.train([(0x80000000, 0x80000010, taken) for taken in (1, 0, 1)], wrong)
+    assert gshare.history == 0b01
+    assert wrong == {0x80000000: 2}, "each history selects a fresh, weakly not-taken counter"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,101 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU
+from pyRISCV.config import MachineConfig
+from pyRISCV.cache import Cache, CacheHierarchy
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+@pytest.mark.parametrize("policy, hit", [("lru", True), ("fifo", False)])
+def test_replacement(policy, hit):
+    cache = Cache("L1D", 64, 2, 16, policy)  # 2 sets of 2 ways
+    for address in (0x00, 0x20, 0x00, 0x40):  # all map to set 0
+        cache.access(address, False, 0)
+    assert cache.misses == 3
+    assert cache.access(0x00, False, 0) == hit, "lru keeps the line used last, fifo evicts the oldest fill"
+
+def test_writeback_to_next_level():
+    l2 = Cache("L2", 256, 4, 16)
+    l1 = Cache("L1D", 32, 1, 16, next_level=l2)
+    l1.access(0x100, True, 0x80000000)
+    l1.access(0x120, False, 0x80000004)  # evicts the dirty line
+    assert l1.writebacks == 1 and l1.by_pc[0x80000004] == [0, 1, 1]
+    assert l2.misses == 2 and l2.hits == 1, "the victim is written back into L2"
+    l1.flush()
+    assert l1.writebacks == 1, "the clean line is dropped without a writeback"
+
+SUM_CODE = """
+.global _start
+_start:
+    li s0, 0x80010000
+    li s1, 2           # passes over the array
+    li a0, 0
+pass:
+    mv t0, s0
+    li t1, 512         # words, 2KB
+sum:
+    lw t2, 0(t0)
+    add a0, a0, t2
+    sw a0, 0(t0)
+    addi t0, t0, 4
+    addi t1, t1, -1
+    bnez t1, sum
+    addi s1, s1, -1
+    bnez s1, pass
+    .word 0
+"""
+
+def run(caches):
+    cpu = CPU(rv_build(SUM_CODE, "test_cache_sum"))
+    cpu.attach_caches(caches)
+    executed = cpu.run(100000)
+    assert cpu.halted
+    return cpu, executed
+
+def test_hierarchy_statistics():
+    plain, executed_plain = run(None)
+    small = CacheHierarchy(l1d=Cache("L1D", 1024, 2, 32), l2=Cache("L2", 8192, 4, 32),
+                           regions=[("array", 0x80010000, 0x800107FF)])
+    cached, executed_cached = run(small)
+    assert cached.regs == plain.regs
+    assert executed_cached == executed_plain
+    l1d = small.l1d
+    assert l1d.hits + l1d.misses == 2 * 2 * 512, "one load and one store per word"
+    assert l1d.misses == 2 * 2048 // 32, "the array does not fit, so both passes miss"
+    assert l1d.writebacks > 0 and set(l1d.by_region) == {"array"}
+    assert small.l2.by_region["array"][1] == 2048 // 32, "the second pass hits in L2"
+    assert small.l1i.misses < 5 and small.l1i.hits > 6000
+    assert any("L1D" in line for line in small.report())
+
+def test_default_region_follows_dram():
+    cpu = CPU(b"", config=MachineConfig(dram_base=0x40000000, dram_size=1 << 20))
+    caches = CacheHierarchy()
+    cpu.attach_caches(caches)
+    cpu.bus.store(0x40000100, 1, 32)
+    cpu.bus.load(0x40000100, 32)
+    assert caches.l1d.regions == [("dram", 0x40000000, 0x400FFFFF)]
+    assert caches.l1d.by_region["dram"][:2] == [1, 1]
+
+def test_detach_restores_bus():
+    cpu = CPU(rv_build(SUM_CODE, "test_cache_sum"))
+    cpu.attach_caches(CacheHierarchy())
+    cpu.attach_caches(None)
+    assert "load" not in cpu.bus.__dict__ and "store" not in cpu.bus.__dict__
+    cpu.run(100000)
+    assert cpu.halted
+    assert all(handler.__name__ != "fetched" for handler, _, _ in cpu.decode_cache.values())
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
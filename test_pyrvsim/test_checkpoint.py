@@ -0,0 +1,113 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, SDB
+from pyRISCV.checkpoint import Checkpoints, PAGE_SIZE
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+COUNTER_CODE = """
+.global _start
+_start:
+    li s0, 0x80010000
+    li s1, 0
+    li s2, 200
+    li s3, 0x80011000
+loop:
+    addi s1, s1, 1
+    sw s1, 0(s0)
+    andi t0, s1, 63
+    bnez t0, skip
+    sw s1, 0(s3)       # every 64 iterations, on another page
+skip:
+    bne s1, s2, loop
+    .word 0
+"""
+
+def debugger(interval=100, budget=1 << 20):
+    return SDB(rv_build(COUNTER_CODE, "test_checkpoint_counter"), interval, budget)
+
+def test_reverse_step(capsys):
+    sdb = debugger()
+    sdb.onecmd("si 500")
+    assert sdb.cpu.retired() == 500
+    regs, pc = list(sdb.cpu.regs), sdb.cpu.pc
+    memory = bytes(sdb.cpu.bus.dram.load_bytes(0x80010000, 0x1004))
+    sdb.onecmd("si 237")
+    sdb.onecmd("rsi 237")
+    assert sdb.cpu.retired() == 500
+    assert sdb.cpu.regs == regs and sdb.cpu.pc == pc
+    assert bytes(sdb.cpu.bus.dram.load_bytes(0x80010000, 0x1004)) == memory
+    sdb.onecmd("c")
+    assert sdb.cpu.halted and sdb.cpu.regs[9] == 200
+    sdb.onecmd("rsi 5000")
+    assert sdb.cpu.retired() == 0 and sdb.cpu.regs[9] == 0 and not sdb.cpu.halted
+    assert sdb.cpu.load(0x80011000, 32) == 0
+    assert "At instruction 0" in capsys.readouterr().out
+
+def test_reverse_continue(capsys):
+    sdb = debugger()
+    sdb.onecmd("w 0x80011000")
+    sdb.onecmd("c")
+    sdb.onecmd("c")
+    assert sdb.cpu.load(0x80011000, 32) == 128
+    stopped = sdb.cpu.retired()
+    sdb.onecmd("c")
+    sdb.onecmd("rc")
+    assert sdb.cpu.retired() == stopped and sdb.cpu.regs[9] == 128
+    sdb.onecmd("rc")
+    assert sdb.cpu.load(0x80011000, 32) == 64
+    sdb.onecmd("rc")
+    assert sdb.cpu.retired() == 0
+    assert "No earlier hit" in capsys.readouterr().out
+    sdb.onecmd("d 0")
+    sdb.onecmd("si 52")
+    sdb.onecmd("b 0x80000014")  # sw s1, 0(s0)
+    sdb.onecmd("rc")
+    assert sdb.cpu.pc == 0x80000014 and sdb.cpu.regs[9] == 10
+
+def test_budget():
+    sdb = debugger(interval=50, budget=4 * PAGE_SIZE)
+    checkpoints = sdb.checkpoints
+    sdb.onecmd("c")
+    assert checkpoints.used <= 4 * PAGE_SIZE
+    assert checkpoints.oldest() > 0, "the oldest checkpoints are dropped"
+    oldest = checkpoints.oldest()
+    assert checkpoints.seek(0) == oldest
+
+def test_transaction():
+    cpu = CPU(rv_build(COUNTER_CODE, "test_checkpoint_counter"))
+    cpu.run(4)
+    cpu.begin()
+    regs = list(cpu.regs)
+    memory = bytes(cpu.bus.dram.load_bytes(0x80000000, 0x12000))
+    for _ in range(3):
+        executed = cpu.run()
+        assert cpu.halted and cpu.regs[9] == 200
+        assert sorted(cpu.transaction.pages) == [0x10, 0x11], "only the written pages are saved"
+        cpu.rollback()
+        assert cpu.retired() == 4 and not cpu.halted and cpu.regs == regs
+        assert bytes(cpu.bus.dram.load_bytes(0x80000000, 0x12000)) == memory
+    cpu.store(0x80000010, 0x00000013, 32)  # the loop's addi becomes a nop
+    cpu.run(100)
+    assert cpu.regs[9] == 0
+    cpu.rollback()
+    cpu.run(10000)
+    assert cpu.halted, "the decoded nop is dropped with the restored page"
+    cpu.commit()
+    assert cpu.transaction is None and cpu.regs[9] > 0
+    assert cpu.bus.dram.is_plain(0x80010000, 4)
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,83 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, MachineConfig
+from pyRISCV.params import MCAUSE, MISA, MISA_VALUE
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+CONFIG_CODE = """
+.global _start
+_start:
+    la t0, trap
+    csrw mtvec, t0
+    mv s0, sp
+    li t1, 6
+    li t2, 7
+    mul s1, t1, t2
+    sw s1, -3(sp)
+    lw s2, -3(sp)
+    .word 0
+trap:
+    csrr s3, mcause
+    li s1, -1
+    csrr t0, mepc
+    addi t0, t0, 4
+    csrw mepc, t0
+    mret
+"""
+
+def test_machines_side_by_side():
+    program = rv_build(CONFIG_CODE, "test_config")
+    small = CPU(program, config=MachineConfig(dram_base=0x40000000, dram_size=64 << 10, extensions="I"))
+    large = CPU(program, config=MachineConfig(dram_size=4 << 20, engine="plain"))
+    default = CPU(program)
+    for _ in range(3):
+        for cpu in (small, large, default):
+            cpu.run(4)
+    for cpu in (small, large, default):
+        cpu.run(100)
+        assert cpu.halted
+    assert small.pc >= 0x40000000 and small.regs[8] == 0x4000FFFF
+    assert small.regs[9] == 0xFFFFFFFF and small.regs[19] == 2, "mul is illegal without M"
+    assert large.regs[8] == 0x803FFFFF and large.regs[9] == 42 and large.regs[18] == 42
+    assert default.regs[8] == 0x800FFFFF and default.regs[9] == 42
+    assert small.csr.csrs[MISA] == MISA_VALUE & ~(1 << 12 | 1 << 0 | 1 << 2)
+    assert large.csr.csrs[MISA] == MISA_VALUE
+    assert not large.fuse_pairs and default.fuse_pairs
+
+def test_optional_devices():
+    cpu = CPU(b"", config=MachineConfig(devices=("dma",)))
+    assert cpu.bus.block is None and cpu.bus.framebuffer is None
+    cpu.bus.store(0x10002000, 0x80000000, 32)
+    assert cpu.bus.load(0x10002000, 32) == 0x80000000
+    cpu.pc = 0x80000000
+    cpu.bus.dram.store(0x80000000, 0x0000A023 | 0x300 << 20 | 10 << 15, 32)  # sw x0, 0x300(a0)
+    cpu.regs[10] = 0x30000000 - 0x300
+    cpu.step()
+    assert cpu.csr.csrs[MCAUSE] == 7, "no framebuffer: store access fault"
+
+def test_compressed_off():
+    cpu = CPU(bytes([0x05, 0x04, 0, 0]), config=MachineConfig(extensions="IMA"))  # c.addi s0, 1
+    cpu.step()
+    assert cpu.csr.csrs[MCAUSE] == 2 and cpu.regs[8] == 0
+
+def test_bad_config():
+    for kwargs in ({"dram_size": 1000}, {"devices": ("gpu",)}, {"extensions": "MA"}, {"engine": "jit"},
+                   {"dram_base": 0xFFFFF000, "dram_size": 0x2000}):
+        with pytest.raises(ValueError):
+            MachineConfig(**kwargs)
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
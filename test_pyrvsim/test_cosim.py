@@ -0,0 +1,113 @@
+import sys
+sys.path.append('../')
+import os
+import gzip
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU
+from pyRISCV.cosim import CoSimulator, Divergence, open_log, parse_commits
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+COSIM_CODE = """
+.global _start
+_start:
+    li s0, 0x80010000
+    li s1, 20
+loop:
+    sw s1, 0(s0)
+    sb s1, 4(s0)
+    lw t0, 0(s0)
+    add s2, s2, t0
+    addi s1, s1, -1
+    bnez s1, loop
+    .word 0
+"""
+
+BOOT_ROM = [
+    b"core   0: 3 0x00001000 (0x00000297) x5  0x00001000\n",
+    b"core   0: 3 0x00001010 (0x00028067)\n",
+]
+
+def commit_log(program):
+    """
+        The commit log Spike writes for program, made by stepping the
+        simulator: pc, instruction, register written and stores"""
+    cpu = CPU(program)
+    stores = []
+    store = cpu.bus.store
+    def logged(address, value, size):
+        stores.append(f" mem {address:#010x} 0x{value:0{size // 4}x}")
+        store(address, value, size)
+    cpu.bus.store = logged
+    lines = list(BOOT_ROM)
+    while True:
+        pc, before = cpu.pc, list(cpu.regs)
+        inst = cpu.load(pc, 32)
+        stores.clear()
+        if not cpu.step():
+            lines.append(f"core   0: exception trap_illegal_instruction, epc {pc:#010x}\n".encode())
+            return lines
+        written = "".join(f" x{rd:<2} {cpu.regs[rd]:#010x}" for rd in range(1, 32) if cpu.regs[rd] != before[rd])
+        lines.append(f"core   0: 3 {pc:#010x} ({inst:#010x}){written}{''.join(stores)}\n".encode())
+
+def test_parse_commits():
+    lines = [b"core   0: 3 0x80000008 (0x0005a503) x10 0x00000007 mem 0x80001000\n",
+             b"core   0: 3 0x8000000c (0x00b60023) mem 0x80001004 0x07\n",
+             b"core   0: 3 0x80000010 (0x30529073) c773_mtvec 0x80000100\n",
+             b"core   0: exception trap_user_ecall, epc 0x80000014\n",
+             b"core   0:           tval 0x00000000\n"]
+    commits = [commit[:3] for commit in parse_commits(lines)]
+    assert commits == [(0x80000008, {10: 7}, []), (0x8000000C, {}, [(0x80001004, 7, 8)]),
+                       (0x80000010, {}, []), (0x80000014, None, None)]
+
+def test_matching_log():
+    program = rv_build(COSIM_CODE, "test_cosim")
+    log = commit_log(program)
+    with gzip.open("tmp/test_cosim.log.gz", "wb") as compressed:
+        compressed.writelines(log)
+    cpu = CPU(program)
+    assert CoSimulator(cpu, open_log("tmp/test_cosim.log.gz")).run() == len(log) - len(BOOT_ROM)
+    assert cpu.halted and cpu.regs[18] == 210
+
+def test_first_divergence():
+    program = rv_build(COSIM_CODE, "test_cosim")
+    log = commit_log(program)
+    index = len(BOOT_ROM) + 2 + 4 * 6 + 1  # the sb of the 5th iteration
+    assert log[index].endswith(b" 0x10\n")
+    log[index] = log[index].replace(b" 0x10\n", b" 0x11\n")
+    with pytest.raises(Divergence) as divergence:
+        CoSimulator(CPU(program), iter(log), context=4).run()
+    assert divergence.value.retired == 28 and divergence.value.pc == 0x8000000C
+    assert "stores" in divergence.value.reason
+    report = divergence.value.report()
+    assert report[4] == log[index - 1].decode().rstrip()
+    assert report[5] == ">> " + log[index].decode().rstrip()
+    assert report[6] == log[index + 1].decode().rstrip()
+
+def test_log_ends_early():
+    program = rv_build(COSIM_CODE, "test_cosim")
+    log = commit_log(program)
+    with pytest.raises(Divergence, match="the reference ended"):
+        CoSimulator(CPU(program), iter(log[:len(BOOT_ROM) + 10])).run()
+    with pytest.raises(Divergence, match="the simulator ended"):
+        CoSimulator(CPU(program), iter(log + log[-2:])).run()
+    assert CoSimulator(CPU(program), iter(log[:len(BOOT_ROM) + 10])).run(10) == 10
+
+def test_log_of_another_program():
+    program = rv_build(COSIM_CODE, "test_cosim")
+    log = [line.replace(b"0x8000", b"0x9000") for line in commit_log(program)]
+    with pytest.raises(Divergence, match="never reaches pc 0x80000000"):
+        CoSimulator(CPU(program), iter(log)).run()
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
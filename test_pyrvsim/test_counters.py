@@ -0,0 +1,109 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, params
+from pyRISCV.rv_exception import ExceptionType
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+def test_instret_and_cycle():
+    code = """
+.global _start
+_start:
+    csrr a0, minstret
+    li t0, 1000
+loop:
+    addi t0, t0, -1
+    bnez t0, loop
+    csrr a1, minstret
+    rdcycle a2
+    rdinstret a3
+    csrw minstret, zero
+    csrr a4, minstret
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_instret_and_cycle"))
+    executed = cpu.run(3000)  # spans several interrupt poll chunks
+    assert cpu.halted
+    assert cpu.regs[10] == 0, "nothing retired before the first instruction"
+    assert cpu.regs[11] == 2002, "li plus 1000 loop iterations"
+    assert cpu.regs[12] == 2003, "one cycle per instruction"
+    assert cpu.regs[13] == 2004
+    assert cpu.regs[14] == 1, "minstret counts on from the written value"
+    assert cpu.retired() == executed == 2007
+    assert cpu.counters.value(2) == 2007 - 2005
+    assert cpu.bus.load(params.CLINT_BASE + params.CLINT_MTIME, 64) == 2007 // params.INSTRUCTIONS_PER_TICK
+
+def test_counter_enable():
+    code = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    li t0, 4           # instret only
+    csrw mcounteren, t0
+    csrw scounteren, t0
+    la t0, user
+    csrw mepc, t0
+    mret
+user:
+    rdinstret a0       # allowed
+    rdcycle a1         # not enabled
+    .word 0
+handler:
+    csrr a2, mcause
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_counter_enable"))
+    cpu.run(100)
+    assert cpu.regs[10] == 10
+    assert cpu.regs[11] == 0
+    assert cpu.regs[12] == ExceptionType.ILLEGAL_INSTRUCTION.value
+
+def test_hpm_events():
+    code = """
+.global _start
+_start:
+    li t0, 1           # loads
+    csrw mhpmevent3, t0
+    li t0, 3           # taken branches
+    csrw mhpmevent4, t0
+    la t1, data
+    li t0, 5
+loop:
+    lw t2, 0(t1)
+    sw t2, 4(t1)
+    addi t0, t0, -1
+    bnez t0, loop
+    csrr a0, mhpmcounter3
+    csrr a1, mhpmcounter4
+    csrr a2, mhpmcounter5
+    csrw mhpmevent3, zero
+    lw t2, 0(t1)
+    csrr a3, mhpmcounter3
+    .word 0
+data:
+    .word 0, 0
+"""
+    cpu = CPU(rv_build(code, "test_hpm_events"))
+    cpu.run(200)
+    assert cpu.regs[10] == 5
+    assert cpu.regs[11] == 4
+    assert cpu.regs[12] == 0, "unselected counters do not count"
+    assert cpu.regs[13] == 5, "counter keeps its value once deselected"
+    assert "load" not in cpu.__dict__ and "store" not in cpu.__dict__
+    assert cpu.count_branches
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
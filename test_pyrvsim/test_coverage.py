@@ -0,0 +1,123 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build_elf
+from pyRISCV import CPU
+from pyRISCV.elf import ELF
+from pyRISCV.coverage import Coverage
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+COVERAGE_CODE = """
+.global _start
+_start:
+    li s0, 0x80010000
+    li s1, 10
+    beqz a0, loop
+    call rare
+loop:
+    call work
+    addi s1, s1, -1
+    bnez s1, loop
+    .word 0
+
+.type work, @function
+work:
+    lw t0, 0(s0)
+    addi t0, t0, 1
+    sw t0, 0(s0)
+    ret
+.size work, .-work
+
+.type rare, @function
+rare:
+    li t1, 1
+    c.addi t1, 1
+    ret
+.size rare, .-rare
+"""
+
+def run(elf, a0=0):
+    cpu = CPU(b"")
+    elf.load(cpu)
+    cpu.regs[10] = a0
+    coverage = Coverage()
+    cpu.attach_coverage(coverage)
+    cpu.run(10000)
+    assert cpu.halted
+    return coverage
+
+def test_functions_hit_and_missed():
+    elf = ELF(rv_build_elf(COVERAGE_CODE, "test_coverage", "rv32imac"))
+    coverage = run(elf)
+    functions = coverage.functions(elf.functions, elf.sizes)
+    assert functions["work"] == (4, 4)
+    assert functions["rare"] == (0, 3)
+    report = coverage.report(elf.functions, elf.sizes)
+    assert report[0] == "1/2 functions hit, 4/7 instructions (57.1%)"
+    assert "  rare: 0/3 instructions (0.0%), missed" in report
+
+def test_merge_runs():
+    elf = ELF(rv_build_elf(COVERAGE_CODE, "test_coverage", "rv32imac"))
+    first = run(elf)
+    first.save("tmp/test_coverage.cov")
+    second = run(elf, a0=1)
+    assert second.functions(elf.functions, elf.sizes)["rare"] == (3, 3)
+    merged = Coverage.load("tmp/test_coverage.cov")
+    assert merged.bitmap == first.bitmap
+    merged.merge(second)
+    merged.use_program(elf)
+    assert set(merged.addresses()) == set(first.addresses()) | set(second.addresses())
+    assert merged.report(elf.functions, elf.sizes)[0] == "2/2 functions hit, 7/7 instructions (100.0%)"
+
+def test_export():
+    elf = ELF(rv_build_elf(COVERAGE_CODE, "test_coverage", "rv32imac"))
+    coverage = run(elf)
+    coverage.export("tmp/test_coverage.txt")
+    with open("tmp/test_coverage.txt") as f:
+        pcs = [int(line, 16) for line in f]
+    assert pcs == list(coverage.addresses())
+    assert elf.functions["work"] in pcs and elf.functions["rare"] not in pcs
+    assert all(coverage.is_hit(pc) for pc in pcs)
+
+BULK_CODE = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    li a0, {destination}
+    addi a1, a0, 16
+    li a2, 1
+fill:
+    sb a2, 0(a0)       # a bulk fill loop, unless the destination faults
+    addi a0, a0, 1
+    bne a0, a1, fill
+handler:
+    .word 0
+"""
+
+@pytest.mark.parametrize("destination, body_hit", [(0x80010000, True), (0x100, False)])
+def test_bulk_loop_marked_when_run(destination, body_hit):
+    elf = ELF(rv_build_elf(BULK_CODE.format(destination=destination), "test_coverage_bulk", "rv32imac"))
+    cpu = CPU(b"")
+    elf.load(cpu)
+    coverage = Coverage()
+    cpu.attach_coverage(coverage)
+    cpu.run(1000)
+    assert cpu.halted and (cpu.bulk > 0) == body_hit
+    fill = elf.symbols["fill"]
+    assert coverage.is_hit(fill)
+    assert coverage.is_hit(fill + 4) == body_hit and coverage.is_hit(fill + 6) == body_hit
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,103 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, params
+from pyRISCV.csr import CSR_TABLE, register_csr
+from pyRISCV.rv_exception import ExceptionType
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+def test_csr_privilege_check():
+    code = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    la t0, user
+    csrw mepc, t0
+    mret               # mpp is 0, so this drops to user mode
+user:
+    csrr a0, mstatus   # machine CSR read from user mode traps
+    .word 0
+handler:
+    csrr a1, mcause
+    csrr a2, mepc
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_csr_privilege_check"))
+    cpu.run(100)
+    assert cpu.regs[11] == ExceptionType.ILLEGAL_INSTRUCTION.value, "csr access should trap"
+    assert cpu.regs[12] == cpu.regs[5], "mepc should point at the csrr (t0 still holds its address)"
+    assert cpu.regs[10] == 0, "csrr should not complete"
+
+def test_csr_read_only_and_unimplemented():
+    code = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    csrr a0, mhartid   # reading a read-only CSR is fine
+    csrr a1, misa
+    csrw mhartid, t0   # writing it traps
+    .word 0
+handler:
+    csrr a2, mcause
+    csrr a3, mepc
+    la t0, unimplemented
+    csrw mtvec, t0
+    csrr a4, 0x7c0     # unimplemented CSR traps
+    .word 0
+unimplemented:
+    csrr a5, mcause
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_csr_read_only_and_unimplemented"))
+    cpu.run(100)
+    assert cpu.regs[10] == 0, "mhartid should be 0"
+    assert cpu.regs[11] == params.MISA_VALUE, "misa mismatch"
+    assert cpu.regs[12] == ExceptionType.ILLEGAL_INSTRUCTION.value, "write to mhartid should trap"
+    assert cpu.regs[15] == ExceptionType.ILLEGAL_INSTRUCTION.value, "unimplemented CSR should trap"
+
+def test_csr_masks_and_hooks():
+    cpu = CPU(b"")
+    cpu.csr.store(params.MIDELEG, params.MASK_SSIP | params.MASK_STIP)
+    cpu.csr.store(params.SIE, 0xFFFFFFFF)
+    assert cpu.csr.load(params.MIE) == params.MASK_SSIP | params.MASK_STIP
+    assert cpu.csr.load(params.SIE) == params.MASK_SSIP | params.MASK_STIP
+    cpu.csr.store(params.MIP, 0xFFFFFFFF)
+    assert cpu.csr.load(params.MIP) == params.MASK_MIP_WRITABLE
+    assert cpu.csr.load(params.SIP) == params.MASK_SSIP | params.MASK_STIP
+    cpu.csr.store(params.SSTATUS, 0xFFFFFFFF)
+    assert cpu.csr.load(params.SSTATUS) == params.MASK_SSTATUS
+
+def test_sstatus_aliases_mstatus():
+    cpu = CPU(b"")
+    cpu.csr.store(params.MSTATUS, params.MASK_MIE)
+    cpu.csr.store(params.SSTATUS, params.MASK_SIE | params.MASK_SPP | params.MASK_MIE)
+    assert cpu.csr.load(params.MSTATUS) == params.MASK_MIE | params.MASK_SIE | params.MASK_SPP
+    cpu.csr.store(params.MSTATUS, params.MASK_SPIE)
+    assert cpu.csr.load(params.SSTATUS) == params.MASK_SPIE
+
+def test_register_csr():
+    addr = 0x7c1  # custom machine read/write CSR
+    try:
+        register_csr(addr, write_mask=0xFF, read_hook=lambda csr, privilege: csr.csrs[addr] | 0x100)
+        cpu = CPU(b"")
+        cpu.csr.store(addr, 0x1234)
+        assert cpu.csr.load(addr) == 0x134
+    finally:
+        CSR_TABLE[addr] = None
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
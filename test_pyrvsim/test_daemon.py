@@ -0,0 +1,100 @@
+import sys
+sys.path.append('../')
+import os
+import base64
+import logging
+import threading
+import statistics
+import pytest
+from utils import rv_build
+from pyRISCV.daemon import Daemon, submit
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+DAEMON_CODE = """
+.global _start
+_start:
+    li s0, 0x10000000
+    lbu t0, 0(s0)          # first input byte from the UART
+    sb t0, 0(s0)
+    li t0, 0x80010000
+    lw s1, 0(t0)           # 0 unless an earlier job's store leaked
+    addi s1, s1, 1
+    sw s1, 0(t0)
+    la a1, message
+    li a0, 1
+    li a2, 3
+    li a7, 64
+    ecall                  # write(1, message, 3)
+    mv a0, s1
+    li a7, 93
+    ecall                  # exit(s1)
+message:
+    .ascii "ok\\n"
+"""
+
+@pytest.fixture
+def daemon():
+    server = Daemon("tmp/test_daemon.sock", workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "tmp/test_daemon.sock"
+    server.shutdown()
+    server.server_close()
+
+def test_jobs_on_warm_machines(daemon):
+    program = rv_build(DAEMON_CODE, "test_daemon")
+    with open("tmp/test_daemon.bin", "wb") as f:
+        f.write(program)
+    jobs = [{"program": base64.b64encode(program).decode(), "input": base64.b64encode(b"x").decode()},
+            {"path": os.path.abspath("tmp/test_daemon.bin"), "outputs": ["regs", "pc"]}] * 10
+    results = submit(daemon, jobs)
+    assert all(result["ok"] for result in results)
+    assert results[0]["exit_code"] == 1 and results[0]["output"] == "xok\n"
+    assert all(result["exit_code"] == 1 for result in results[::2]), "machines are rolled back between jobs"
+    assert results[1]["regs"][9] == 1 and "output" not in results[1]
+    assert statistics.median(result["latency"] for result in results) < 0.05
+
+DEVICES_CODE = """
+.global _start
+_start:
+    li s0, 0x30000000      # framebuffer pixels
+    li s1, 0x10001000      # block device sector register
+    li s2, 0x10003000      # framebuffer registers
+    lw a0, 0(s0)
+    lw t0, 0(s1)
+    or a0, a0, t0
+    lw t0, 4(s2)           # frames
+    or a0, a0, t0
+    li t0, 0x12345000
+    sw t0, 0(s0)
+    sw t0, 0(s1)
+    sw zero, 0(s2)         # vsync
+    li a7, 93
+    ecall                  # exit with what an earlier job left, 0 on a fresh machine
+"""
+
+def test_device_state_does_not_leak(daemon):
+    program = base64.b64encode(rv_build(DEVICES_CODE, "test_daemon_devices")).decode()
+    results = submit(daemon, [{"program": program}] * 8)
+    assert [result["exit_code"] for result in results] == [0] * 8
+
+def test_bad_jobs(daemon):
+    program = base64.b64encode(rv_build(DAEMON_CODE, "test_daemon")).decode()
+    results = submit(daemon, [{"path": "tmp/missing.bin"}, {"nothing": 1}, {"program": "", "isa": "X"},
+                              {"program": program, "outputs": ["bogus"]}, {"program": program, "memory": "x"},
+                              {"program": program, "max_instructions": -1}, {"program": program}])
+    assert [result["ok"] for result in results] == [False] * 6 + [True], "the connection survives bad jobs"
+    assert "FileNotFoundError" in results[0]["error"] and "path or a program" in results[1]["error"]
+    assert "outputs" in results[3]["error"] and "memory" in results[4]["error"]
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,92 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU
+from pyRISCV.params import DMA_DONE, DMA_ERROR, DMA_SETUP_DELAY
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+DMA_CODE = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    li t0, 0x800
+    csrw mie, t0           # MEIE
+    csrsi mstatus, 0x8     # MIE
+    call value
+    mv s4, a0              # 1 from the original code
+    li s0, 0x80010000      # source
+    li t0, 0x80020000      # destination
+    li t1, 0x80030000      # descriptors
+    sw s0, 0(t1)
+    sw t0, 4(t1)
+    li t2, 4096
+    sw t2, 8(t1)
+    addi t2, t1, 16
+    sw t2, 12(t1)          # chain to the second descriptor
+    la t0, replacement
+    sw t0, 16(t1)
+    la t0, value
+    sw t0, 20(t1)
+    li t2, 4
+    sw t2, 24(t1)
+    sw zero, 28(t1)
+    li t0, 0x10002000
+    sw t1, 0(t0)
+    li t2, 3
+    sw t2, 4(t0)           # start, interrupt enabled
+    li t1, 0x80020000
+    lw s5, 0(t1)           # not copied yet
+spin:
+    addi s2, s2, 1
+    beqz s3, spin
+    call value
+    mv s6, a0              # 2 from the copied-in code
+    .word 0
+
+value:
+    li a0, 1
+    ret
+replacement:
+    li a0, 2
+
+handler:
+    li t0, 0x10002000
+    lw s3, 8(t0)           # status
+    li t1, 6
+    sw t1, 8(t0)           # acknowledge
+    mret
+"""
+
+def test_chained_copy_with_interrupt():
+    cpu = CPU(rv_build(DMA_CODE, "test_dma"))
+    source = bytes(i * 13 & 0xFF for i in range(4096))
+    cpu.bus.dram.store_bytes(0x80010000, source)
+    cpu.run(100000)
+    assert cpu.halted
+    assert cpu.bus.dram.load_bytes(0x80020000, 4096) == source
+    assert cpu.regs[19] == DMA_DONE, "status seen by the handler"
+    assert cpu.regs[21] == 0, "the destination is written on completion"
+    assert cpu.regs[18] >= (DMA_SETUP_DELAY + 4100 // 8) // 2 - 10, "interrupt after the modeled delay"
+    assert cpu.regs[20] == 1 and cpu.regs[22] == 2, "decoded code in the destination is dropped"
+    assert cpu.bus.dma.load(0x10002008, 32) == 0 and not cpu.bus.external_interrupt()
+
+def test_bad_descriptor():
+    cpu = CPU(rv_build(DMA_CODE.replace("sw t0, 4(t1)\n", "sw zero, 4(t1)\n", 1), "test_dma"))
+    cpu.run(100000)
+    assert cpu.halted and cpu.regs[19] == DMA_ERROR
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,114 @@
+import sys
+sys.path.append('../')
+import os
+import zlib
+import logging
+import pytest
+from multiprocessing import shared_memory
+from utils import rv_build
+from pyRISCV import CPU
+from pyRISCV.params import FB_BASE, FB_WIDTH, FB_HEIGHT, FB_SIZE
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+FRAMEBUFFER_CODE = """
+.global _start
+_start:
+    li s0, 0x30000000
+    li s1, 0x10003000
+    lw s2, 8(s1)           # geometry
+    li t0, 0x00FF8000      # orange
+    sw t0, 0(s0)
+    li t0, 0x000000FF      # blue
+    sw t0, 4(s0)
+    sw zero, 0(s1)         # vsync
+    li t0, 0x00010203
+    sw t0, 1276(s0)        # last pixel of the first row
+    sb t0, 8(s0)
+    lw s3, 0(s0)
+    sw zero, 0(s1)
+    lw s4, 4(s1)           # frames
+    .word 0
+"""
+
+def test_pixels_and_vsync_export():
+    cpu = CPU(rv_build(FRAMEBUFFER_CODE, "test_framebuffer"))
+    cpu.bus.framebuffer.output = "tmp/test_framebuffer{:d}.ppm"
+    cpu.run(1000)
+    assert cpu.halted
+    assert cpu.regs[18] == FB_WIDTH | FB_HEIGHT << 16
+    assert cpu.regs[19] == 0x00FF8000 and cpu.regs[20] == 2
+    with open("tmp/test_framebuffer0.ppm", "rb") as f:
+        first = f.read()
+    header = b"P6\n%d %d\n255\n" % (FB_WIDTH, FB_HEIGHT)
+    assert first.startswith(header) and len(first) == len(header) + FB_WIDTH * FB_HEIGHT * 3
+    assert first[len(header):len(header) + 9] == bytes([0xFF, 0x80, 0, 0, 0, 0xFF, 0, 0, 0])
+    with open("tmp/test_framebuffer1.ppm", "rb") as f:
+        second = f.read()[len(header):]
+    assert second[6:9] == bytes([0, 0, 0x03]) and second[FB_WIDTH * 3 - 3:FB_WIDTH * 3] == bytes([1, 2, 3])
+
+def test_png_export():
+    cpu = CPU(b"")
+    cpu.bus.store(FB_BASE + 4 * (FB_WIDTH + 1), 0x00123456, 32)
+    cpu.bus.framebuffer.export("tmp/test_framebuffer.png")
+    with open("tmp/test_framebuffer.png", "rb") as f:
+        png = f.read()
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    start = png.index(b"IDAT") + 4
+    length = int.from_bytes(png[start - 8:start - 4], "big")
+    rows = zlib.decompress(png[start:start + length])
+    stride = 1 + FB_WIDTH * 3
+    assert len(rows) == stride * FB_HEIGHT
+    assert rows[stride + 1 + 3:stride + 1 + 6] == bytes([0x12, 0x34, 0x56])
+
+def test_shared_pixels_and_periodic_export():
+    cpu = CPU(rv_build(FRAMEBUFFER_CODE, "test_framebuffer"))
+    framebuffer = cpu.bus.framebuffer
+    framebuffer.output = "tmp/test_framebuffer_periodic{:d}.ppm"
+    framebuffer.export_every(4)
+    viewer = shared_memory.SharedMemory(name=framebuffer.share())
+    try:
+        cpu.run(1000)
+        assert bytes(viewer.buf[:8]) == bytes([0x00, 0x80, 0xFF, 0x00, 0xFF, 0x00, 0x00, 0x00])
+        assert framebuffer.exported > 2 and os.path.exists("tmp/test_framebuffer_periodic2.ppm")
+    finally:
+        viewer.close()
+        framebuffer.close()
+    assert len(framebuffer.pixels) == FB_SIZE and framebuffer.pixels[8] == 0x03
+
+def test_periodic_export_survives_rollback():
+    cpu = CPU(rv_build(FRAMEBUFFER_CODE, "test_framebuffer"))
+    framebuffer = cpu.bus.framebuffer
+    framebuffer.output = "tmp/test_framebuffer_rollback{:d}.ppm"
+    framebuffer.export_every(4)
+    cpu.begin()
+    cpu.run(6)
+    assert framebuffer.exported == 1
+    cpu.rollback()
+    assert cpu.bus.events.next == 4, "the next periodic export is scheduled again"
+    cpu.run(1000)
+    assert framebuffer.exported > 2
+
+def test_rollback_copies_pixels_only_when_written():
+    cpu = CPU(rv_build(FRAMEBUFFER_CODE, "test_framebuffer"))
+    framebuffer = cpu.bus.framebuffer
+    cpu.begin()
+    snapshot = framebuffer.snapshot
+    cpu.run(3)  # no pixel written yet
+    cpu.rollback()
+    assert framebuffer.snapshot is snapshot and not framebuffer.dirty, "an unchanged frame is not copied"
+    cpu.run(1000)
+    assert framebuffer.dirty and framebuffer.frames == 2
+    cpu.rollback()
+    assert bytes(framebuffer.pixels[:12]) == bytes(12) and framebuffer.frames == 0
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
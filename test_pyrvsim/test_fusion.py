@@ -0,0 +1,95 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, SDB
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+IDIOMS_CODE = """
+.global _start
+_start:
+    li s0, 0x12345678  # lui + addi
+    la s1, data        # auipc + addi
+    lw s2, 0(s1)
+    slli s3, s2, 16    # slli + srli
+    srli s3, s3, 16
+    li t0, 0
+    li t1, 10
+loop:
+    addi t0, t0, 1
+    slt t2, t0, t1     # slt + bnez
+    bnez t2, loop
+    call func          # auipc + jalr
+    sltiu t3, t0, 5
+    beqz t3, done
+    li s5, 1
+done:
+    .word 0
+func:
+    li s4, 0x00ABCDEF
+    ret
+data:
+    .word 0xCAFEF00D
+"""
+
+def run(code, name, fuse_pairs):
+    cpu = CPU(rv_build(code, name))
+    cpu.fuse_pairs = fuse_pairs
+    executed = cpu.run(1000)
+    assert cpu.halted
+    return cpu, executed
+
+def test_fused_idioms():
+    fused, executed_fused = run(IDIOMS_CODE, "test_fused_idioms", True)
+    plain, executed_plain = run(IDIOMS_CODE, "test_fused_idioms", False)
+    assert fused.regs == plain.regs
+    assert executed_fused == executed_plain, "fused pairs still count as two instructions"
+    assert fused.retired() == plain.retired()
+    assert fused.fused > 10 and plain.fused == 0
+    assert fused.regs[8] == 0x12345678 and fused.regs[19] == 0xF00D
+    assert fused.regs[20] == 0x00ABCDEF and fused.regs[21] == 0
+
+def test_jump_into_fused_pair():
+    code = """
+.global _start
+_start:
+    li s0, 0
+pair:
+    lui a0, 0x12345
+target:
+    addi a0, a0, 1     # second half of a fused li
+    mv a1, a0
+    addi s0, s0, 1
+    li a0, 7
+    li t0, 2
+    bne s0, t0, target
+    .word 0
+"""
+    cpu, _ = run(code, "test_jump_into_fused_pair", True)
+    assert cpu.fused > 0
+    assert cpu.regs[11] == 8, "jumping to the second instruction runs it alone"
+
+def test_debugger_steps_through_pairs(capsys):
+    sdb = SDB(rv_build(IDIOMS_CODE, "test_debugger_steps_through_pairs"))
+    second = sdb.cpu.pc + 4  # addi of the lui + addi pair
+    sdb.do_b(hex(second))
+    sdb.do_c("")
+    assert sdb.cpu.pc == second
+    assert "Break point reached" in capsys.readouterr().out
+    sdb.do_si("3")
+    assert sdb.cpu.retired() == 4
+    assert "Program terminated" not in capsys.readouterr().out
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,54 @@
+import sys
+sys.path.append('../')
+import logging
+import pytest
+from pyRISCV import fuzz
+from pyRISCV.fuzz import Fuzzer, check, decode, encode, HANDLER_INDEX
+from pyRISCV.instruction_executor import InstructionExecutor, uppack_inst
+
+logging.disable(logging.CRITICAL)
+
+def test_encoding():
+    assert encode("addi", 1, 2, 0, -1) == 0xFFF10093
+    assert encode("sw", 0, 3, 5, -4) == 0xFE51AE23
+    assert encode("bne", 0, 1, 2, 8) == 0x00209463
+    assert encode("jal", 1, 0, 0, 16) == 0x010000EF
+    for inst in (0xFFF10093, 0xFE51AE23, 0x00209463, 0x010000EF, 0x4051D293):
+        assert encode(*decode(inst)) == inst
+
+def test_no_differences():
+    fuzzer = Fuzzer(workers=0, seed=1)
+    assert fuzzer.run(1000) == []
+    assert fuzzer.coverage() > 500 and fuzzer.corpus
+
+def test_worker_processes():
+    fuzzer = Fuzzer(workers=2, seed=2)
+    assert fuzzer.run(300) == []
+    assert fuzzer.executed == 300
+
+def test_coverage_from_simulator_handlers():
+    regs = [0] * 32
+    regs[3] = fuzz.FUZZ_SCRATCH
+    program = [encode("lui", 5, imm=0x12345), encode("addi", 5, 5, imm=0x678), encode("add", 6, 5, 5)]
+    _, reason, hits = check((program, regs, bytes(fuzz.FUZZ_SCRATCH_SIZE)))
+    assert reason is None
+    handlers = {index >> 6 for index in hits}
+    assert handlers == {HANDLER_INDEX["fused_li"], HANDLER_INDEX["execute_add"]}, "the pair runs as one fused handler"
+
+def test_finds_and_minimizes(monkeypatch):
+    def execute_sll(self, cpu, inst):
+        rd, rs1, rs2 = uppack_inst(inst)
+        cpu.regs[rd] = cpu.regs[rs1] << (cpu.regs[rs2] & 0x1F)  # result not masked to 32 bits
+        return cpu.update_pc()
+    monkeypatch.setattr(InstructionExecutor, "execute_sll", execute_sll)
+    monkeypatch.setattr(fuzz, "machine", None)
+    fuzzer = Fuzzer(workers=0, seed=3)
+    failures = fuzzer.run(2000, stop_on_failure=True)
+    assert failures
+    (program, regs, _), reason = failures[0]
+    assert len(program) == 1 and decode(program[0])[0] == "sll"
+    assert sum(1 for value in regs if value) <= 3, "only x3 and the operands are kept"
+    assert reason in "\n".join(fuzzer.report())
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
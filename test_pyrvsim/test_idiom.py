@@ -0,0 +1,133 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, params
+from pyRISCV.dram import DRAM
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+BUFFERS = 0x80010000  # well away from the code pages
+
+LOOPS_CODE = """
+.global _start
+_start:
+    li s0, 0x80010000  # source
+    li s1, 0x80010100  # destination
+    # fill the source with 1..200 using a plain loop
+    li t0, 1
+    mv t1, s0
+init:
+    sb t0, 0(t1)
+    addi t0, t0, 1
+    addi t1, t1, 1
+    li t2, 201
+    bne t0, t2, init
+    sb zero, 0(t1)
+    # memcpy: pointer compare
+    mv a0, s0
+    mv a1, s1
+    addi a2, s0, 150
+copy:
+    lbu a3, 0(a0)
+    addi a0, a0, 1
+    addi a1, a1, 1
+    sb a3, -1(a1)
+    bne a0, a2, copy
+    # memset: counter
+    li a4, 0x5A
+    addi a5, s1, 160
+    li a6, 40
+fill:
+    sb a4, 0(a5)
+    addi a5, a5, 1
+    addi a6, a6, -1
+    bnez a6, fill
+    # strlen
+    mv s2, s0
+scan:
+    lbu t3, 0(s2)
+    addi s2, s2, 1
+    bnez t3, scan
+    sub s2, s2, s0
+    # memset: bltu
+    addi t4, s1, 300
+    addi t5, s1, 310
+clear:
+    sb zero, 0(t4)
+    addi t4, t4, 1
+    bltu t4, t5, clear
+    # overlapping forward copy replicates data, so it falls back
+    mv a0, s1
+    addi a1, s1, 1
+    addi a2, s1, 8
+smear:
+    lb a3, 0(a0)
+    sb a3, 0(a1)
+    addi a0, a0, 1
+    addi a1, a1, 1
+    bne a0, a2, smear
+    .word 0
+"""
+
+def run(recognize_idioms):
+    cpu = CPU(rv_build(LOOPS_CODE, "test_idiom_loops"))
+    cpu.recognize_idioms = recognize_idioms
+    executed = cpu.run(100000)
+    assert cpu.halted
+    return cpu, executed
+
+def test_bulk_loops_match_interpreter():
+    bulk, executed_bulk = run(True)
+    plain, executed_plain = run(False)
+    assert bulk.regs == plain.regs
+    assert executed_bulk == executed_plain, "bulk loops still count every instruction"
+    assert bulk.bulk > 600 and plain.bulk == 0
+    bulk_memory = bytes(bulk.bus.dram.load_bytes(BUFFERS, 0x200))
+    assert bulk_memory == bytes(plain.bus.dram.load_bytes(BUFFERS, 0x200))
+    destination = bulk_memory[0x100:]
+    assert destination[9:150] == bytes(range(10, 151))
+    assert destination[:9] == b"\x01" * 9, "the overlapping copy smears the first byte"
+    assert destination[160:200] == b"\x5a" * 40
+    assert bulk.regs[18] == 201, "strlen plus the terminator"
+
+def test_find_byte_in_shared_memory():
+    dram = DRAM(b"", memoryview(bytearray(params.DRAM_SIZE)))
+    dram.store(params.DRAM_BASE + 5000, 7, 8)
+    assert dram.find_byte(params.DRAM_BASE + 10, 7) == 4990  # past the first chunks
+    assert dram.find_byte(params.DRAM_BASE + 5000, 7) == 0
+    assert dram.find_byte(params.DRAM_BASE + 5001, 7) == -1
+
+def test_bulk_store_into_code_falls_back():
+    code = """
+.global _start
+_start:
+    la a0, target
+    addi a1, a0, 4
+    li a2, 0x13        # low byte of a nop
+fill:
+    sb a2, 0(a0)
+    addi a0, a0, 1
+    bne a0, a1, fill
+target:
+    li s0, 1           # overwritten with 0x13131313, an addi to x6
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_bulk_store_into_code"))
+    cpu.run(100)
+    assert cpu.halted
+    assert cpu.bulk == 0
+    assert cpu.regs[8] == 0, "the patched code must run"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,188 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build_elf
+from pyRISCV import CPU
+from pyRISCV.elf import ELF
+from pyRISCV.libc import intercept_libc
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+BUFFER = 0x80010000
+
+LIBC_CODE = """
+.global _start
+_start:
+    li s0, 0x80010000
+    mv a0, s0
+    la a1, msg
+    li a2, 13
+    call memcpy
+    mv a0, s0
+    call strlen
+    mv s1, a0
+    addi a0, s0, 32
+    li a1, 0x41
+    li a2, 8
+    call memset
+    mv a0, s0
+    la a1, other
+    call strcmp
+    mv s2, a0
+    mv a0, s0
+    la a1, msg
+    li a2, 13
+    call memcmp
+    mv s3, a0
+    addi a0, s0, 2
+    mv a1, s0
+    li a2, 12
+    call memmove
+    mv s4, a0
+    .word 0
+memcpy:
+memmove:
+    mv t0, a0
+    bgeu a1, a0, copy_forward
+    add t0, t0, a2
+    add a1, a1, a2
+copy_backward:
+    beqz a2, copy_done
+    addi t0, t0, -1
+    addi a1, a1, -1
+    lbu t1, 0(a1)
+    sb t1, 0(t0)
+    addi a2, a2, -1
+    j copy_backward
+copy_forward:
+    beqz a2, copy_done
+    lbu t1, 0(a1)
+    sb t1, 0(t0)
+    addi a1, a1, 1
+    addi t0, t0, 1
+    addi a2, a2, -1
+    j copy_forward
+copy_done:
+    ret
+memset:
+    mv t0, a0
+set_loop:
+    beqz a2, set_done
+    sb a1, 0(t0)
+    addi t0, t0, 1
+    addi a2, a2, -1
+    j set_loop
+set_done:
+    ret
+strlen:
+    mv t0, a0
+len_loop:
+    lbu t1, 0(t0)
+    beqz t1, len_done
+    addi t0, t0, 1
+    j len_loop
+len_done:
+    sub a0, t0, a0
+    ret
+strcmp:
+    lbu t0, 0(a0)
+    lbu t1, 0(a1)
+    bne t0, t1, cmp_done
+    beqz t0, cmp_done
+    addi a0, a0, 1
+    addi a1, a1, 1
+    j strcmp
+memcmp:
+    li t0, 0
+    li t1, 0
+    beqz a2, cmp_done
+    lbu t0, 0(a0)
+    lbu t1, 0(a1)
+    bne t0, t1, cmp_done
+    addi a0, a0, 1
+    addi a1, a1, 1
+    addi a2, a2, -1
+    j memcmp
+cmp_done:
+    sub a0, t0, t1
+    ret
+msg:
+    .string "hello, world"
+other:
+    .string "help"
+"""
+
+def run(intercept):
+    elf = ELF(rv_build_elf(LIBC_CODE, "test_libc"))
+    cpu = CPU(b"")
+    elf.load(cpu)
+    names = intercept_libc(cpu, elf.symbols) if intercept else []
+    executed = cpu.run(100000)
+    assert cpu.halted
+    return cpu, executed, names
+
+def test_elf_symbols():
+    elf = ELF(rv_build_elf(LIBC_CODE, "test_libc"))
+    assert elf.entry == 0x80000000
+    assert elf.symbols["memcpy"] == elf.symbols["memmove"]
+    assert elf.symbols["msg"] > elf.symbols["memcmp"] > elf.symbols["strcmp"]
+
+def test_intercepted_calls_match_interpreter():
+    native, executed_native, names = run(True)
+    plain, executed_plain, _ = run(False)
+    assert sorted(names) == ["memcmp", "memcpy", "memmove", "memset", "strcmp", "strlen"]
+    saved = [8, 9, 18, 19, 20]
+    assert [native.regs[i] for i in saved] == [plain.regs[i] for i in saved]
+    assert native.bus.dram.load_bytes(BUFFER, 64) == plain.bus.dram.load_bytes(BUFFER, 64)
+    assert native.regs[9] == 12
+    assert native.regs[18] == (ord("l") - ord("p")) & 0xFFFFFFFF
+    assert native.regs[19] == 0
+    assert native.regs[20] == BUFFER + 2
+    assert bytes(native.bus.dram.load_bytes(BUFFER, 14)) == b"hehello, world"
+    assert bytes(native.bus.dram.load_bytes(BUFFER + 32, 8)) == b"A" * 8
+    assert native.bulk > 0 and plain.bulk == 0
+    assert executed_plain / 2 < executed_native < executed_plain * 2, "calls are charged their estimated cost"
+
+def test_intercept_falls_back_for_code():
+    code = """
+.global _start
+_start:
+    la a0, target
+    li a1, 0x13        # nop bytes
+    li a2, 4
+    call memset
+target:
+    li s0, 1           # overwritten with 0x13131313, an addi to x6
+    .word 0
+memset:
+    mv t0, a0
+set_loop:
+    beqz a2, set_done
+    sb a1, 0(t0)
+    addi t0, t0, 1
+    addi a2, a2, -1
+    j set_loop
+set_done:
+    ret
+"""
+    elf = ELF(rv_build_elf(code, "test_intercept_falls_back"))
+    cpu = CPU(b"")
+    elf.load(cpu)
+    assert intercept_libc(cpu, elf.symbols) == ["memset"]
+    cpu.run(1000)
+    assert cpu.halted
+    assert cpu.bulk == 0
+    assert cpu.regs[8] == 0, "the patched code must run"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,100 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+def test_registers_stay_32_bit():
+    code = """
+.global _start
+_start:
+    li t0, 0x7FFFFFFF
+    li t1, -1
+    li t2, 0x80000000
+    add a0, t0, t0
+    addi a1, t1, 1
+    sub a2, x0, t0
+    sll a3, t1, t1
+    slli a4, t1, 31
+    sra a5, t2, t1
+    srai a6, t2, 4
+    mul a7, t1, t1
+    mulh s0, t2, t2
+    mulhu s1, t1, t1
+    mulhsu s2, t1, t1
+    div s3, t2, t1
+    rem s4, t2, t1
+    div s5, t0, x0
+    divu s6, t0, x0
+    rem s7, t0, x0
+    remu s8, t2, x0
+    lui s9, 0xFFFFF
+    auipc s10, 0xFFFFF
+    lb s11, 0(sp)
+    li t3, 0x80001000
+    sw t2, 0(t3)
+    lh t4, 2(t3)
+    lw t5, 0(t3)
+    csrrw t6, mscratch, t1
+    csrrs t6, mscratch, x0
+    jal ra, next
+next:
+    slt a0, t2, t0
+    sltu a1, t2, t0
+"""
+    cpu = CPU(rv_build(code, "test_registers_stay_32_bit"))
+    cpu.fuse_pairs = False  # check the registers after every single instruction
+    for _ in range(33):
+        assert cpu.step()
+        for i, value in enumerate(cpu.regs):
+            assert 0 <= value <= 0xFFFFFFFF, f"x{i} = {value} is not an unsigned 32-bit value"
+        assert 0 <= cpu.pc <= 0xFFFFFFFF
+    assert cpu.regs[12] == 0x80000001, "sub failed"
+    assert cpu.regs[13] == 0x80000000, "sll failed"
+    assert cpu.regs[15] == 0xFFFFFFFF, "sra failed"
+    assert cpu.regs[16] == 0xF8000000, "srai failed"
+    assert cpu.regs[17] == 1, "mul failed"
+    assert cpu.regs[8] == 0x40000000, "mulh failed"
+    assert cpu.regs[9] == 0xFFFFFFFE, "mulhu failed"
+    assert cpu.regs[18] == 0xFFFFFFFF, "mulhsu failed"
+    assert cpu.regs[19] == 0x80000000, "div overflow failed"
+    assert cpu.regs[20] == 0, "rem overflow failed"
+    assert cpu.regs[21] == 0xFFFFFFFF, "div by zero failed"
+    assert cpu.regs[22] == 0xFFFFFFFF, "divu by zero failed"
+    assert cpu.regs[23] == 0x7FFFFFFF, "rem by zero failed"
+    assert cpu.regs[24] == 0x80000000, "remu by zero failed"
+    assert cpu.regs[25] == 0xFFFFF000, "lui failed"
+    assert cpu.regs[29] == 0xFFFF8000, "lh failed"
+    assert cpu.regs[30] == 0x80000000, "lw failed"
+    assert cpu.regs[31] == 0xFFFFFFFF, "csrrs failed"
+    assert cpu.regs[10] == 1, "slt failed"
+    assert cpu.regs[11] == 0, "sltu failed"
+
+def test_div_rem_rounding():
+    code = """
+.global _start
+_start:
+    li t0, -7
+    li t1, 2
+    div a0, t0, t1
+    rem a1, t0, t1
+"""
+    cpu = CPU(rv_build(code, "test_div_rem_rounding"))
+    cpu.run(4)
+    assert cpu.regs[10] == -3 & 0xFFFFFFFF, "div should round towards zero"
+    assert cpu.regs[11] == -1 & 0xFFFFFFFF, "rem should take the sign of the dividend"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
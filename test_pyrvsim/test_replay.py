@@ -0,0 +1,88 @@
+import sys
+sys.path.append('../')
+import io
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, params
+from pyRISCV.syscall import SyscallProxy
+from pyRISCV.replay import Recorder, Replayer, ReplayError
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+INPUT_CODE = f"""
+.global _start
+_start:
+    li s0, {params.SERIAL_BASE}
+    li s2, 0x80010000
+    li s3, 3
+poll:
+    lbu t0, 5(s0)      # line status
+    andi t0, t0, 1
+    beqz t0, poll
+    lbu t1, 0(s0)
+    sb t1, 0(s2)
+    addi s2, s2, 1
+    addi s3, s3, -1
+    bnez s3, poll
+    li a0, 0x80010100
+    li a1, 0
+    li a7, 169         # gettimeofday
+    ecall
+    li t2, 0x80010100
+    lw s4, 0(t2)
+    lw s5, 8(t2)
+    li a7, 214         # brk
+    li a0, 0
+    ecall
+    mv s6, a0
+    .word 0
+"""
+
+def machine(code, name):
+    cpu = CPU(rv_build(code, name))
+    cpu.syscalls = SyscallProxy(cpu)
+    return cpu
+
+def test_record_and_replay():
+    recorded = machine(INPUT_CODE, "test_replay_input")
+    recorded.bus.serial.feed(b"abc")
+    log = io.BytesIO()
+    Recorder(recorded, log)
+    executed = recorded.run(1000)
+    assert recorded.halted
+    assert bytes(recorded.bus.dram.load_bytes(0x80010000, 3)) == b"abc"
+    assert recorded.regs[20] > 1600000000, "seconds since the epoch"
+
+    replayed = machine(INPUT_CODE, "test_replay_input")  # no UART input, a later clock
+    replayer = Replayer(replayed, io.BytesIO(log.getvalue()))
+    assert replayed.run(1000) == executed
+    assert replayer.done()
+    assert replayed.regs == recorded.regs
+    assert bytes(replayed.bus.dram.load_bytes(0x80010000, 0x110)) == \
+        bytes(recorded.bus.dram.load_bytes(0x80010000, 0x110))
+
+def test_replay_divergence():
+    recorded = machine(INPUT_CODE, "test_replay_input")
+    recorded.bus.serial.feed(b"abc")
+    log = io.BytesIO()
+    Recorder(recorded, log)
+    recorded.run(1000)
+    changed = machine(INPUT_CODE.replace("_start:\n", "_start:\n    nop\n"), "test_replay_changed")
+    Replayer(changed, io.BytesIO(log.getvalue()))
+    with pytest.raises(ReplayError):
+        changed.run(1000)
+    with pytest.raises(ReplayError):
+        Replayer(changed, io.BytesIO(b"not a log"))
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -0,0 +1,136 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, params
+from pyRISCV.rvc import expand
+from pyRISCV.rv_exception import ExceptionType
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+MIXED_CODE = """
+.global _start
+_start:
+    addi sp, sp, -32
+    li s0, 5
+    li s1, -7
+    lui a5, 3
+    mv a0, s0
+    add a0, a0, s1
+    sub a1, s0, s1
+    xor a2, s0, s1
+    or a3, s0, s1
+    and a4, s0, s1
+    andi a4, a4, -3
+    slli s0, s0, 3
+    srli a5, a5, 2
+    srai s1, s1, 1
+    sw s0, 4(sp)
+    lw a6, 4(sp)
+    addi a7, sp, 8
+    sw s1, 0(a7)
+    lw t1, 0(a7)
+    li t0, 10
+    li t2, 0
+loop:
+    add t2, t2, t0
+    addi t0, t0, -1
+    bnez t0, loop
+    beqz t0, skip
+    li t2, 0
+skip:
+    jal ra, func
+    la t3, func
+    jalr t3
+    j done
+func:
+    addi t4, t4, 1
+    ret
+done:
+    addi sp, sp, 32
+    .word 0
+"""
+
+def test_rvc_matches_uncompressed():
+    compressed = rv_build(MIXED_CODE, "test_rvc_compressed", march="rv32imac")
+    plain = rv_build(MIXED_CODE, "test_rvc_plain", march="rv32ima")
+    assert len(compressed) < len(plain), "the assembler should have emitted compressed instructions"
+    cpu_c = CPU(compressed)
+    cpu_p = CPU(plain)
+    executed_c = cpu_c.run(1000)
+    executed_p = cpu_p.run(1000)
+    assert cpu_c.halted and cpu_p.halted
+    assert executed_c == executed_p
+    for i in range(32):
+        if i in (1, 28):  # ra and t3 hold code addresses, which differ
+            continue
+        assert cpu_c.regs[i] == cpu_p.regs[i], f"x{i} mismatch"
+    assert cpu_c.regs[7] == 55 and cpu_c.regs[29] == 2
+
+def test_expand():
+    assert expand(0x0001) == 0x00000013  # c.nop -> addi x0, x0, 0
+    assert expand(0x4515) == 0x00500513  # c.li a0, 5
+    assert expand(0x8082) == 0x00008067  # c.ret -> jalr x0, 0(ra)
+    assert expand(0x9002) == 0x00100073  # c.ebreak
+    assert expand(0x0000) is None  # defined illegal
+    assert expand(0x2000) is None  # c.fld needs D
+
+@pytest.mark.parametrize("fence", ["fence.i", "nop"])
+def test_self_modifying_code(fence):
+    code = """
+.global _start
+_start:
+    li s0, 0
+    la t0, patch
+    la t1, replacement
+    lw t2, 0(t1)
+again:
+patch:
+    addi s0, s0, 1     # becomes addi s0, s0, 100
+    bnez s1, done
+    li s1, 1
+    sw t2, 0(t0)
+    {}
+    j again
+done:
+    .word 0
+replacement:
+    addi s0, s0, 100
+""".format(fence)
+    cpu = CPU(rv_build(code, "test_self_modifying_code"))
+    cpu.run(100)
+    assert cpu.halted
+    assert cpu.regs[8] == 101, "the patched instruction must be re-decoded"
+
+def test_misaligned_fetch():
+    code = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    .word 0
+handler:
+    csrr a0, mcause
+    csrr a1, mtval
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_misaligned_fetch"))
+    cpu.run(100)
+    cpu.halted = False
+    cpu.pc = params.DRAM_BASE + 1
+    cpu.run(100)
+    assert cpu.regs[10] == ExceptionType.INSTRUCTION_ADDRESS_MISALIGNED.value
+    assert cpu.regs[11] == params.DRAM_BASE + 1
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
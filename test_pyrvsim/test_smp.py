@@ -0,0 +1,161 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build, rv_helper
+from pyRISCV import SMP, params, smp as smp_module
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+def test_atomic_single_hart():
+    code = """
+.global _start
+_start:
+    li a0, 0x80001000
+    li t0, 5
+    sw t0, 0(a0)
+    li t1, 3
+    amoadd.w t2, t1, (a0)  # t2 = 5, mem = 8
+    li t1, -1
+    amomax.w t3, t1, (a0)  # t3 = 8, mem = 8
+    amomaxu.w t4, t1, (a0) # t4 = 8, mem = -1
+    lr.w t5, (a0)          # t5 = -1
+    sc.w t6, t0, (a0)      # t6 = 0, mem = 5
+    sc.w s0, t1, (a0)      # s0 = 1, reservation already used
+    lw s1, 0(a0)           # s1 = 5
+"""
+    cpu = rv_helper(code, "test_atomic_single_hart", 12)
+    assert cpu.regs[7] == 5, "amoadd.w failed"
+    assert cpu.regs[28] == 8, "amomax.w failed"
+    assert cpu.regs[29] == 8, "amomaxu.w failed"
+    assert cpu.regs[30] == 0xFFFFFFFF, "lr.w failed"
+    assert cpu.regs[31] == 0, "sc.w failed"
+    assert cpu.regs[8] == 1, "sc.w without reservation failed"
+    assert cpu.regs[9] == 5, "sc.w failed"
+
+def test_smp_shared_counters():
+    code = """
+.global _start
+_start:
+    li a0, 0x80001000  # counter updated with amoadd.w
+    li a1, 0x80001004  # counter updated with lr.w/sc.w
+    li t1, 500
+loop:
+    li t2, 1
+    amoadd.w zero, t2, (a0)
+retry:
+    lr.w t3, (a1)
+    addi t3, t3, 1
+    sc.w t4, t3, (a1)
+    bnez t4, retry
+    addi t1, t1, -1
+    bnez t1, loop
+    csrr t0, mhartid
+    bnez t0, done
+    li t4, 1000
+wait:
+    lw t3, 0(a0)
+    bne t3, t4, wait
+    lw t3, 0(a1)
+    bne t3, t4, wait
+done:
+    .word 0
+"""
+    with SMP(rv_build(code, "test_smp_shared_counters"), 2) as smp:
+        states = smp.run(max_instructions=2000000)
+        assert [state["hartid"] for state in states] == [0, 1]
+        assert states[0]["halted"], "hart 0 did not finish"
+        assert states[1]["regs"][10] == 0x80001000
+        assert smp.load(0x80001000, 32) == 1000, "amoadd.w lost updates"
+        assert smp.load(0x80001004, 32) == 1000, "lr.w/sc.w lost updates"
+
+def test_smp_ipi():
+    code = f"""
+.global _start
+_start:
+    csrr t0, mhartid
+    bnez t0, sender
+    la t1, handler
+    csrw mtvec, t1
+    li t1, {params.MASK_MSIP}
+    csrw mie, t1
+    csrsi mstatus, {params.MASK_MIE}
+spin:
+    j spin
+handler:
+    csrr a1, mcause
+    .word 0
+sender:
+    li t1, {params.CLINT_BASE + params.CLINT_MSIP}
+    li t2, 1
+    sw t2, 0(t1)
+idle:
+    j idle
+"""
+    with SMP(rv_build(code, "test_smp_ipi"), 2) as smp:
+        states = smp.run(max_instructions=1000000)
+        assert states[0]["halted"], "hart 0 did not take the IPI"
+        assert states[0]["regs"][11] == params.INTERRUPT_BIT | params.IRQ_M_SOFT
+
+def test_smp_sc_after_aba_store():
+    code = """
+.global _start
+_start:
+    li a0, 0x80001000  # reserved word, 0
+    csrr t0, mhartid
+    bnez t0, other
+    lr.w t0, (a0)
+    li t1, 1
+    sw t1, 4(a0)       # let hart 1 store A->B->A
+wait:
+    lw t2, 8(a0)
+    beqz t2, wait
+    sc.w t3, t1, (a0)  # must fail, the word was stored to since LR
+    sw t3, 12(a0)
+    .word 0
+other:
+    lw t2, 4(a0)
+    beqz t2, other
+    li t1, 5
+    sw t1, 0(a0)
+    sw zero, 0(a0)
+    li t1, 1
+    sw t1, 8(a0)
+spin:
+    j spin
+"""
+    with SMP(rv_build(code, "test_smp_sc_after_aba_store"), 2) as smp:
+        states = smp.run(max_instructions=2000000)
+        assert states[0]["halted"], "hart 0 did not finish"
+        assert smp.load(0x8000100C, 32) == 1, "sc.w succeeded after another hart stored A->B->A"
+        assert smp.load(0x80001000, 32) == 0
+
+def test_smp_dead_hart(monkeypatch):
+    code = """
+.global _start
+_start:
+    j _start  # hart 0 never halts on its own
+"""
+    real_cpu = smp_module.CPU
+
+    def cpu(*args, hartid=0, **kwargs):
+        if hartid == 1:
+            raise MemoryError("hart 1 crashed")
+        return real_cpu(*args, hartid=hartid, **kwargs)
+
+    monkeypatch.setattr(smp_module, "CPU", cpu)  # inherited by the forked harts
+    with SMP(rv_build(code, "test_smp_dead_hart"), 2) as smp:
+        with pytest.raises(RuntimeError, match="hart 1 died"):
+            smp.run()
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
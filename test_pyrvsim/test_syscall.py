@@ -0,0 +1,142 @@
+import sys
+sys.path.append('../')
+import os
+import struct
+import logging
+import subprocess
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, params
+from pyRISCV.syscall import SyscallProxy
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+FILE_CODE = """
+.global _start
+_start:
+    li a0, -100        # AT_FDCWD
+    la a1, path
+    li a2, 0           # O_RDONLY
+    li a7, 56          # openat
+    ecall
+    mv s0, a0
+    la a1, buffer
+    li a2, 64
+    li a7, 63          # read
+    ecall
+    mv s1, a0
+    li a0, 1
+    la a1, buffer
+    mv a2, s1
+    li a7, 64          # write to stdout
+    ecall
+    mv a0, s0
+    la a1, statbuf
+    mv s3, a1
+    li a7, 80          # fstat
+    ecall
+    mv a0, s0
+    li a7, 57          # close
+    ecall
+    li a0, 0
+    li a7, 214         # brk
+    ecall
+    mv s2, a0
+    la a0, timeval
+    mv s4, a0
+    li a1, 0
+    li a7, 169         # gettimeofday
+    ecall
+    li a0, 7
+    li a7, 93          # exit
+    ecall
+    .word 0
+statbuf:
+    .space 128
+timeval:
+    .space 16
+buffer:
+    .space 64
+path:
+    .string "tmp/test_syscall.txt"
+"""
+
+def test_syscall_file_io(capsys):
+    with open("tmp/test_syscall.txt", "w") as f:
+        f.write("hello from the host\n")
+    cpu = CPU(rv_build(FILE_CODE, "test_syscall_file_io"))
+    cpu.syscalls = SyscallProxy(cpu)
+    cpu.run(1000)
+    assert cpu.halted
+    assert cpu.exit_code == 7
+    assert capsys.readouterr().out == "hello from the host\n"
+    assert cpu.regs[8] == 3, "first guest fd after the standard streams"
+    assert cpu.regs[9] == 20
+    assert cpu.regs[18] % params.BRK_ALIGN == 0 and cpu.regs[18] > params.DRAM_BASE
+    dram = cpu.bus.dram
+    st_size, = struct.unpack("<q", dram.load_bytes(cpu.regs[19] + 48, 8))
+    assert st_size == 20
+    tv_sec, = struct.unpack("<q", dram.load_bytes(cpu.regs[20], 8))
+    assert tv_sec > 0
+
+def test_syscall_errors():
+    code = """
+.global _start
+_start:
+    li a0, 42
+    li a1, 0
+    li a2, 0
+    li a7, 63          # read from a bad fd
+    ecall
+    mv s0, a0
+    li a7, 12345       # unsupported syscall
+    ecall
+    mv s1, a0
+    li a0, 1
+    li a1, 0x100       # buffer outside DRAM
+    li a2, 4
+    li a7, 64
+    ecall
+    mv s2, a0
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_syscall_errors"))
+    cpu.syscalls = SyscallProxy(cpu)
+    cpu.run(100)
+    assert cpu.exit_code is None
+    assert cpu.regs[8] == -9 & 0xFFFFFFFF  # EBADF
+    assert cpu.regs[9] == -38 & 0xFFFFFFFF  # ENOSYS
+    assert cpu.regs[18] == -14 & 0xFFFFFFFF  # EFAULT
+
+def test_headless_exit_status():
+    code = """
+.global _start
+_start:
+    li a0, 1
+    la a1, message
+    li a2, 3
+    li a7, 64
+    ecall
+    li a0, 5
+    li a7, 93
+    ecall
+message:
+    .string "ok\\n"
+"""
+    rv_build(code, "test_headless_exit_status")
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main.py")
+    result = subprocess.run([sys.executable, main, "--headless", "tmp/test_headless_exit_status.bin"],
+                            capture_output=True)
+    assert result.returncode == 5
+    assert result.stdout == b"ok\n"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
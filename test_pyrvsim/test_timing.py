@@ -0,0 +1,83 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build_elf
+from pyRISCV import CPU
+from pyRISCV.elf import ELF
+from pyRISCV.branch import BranchProfiler
+from pyRISCV.cache import CacheHierarchy
+from pyRISCV.timing import TimingModel, static_cost
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+TIMING_CODE = """
+.global _start
+_start:
+    li s0, 0x80010000
+    li s1, 10
+loop:
+    call work
+    addi s1, s1, -1
+    bnez s1, loop
+    .word 0
+work:
+    lw t0, 0(s0)
+    addi t0, t0, 1     # load-use bubble
+    mul t1, t0, t0
+    sw t1, 0(s0)
+    ret
+"""
+
+def run(caches=None, profiler=None):
+    elf = ELF(rv_build_elf(TIMING_CODE, "test_timing"))
+    cpu = CPU(b"")
+    elf.load(cpu)
+    symbols = {name: elf.symbols[name] for name in ("_start", "work")}
+    timing = TimingModel(cpu, symbols)
+    cpu.attach_timing(timing)
+    cpu.attach_caches(caches)
+    cpu.attach_branch_profiler(profiler)
+    executed = cpu.run(10000)
+    assert cpu.halted
+    return timing, executed
+
+def test_static_costs():
+    lw, addi, mul, div = 0x00042283, 0x00128293, 0x02528333, 0x0252C333
+    assert static_cost(lw, addi) == 2 and static_cost(lw, mul) == 2
+    assert static_cost(lw, None) == 1 and static_cost(addi, addi) == 1
+    assert static_cost(mul, None) == 3 and static_cost(div, None) == 34
+
+def test_cycles_per_function():
+    timing, executed = run()
+    functions = timing.functions()
+    # work: lw (+1 bubble), addi, mul (3), sw, ret (+2 taken) = 10 cycles per call
+    assert functions["work"] == (50, 100)
+    # _start: 4 instructions to the first call, then per iteration auipc/jalr
+    # and addi/bnez, each block ending in a taken transfer but the last
+    assert functions["_start"] == (42, 80)
+    assert sum(instructions for instructions, _ in functions.values()) == executed
+    assert timing.cycles() == 180
+    assert timing.report()[1] == "  work: 100 cycles, 50 instructions, CPI 2.00"
+
+def test_dynamic_penalties():
+    caches = CacheHierarchy()
+    timing, _ = run(caches=caches)
+    assert timing.cycles() == 180 + 10 * (caches.l1i.misses + caches.l1d.misses)
+    profiler = BranchProfiler()
+    timing, _ = run(profiler=profiler)
+    mispredicts = sum(profiler.mispredicted["gshare"].values()) + sum(profiler.mispredicted["btb/ras"].values())
+    assert mispredicts > 0
+    assert timing.cycles() == 180 - 58 + 2 * mispredicts, "mispredicts replace the redirect penalties"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
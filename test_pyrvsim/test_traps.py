@@ -0,0 +1,101 @@
+import sys
+sys.path.append('../')
+import os
+import logging
+import pytest
+from utils import rv_build
+from pyRISCV import CPU, params
+from pyRISCV.rv_exception import ExceptionType
+from pyRISCV.rv_enum import PrivilegeLevel
+
+logging.disable(logging.CRITICAL)
+
+def setup_module():
+    if not os.path.exists("tmp"):
+        os.mkdir("tmp")
+
+def teardown_module():
+    if os.path.exists("tmp"):
+        os.system("rm -rf tmp/*")
+
+def test_ecall_ebreak_illegal():
+    code = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    li s0, 0
+    ecall
+    ebreak
+    .word 0xffffffff   # illegal instruction
+    .word 0
+handler:
+    csrr t1, mcause
+    slli s0, s0, 4
+    or s0, s0, t1
+    csrr t2, mepc
+    addi t2, t2, 4
+    csrw mepc, t2
+    mret
+"""
+    cpu = CPU(rv_build(code, "test_ecall_ebreak_illegal"))
+    cpu.run(100)
+    assert cpu.halted
+    assert cpu.regs[8] == (ExceptionType.ECALL_FROM_M.value << 8) \
+        | (ExceptionType.BREAKPOINT.value << 4) | ExceptionType.ILLEGAL_INSTRUCTION.value
+    assert cpu.csr.csrs[params.MTVAL] == 0xFFFFFFFF, "illegal instruction is reported in mtval"
+
+def test_bus_faults_raise(monkeypatch):
+    code = """
+.global _start
+_start:
+    la t0, handler
+    csrw mtvec, t0
+    li a0, 0x100
+    lw a1, 0(a0)       # nothing is mapped there
+    ecall              # taken without raising
+    .word 0
+handler:
+    csrr t1, mepc
+    addi t1, t1, 4
+    csrw mepc, t1
+    mret
+"""
+    cpu = CPU(rv_build(code, "test_bus_faults_raise"))
+    raised = []
+    handle_exception = cpu.handle_exception
+    monkeypatch.setattr(cpu, "handle_exception", lambda e: (raised.append((e.get_type(), e.get_value())), handle_exception(e)))
+    cpu.run(100)
+    assert cpu.halted
+    # bus faults are the one trap still delivered as a Python exception
+    assert raised == [(ExceptionType.LOAD_ACCESS_FAULT, 0x100)]
+    assert cpu.csr.csrs[params.MCAUSE] == ExceptionType.ECALL_FROM_M.value, "the ecall trapped too"
+
+def test_delegated_ecall():
+    code = """
+.global _start
+_start:
+    la t0, s_handler
+    csrw stvec, t0
+    li t0, 1 << 8      # delegate ecall from U-mode
+    csrw medeleg, t0
+    la t0, user
+    csrw mepc, t0
+    mret
+user:
+    ecall
+    .word 0
+s_handler:
+    csrr a0, scause
+    csrr a1, sepc
+    .word 0
+"""
+    cpu = CPU(rv_build(code, "test_delegated_ecall"))
+    cpu.run(100)
+    assert cpu.privilegeLevel == PrivilegeLevel.SUPERVISOR
+    assert cpu.regs[10] == ExceptionType.ECALL_FROM_U.value
+    assert cpu.regs[11] == cpu.regs[5], "sepc is the ecall (t0 still holds its address)"
+    assert cpu.csr.csrs[params.SSTATUS] & params.MASK_SPP == 0, "spp records user mode"
+
+if __name__ == '__main__':
+    pytest.main(['-v', __file__])
@@ -11,9 +11,9 @@ def generate_rv_assembly(c_src):
     if process.returncode!= 0:
         raise Exception(f"Failed to generate RV assembly. Command: {commands} -> \n{stderr.decode()}")
 
-def generate_rv_obj(assembly):
+def generate_rv_obj(assembly, march="rv32ima"):
     base_name = os.path.basename(assembly).split('.')[0]
-    commands = f"cd tmp && riscv64-unknown-elf-gcc -Wl,-Ttext=0x80000000 -march=rv32im -mabi=ilp32 -nostdlib -o {base_name} {assembly}"
+    commands = f"cd tmp && riscv64-unknown-elf-gcc -Wl,-Ttext=0x80000000 -march={march} -mabi=ilp32 -nostdlib -o {base_name} {assembly}"
     process = subprocess.Popen(commands, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     stdout, stderr = process.communicate()
     if process.returncode!= 0:
@@ -26,13 +26,22 @@ def generate_rv_biniary(obj):
     if process.returncode!= 0:
         raise Exception(f"Failed to generate RV binary. Command: {commands} -> \n{stderr.decode()}")
 
-def rv_helper(code, test_name, n_clocks=1000000):
+def rv_build(code, test_name, march="rv32ima"):
     file_name = f"{test_name}.s"
     with open("./tmp/"+file_name, 'w') as f:
         f.write(code)
-    generate_rv_obj(file_name)
+    generate_rv_obj(file_name, march)
     generate_rv_biniary(test_name)
-    cpu = CPU(open(f"./tmp/{test_name}.bin", 'rb').read())
+    with open(f"./tmp/{test_name}.bin", 'rb') as f:
+        return f.read()
+
+def rv_build_elf(code, test_name, march="rv32ima"):
+    rv_build(code, test_name, march)
+    with open(f"./tmp/{test_name}", 'rb') as f:
+        return f.read()
+
+def rv_helper(code, test_name, n_clocks=1000000):
+    cpu = CPU(rv_build(code, test_name))
     for i in range(n_clocks):
         try:
             inst = cpu.fetch()